@@ -0,0 +1,115 @@
+"""
+Benchmark of the asyncio agent against the threaded one, uploading
+small files to a local S3 stand-in answering after a fixed latency.
+
+Requires aiobotocore (optional dependency of AsyncS3Writer).
+
+    python -m benchmarks.bench_async_agent --num-files 5000 --latency 0.05
+"""
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from forwarding_service.async_agent import AsyncTransferAgent
+from forwarding_service.file import FileSystemReader
+from forwarding_service.models import Transaction
+from forwarding_service.s3 import AsyncS3Writer, S3Writer
+from forwarding_service.transfer_agent import TransferAgent
+
+from .s3_stub import s3_stub
+
+
+def make_files(root: Path, num_files: int, size: int) -> list[Path]:
+    paths = [root / f"file_{i}" for i in range(num_files)]
+    for path in paths:
+        path.write_bytes(os.urandom(size))
+    return paths
+
+
+def run(agent, paths):
+    transactions = [
+        Transaction(
+            item_id=i,
+            input=f"file://{path}",
+            output=f"s3://bucket/data/{path.name}",
+        )
+        for i, path in enumerate(paths)
+    ]
+    peak_threads = 0
+    done = threading.Event()
+
+    def count_threads():
+        nonlocal peak_threads
+        while not done.wait(0.05):
+            peak_threads = max(peak_threads, threading.active_count())
+
+    counter = threading.Thread(target=count_threads)
+    counter.start()
+    cpu = time.process_time()
+    start = time.perf_counter()
+    agent.run(transactions)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    done.set()
+    counter.join()
+    agent.close()
+
+    assert all(t.success for t in transactions), [
+        t.exception for t in transactions if not t.success
+    ][:3]
+    return len(paths) / elapsed, cpu / elapsed, peak_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-files", type=int, default=5000)
+    parser.add_argument("--file-size", type=int, default=1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--n-threads", type=int, nargs="+", default=[30, 256])
+    parser.add_argument(
+        "--max-in-flight", type=int, nargs="+", default=[256, 1000]
+    )
+    args = parser.parse_args()
+
+    # one connection per request in flight
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    os.environ.update(
+        AWS_ACCESS_KEY_ID="key",
+        AWS_SECRET_ACCESS_KEY="secret",
+        AWS_DEFAULT_REGION="us-east-1",
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, s3_stub(
+        latency=args.latency
+    ) as session:
+        paths = make_files(Path(tmp), args.num_files, args.file_size)
+        for n in args.n_threads:
+            agent = TransferAgent(
+                FileSystemReader(), S3Writer(session), n_threads=n
+            )
+            results[f"threads ({n})"] = run(agent, paths)
+        for n in args.max_in_flight:
+            agent = AsyncTransferAgent(
+                FileSystemReader(), AsyncS3Writer(), max_in_flight=n
+            )
+            results[f"asyncio ({n} in flight)"] = run(agent, paths)
+
+    print(
+        f"files: {args.num_files} x {args.file_size} B, "
+        f"latency: {args.latency * 1e3:.0f} ms"
+    )
+    for name, (throughput, cpu, threads) in results.items():
+        print(
+            f"{name}: {throughput:.0f} files/s, "
+            f"{cpu:.2f} CPU cores, {threads} threads"
+        )
+
+
+if __name__ == "__main__":
+    main()
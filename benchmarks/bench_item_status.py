@@ -0,0 +1,104 @@
+"""
+Benchmark of item status updates on a SQLite database file.
+
+Compares the set-based UpdateItemStatusCommand with the former per-item
+path (SELECT + commit for every item), which is run on a sample only
+and extrapolated, as it takes hours on a million items.
+
+    python -m benchmarks.bench_item_status --num-items 1000000
+"""
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, create_engine
+
+from forwarding_service.commands import UpdateItemStatusCommand
+from forwarding_service.enum_types import ItemStatus, JobStatus
+from forwarding_service.models import Item, Job, Transaction
+from forwarding_service.utils import batched
+
+
+def make_database(path, num_items):
+    engine = create_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    session = Session(engine)
+
+    job = Job(
+        source="file:///data/",
+        destination="s3://bucket/data/",
+        regexp=".*",
+        status=JobStatus.PARSED,
+    )
+    session.add(job)
+    session.commit()
+
+    now = datetime.now()
+    for chunk in batched(range(num_items), 50000):
+        session.execute(
+            insert(Item),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "in_uri": f"file:///data/file_{i}",
+                    "out_uri": f"s3://bucket/data/file_{i}",
+                    "status": ItemStatus.PENDING,
+                    "job_id": job.id,
+                    "created_at": now,
+                }
+                for i in chunk
+            ],
+        )
+    session.commit()
+
+    return session
+
+
+def legacy_update(session, transactions):
+    for t in transactions:
+        item = session.query(Item).get(t.item_id)
+        item.status = ItemStatus.TRANSFERRED
+        item.transferred_at = datetime.now()
+        session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-items", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=100000)
+    parser.add_argument("--legacy-sample", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        session = make_database(Path(tmp) / "bench.db", args.num_items)
+        ids = [id_ for (id_,) in session.query(Item.id)]
+        transactions = [Transaction(item_id=id_, success=True) for id_ in ids]
+
+        sample = transactions[: args.legacy_sample]
+        start = time.perf_counter()
+        legacy_update(session, sample)
+        legacy = (time.perf_counter() - start) / len(sample)
+
+        command = UpdateItemStatusCommand(session)
+        start = time.perf_counter()
+        for batch in batched(transactions[len(sample):], args.batch_size):
+            command.execute(batch)
+        bulk = (time.perf_counter() - start) / (len(transactions) - len(sample))
+
+    print(f"items: {args.num_items}, batch size: {args.batch_size}")
+    print(
+        f"per-item get + commit: {legacy * 1e6:.1f} us/item "
+        f"(~{legacy * args.num_items:.0f} s for all items)"
+    )
+    print(
+        f"bulk update: {bulk * 1e6:.1f} us/item "
+        f"({bulk * args.num_items:.1f} s for all items)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of job listings (job ls) on a SQLite database file.
+
+Compares progress read from the counters of job records with the former
+path, which loaded every item of each listed job to count them.
+
+    python -m benchmarks.bench_job_ls --num-jobs 50 --num-items 1000000
+"""
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from forwarding_service import make_session
+from forwarding_service.commands import RefreshJobProgressCommand
+from forwarding_service.enum_types import ItemStatus, JobStatus
+from forwarding_service.models import Item, Job
+from forwarding_service.query import JobQueryArgs, Query
+from forwarding_service.utils import batched
+
+
+def make_database(path, num_jobs, num_items):
+    session = make_session(f"sqlite:///{path}")
+
+    now = datetime.now()
+    for j in range(num_jobs):
+        job = Job(
+            source=f"file:///data/{j}/",
+            destination=f"s3://bucket/data/{j}/",
+            regexp=".*",
+            status=JobStatus.PARSED,
+        )
+        session.add(job)
+        session.commit()
+        for chunk in batched(range(num_items), 50000):
+            session.execute(
+                insert(Item),
+                [
+                    {
+                        "id": uuid.uuid4(),
+                        "in_uri": f"file:///data/{j}/file_{i}",
+                        "out_uri": f"s3://bucket/data/{j}/file_{i}",
+                        "size": 1024,
+                        "status": ItemStatus(i % 2),
+                        "job_id": job.id,
+                        "created_at": now,
+                    }
+                    for i in chunk
+                ],
+            )
+        session.commit()
+    RefreshJobProgressCommand(session).execute()
+
+    return session.get_bind()
+
+
+def legacy_ls(session, num_jobs):
+    result = []
+    for job in Query(session, Job).get(JobQueryArgs(limit=num_jobs)):
+        n_items = len(job.items)
+        done = sum(i.status == ItemStatus.TRANSFERRED for i in job.items)
+        result.append((n_items, done))
+    return result
+
+
+def ls(session, num_jobs):
+    jobs = Query(session, Job).get(JobQueryArgs(limit=num_jobs))
+    return [job.to_detailed_dict() for job in jobs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-jobs", type=int, default=50)
+    parser.add_argument("--num-items", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_database(
+            Path(tmp) / "bench.db", args.num_jobs, args.num_items
+        )
+
+        timings = {}
+        for name, fn in [("loading items", legacy_ls), ("counters", ls)]:
+            with Session(engine) as session:
+                start = time.perf_counter()
+                fn(session, args.num_jobs)
+                timings[name] = time.perf_counter() - start
+
+    print(f"jobs: {args.num_jobs}, items per job: {args.num_items}")
+    for name, elapsed in timings.items():
+        print(f"job ls, {name}: {elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark of the multi-process agent against the threaded one, uploading
+files to a local S3 stand-in answering after a fixed latency.
+
+    python -m benchmarks.bench_processes --num-files 5000 --processes 1 2 4
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import boto3
+from forwarding_service.file import FileSystemReader
+from forwarding_service.models import Transaction
+from forwarding_service.process_agent import ProcessTransferAgent
+from forwarding_service.s3 import S3Writer
+from forwarding_service.transfer_agent import TransferAgent
+
+from .bench_async_agent import make_files
+from .s3_stub import s3_stub
+
+
+def make_writer() -> S3Writer:
+    # credentials and endpoint of the stand-in, from the environment
+    return S3Writer(boto3.Session())
+
+
+def make_agent(n_threads: int) -> TransferAgent:
+    return TransferAgent(FileSystemReader(), make_writer(), n_threads=n_threads)
+
+
+def cpu_time() -> float:
+    """CPU seconds of this process and of its terminated children"""
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def run(agent, paths):
+    transactions = [
+        Transaction(
+            item_id=i,
+            input=f"file://{path}",
+            output=f"s3://bucket/data/{path.name}",
+        )
+        for i, path in enumerate(paths)
+    ]
+    cpu = cpu_time()
+    start = time.perf_counter()
+    agent.run(transactions)
+    elapsed = time.perf_counter() - start
+    cpu = cpu_time() - cpu
+    agent.close()
+
+    assert all(t.success for t in transactions), [
+        t.exception for t in transactions if not t.success
+    ][:3]
+    return len(paths) / elapsed, cpu / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-files", type=int, default=5000)
+    parser.add_argument("--file-size", type=int, default=1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--n-threads", type=int, default=30)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    os.environ.update(
+        AWS_ACCESS_KEY_ID="key",
+        AWS_SECRET_ACCESS_KEY="secret",
+        AWS_DEFAULT_REGION="us-east-1",
+    )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, s3_stub(latency=args.latency):
+        paths = make_files(Path(tmp), args.num_files, args.file_size)
+        results[f"threads ({args.n_threads})"] = run(
+            make_agent(args.n_threads), paths
+        )
+        for n in args.processes:
+            agent = ProcessTransferAgent(
+                FileSystemReader(),
+                make_writer(),
+                make_agent=partial(make_agent, args.n_threads),
+                n_processes=n,
+                max_in_flight_per_process=2 * args.n_threads,
+            )
+            results[f"{n} processes x {args.n_threads} threads"] = run(
+                agent, paths
+            )
+
+    print(
+        f"files: {args.num_files} x {args.file_size} B, "
+        f"latency: {args.latency * 1e3:.0f} ms, CPU cores: {os.cpu_count()}"
+    )
+    for name, (throughput, cpu) in results.items():
+        print(f"{name}: {throughput:.0f} files/s, {cpu:.2f} CPU cores")
+
+
+if __name__ == "__main__":
+    main()
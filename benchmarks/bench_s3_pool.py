@@ -0,0 +1,100 @@
+"""
+Benchmark of S3 uploads through the TransferAgent against a local S3
+stand-in answering after a fixed latency.
+
+Compares the default botocore connection pool (10 connections) with a
+pool sized for the number of worker threads, as S3Writer now does.
+
+    python -m benchmarks.bench_s3_pool --num-objects 5000 --n-threads 30
+"""
+import argparse
+import io
+import time
+
+from forwarding_service.base import BaseReader
+from forwarding_service.models import Transaction
+from forwarding_service.s3 import S3Writer
+from forwarding_service.transfer_agent import TransferAgent
+
+from .s3_stub import s3_stub
+
+
+class BytesReader(BaseReader):
+    """Reads the same in-memory object for any uri"""
+
+    def __init__(self, size):
+        self.data = b"x" * size
+
+    def read(self, uri):
+        return io.BytesIO(self.data)
+
+    def exists(self, uri):
+        return True
+
+    def list(self, uri, *args, **kwargs):
+        return []
+
+
+class FixedPoolWriter(S3Writer):
+    """S3Writer whose pool is not resized to the number of threads"""
+
+    def set_concurrency(self, n):
+        if not self.max_concurrency:
+            super().set_concurrency(n)
+
+
+def run(writer, args):
+    agent = TransferAgent(
+        reader=BytesReader(args.object_size),
+        writer=writer,
+        n_threads=args.n_threads,
+    )
+    transactions = (
+        Transaction(
+            item_id=i,
+            input=f"file:///data/file_{i}",
+            output=f"s3://bucket/data/file_{i}",
+        )
+        for i in range(args.num_objects)
+    )
+
+    start = time.perf_counter()
+    agent.run(transactions)
+    elapsed = time.perf_counter() - start
+    agent.close()
+
+    return args.num_objects / elapsed, writer.metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-objects", type=int, default=5000)
+    parser.add_argument("--object-size", type=int, default=1024)
+    parser.add_argument("--n-threads", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with s3_stub(latency=args.latency) as session:
+        results = {
+            "default pool (10)": run(FixedPoolWriter(session), args),
+            f"sized pool ({args.n_threads})": run(S3Writer(session), args),
+        }
+
+    print(
+        f"objects: {args.num_objects} x {args.object_size} B, "
+        f"threads: {args.n_threads}, latency: {args.latency * 1e3:.0f} ms"
+    )
+    for name, (throughput, metrics) in results.items():
+        print(
+            f"{name}: {throughput:.0f} objects/s, "
+            f"{metrics.connections} connections opened "
+            f"({metrics.connect_time:.2f} s), "
+            f"{metrics.discarded} discarded, "
+            f"reuse ratio {metrics.reuse_ratio:.3f}, "
+            "pool wait "
+            f"{metrics.wait_time / metrics.requests * 1e3:.2f} ms/request"
+        )
+
+
+if __name__ == "__main__":
+    main()
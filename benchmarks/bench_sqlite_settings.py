@@ -0,0 +1,88 @@
+"""
+Benchmark of SQLite settings on a database file: journal groups of item
+status updates (one commit each), and sessions opened by the CLI.
+
+Compares a default engine (rollback journal, synchronous=FULL, no
+connection pooling, create_all for each session, as make_session did)
+with the engine of forwarding_service.database.
+
+    python -m benchmarks.bench_sqlite_settings --num-groups 2000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from forwarding_service.commands import UpdateItemStatusCommand
+from forwarding_service.database import create_db_engine
+from forwarding_service.models import Item, Transaction
+from forwarding_service.schema import migrate
+from forwarding_service.utils import batched
+
+from .bench_item_status import make_database
+
+
+def update_groups(engine, ids, group_size):
+    session = Session(engine)
+    command = UpdateItemStatusCommand(session)
+    start = time.perf_counter()
+    for group in batched(ids, group_size):
+        command.execute([Transaction(item_id=i, success=True) for i in group])
+    session.close()
+
+    return time.perf_counter() - start
+
+
+def open_sessions(make_session, num_sessions):
+    start = time.perf_counter()
+    for _ in range(num_sessions):
+        session = make_session()
+        session.query(Item).first()
+        session.close()
+
+    return (time.perf_counter() - start) / num_sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--num-groups", type=int, default=2000)
+    parser.add_argument("--group-size", type=int, default=10)
+    parser.add_argument("--num-sessions", type=int, default=200)
+    args = parser.parse_args()
+
+    num_items = args.num_groups * args.group_size
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["default", "tuned"]:
+            url = f"sqlite:///{Path(tmp) / name}.db"
+            make_database(url.removeprefix("sqlite:///"), num_items).close()
+            if name == "default":
+                engine = create_engine(url)
+
+                def make_session():
+                    SQLModel.metadata.create_all(engine)
+                    return Session(engine)
+
+            else:
+                engine = create_db_engine(url)
+                migrate(engine)
+
+                def make_session():
+                    return Session(engine)
+
+            ids = [i for (i,) in Session(engine).query(Item.id)]
+            elapsed = update_groups(engine, ids, args.group_size)
+            per_session = open_sessions(make_session, args.num_sessions)
+            engine.dispose()
+
+            print(
+                f"{name}: {args.num_groups} commits of {args.group_size} "
+                f"items in {elapsed:.2f} s "
+                f"({elapsed / args.num_groups * 1e3:.2f} ms/commit), "
+                f"session: {per_session * 1e3:.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
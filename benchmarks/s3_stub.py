@@ -0,0 +1,77 @@
+"""
+Local stand-in for S3, answering PutObject (and any other PUT) after a
+fixed latency, over HTTP/1.1 keep-alive connections, like S3 does.
+Objects are not stored.
+
+The server runs in a process of its own, so as not to compete with the
+benchmarked threads for the GIL.
+"""
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+
+class _Server(ThreadingHTTPServer):
+    # connections opened at once by hundreds of clients
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+
+        self.send_response(200)
+        self.send_header("ETag", '"0"')
+        checksum = self.headers.get("x-amz-checksum-sha256")
+        if checksum:
+            self.send_header("x-amz-checksum-sha256", checksum)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(latency, ports):
+    handler = type("Handler", (_Handler,), {"latency": latency})
+    server = _Server(("127.0.0.1", 0), handler)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+@contextmanager
+def s3_stub(latency: float = 0.0):
+    """
+    Run the stand-in in a background process, and yield a boto3 session
+    whose S3 clients are pointed at it.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve, args=(latency, ports), daemon=True
+    )
+    process.start()
+
+    endpoint = os.environ.get("AWS_ENDPOINT_URL")
+    os.environ["AWS_ENDPOINT_URL"] = f"http://127.0.0.1:{ports.get()}"
+    try:
+        yield boto3.Session(
+            aws_access_key_id="key",
+            aws_secret_access_key="secret",
+            region_name="us-east-1",
+        )
+    finally:
+        if endpoint is None:
+            del os.environ["AWS_ENDPOINT_URL"]
+        else:
+            os.environ["AWS_ENDPOINT_URL"] = endpoint
+        process.terminate()
+        process.join()
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from queue import Empty, SimpleQueue
+from typing import Iterable
+
+from .commands import Command
+from .concurrency import AsyncByteBudget
+from .exceptions import (
+    CheckSumException,
+    RemoteException,
+    TransferException,
+)
+from .models import Transaction
+from .multipart import MultipartTransfer
+from .reader_writer import BaseReader
+from .retry import RetryPolicy
+from .transfer_agent import TransferAgent
+from .utils import sha256_checksum
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTransferAgent(TransferAgent):
+    """
+    TransferAgent running transfers as coroutines of one event loop
+    instead of threads, for jobs of many small files whose transfer time
+    is mostly the latency of requests: up to max_in_flight requests (of
+    files or parts) are sent at once, at the cost of one thread.
+
+    The writer is an AsyncS3Writer, whose operations are coroutines.
+    Files are read, and hashed, by a pool of n_readers threads, as reading
+    local files would otherwise block the event loop.
+
+    run has the same contract as TransferAgent's, with the same commands,
+    checkpoints, retries and memory budget. Commands are executed on the
+    event loop, and should not block it, e.g. RecordToJournalCommand.
+    """
+
+    def __init__(
+        self,
+        reader: BaseReader,
+        writer,
+        post_transaction_commands: list[Command] = [],
+        post_batch_commands: list[Command] = [],
+        max_in_flight: int = 1000,
+        n_readers: int = 16,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        retry_policy: RetryPolicy | None = None,
+        memory_budget: int | None = None,
+    ):
+        super().__init__(
+            reader=reader,
+            writer=writer,
+            post_transaction_commands=post_transaction_commands,
+            post_batch_commands=post_batch_commands,
+            n_threads=max_in_flight,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            retry_policy=retry_policy,
+        )
+        self.n_readers = n_readers
+        self.memory_budget = memory_budget
+
+        self._tasks = set()
+        self._requests = None
+        self._readers = None
+
+    @property
+    def max_in_flight(self) -> int:
+        return self.n_threads
+
+    def run(self, transactions: Iterable[Transaction]) -> None:
+        """See TransferAgent.run, transactions are consumed on the loop"""
+        asyncio.run(self._run(transactions))
+
+    async def _run(self, transactions: Iterable[Transaction]) -> None:
+        # bound to the event loop of this run
+        self._requests = asyncio.Semaphore(self.max_in_flight)
+        if self.memory_budget:
+            self.budget = AsyncByteBudget(self.memory_budget)
+        self._tasks = set()
+        self._finished = SimpleQueue()
+        self._completed = []
+        self._last_checkpoint = time.monotonic()
+        self._retries = []
+
+        self.writer.set_concurrency(self.max_in_flight)
+        async with AsyncExitStack() as stack:
+            self._readers = stack.enter_context(
+                ThreadPoolExecutor(self.n_readers, thread_name_prefix="reader")
+            )
+            await stack.enter_async_context(self.writer)
+            try:
+                for t in transactions:
+                    if t is None:
+                        await self._collect()
+                        self._submit_retries()
+                        continue
+                    while len(self._tasks) >= self.max_in_flight:
+                        await self._collect()
+                        self._submit_retries()
+                    self._submit(self._transfer_one, t)
+
+                while self._tasks or self._retries:
+                    await self._collect()
+                    self._submit_retries()
+            finally:
+                while self._tasks:
+                    await self._collect(checkpoint=False)
+                self._checkpoint()
+                logger.info("transfer metrics: %s", self.metrics())
+
+    async def _collect(self, checkpoint: bool = True) -> int:
+        """See TransferAgent._collect"""
+        timeout = None
+        if checkpoint:
+            deadline = self._last_checkpoint + self.checkpoint_interval
+            if self._retries:
+                deadline = min(deadline, self._retries[0][0])
+            timeout = max(deadline - time.monotonic(), 0)
+
+        if self._tasks:
+            done, self._tasks = await asyncio.wait(
+                self._tasks,
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                # exceptions of commands
+                task.result()
+        else:
+            # only retries to wait for
+            await asyncio.sleep(timeout)
+
+        num_collected = 0
+        try:
+            while True:
+                t = self._finished.get_nowait()
+                self._completed.append(t)
+                num_collected += 1
+                if t.retry:
+                    self._schedule_retry(t)
+        except Empty:
+            pass
+
+        due = (len(self._completed) >= self.checkpoint_every) or (
+            time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+        )
+        if checkpoint and due:
+            self._checkpoint()
+
+        return num_collected
+
+    def _submit(self, fn, *args) -> None:
+        self._tasks.add(asyncio.create_task(fn(*args)))
+
+    @asynccontextmanager
+    async def _slot(self, nbytes: int):
+        """Context of a request sending nbytes, held within the memory
+        budget, if any, and max_in_flight"""
+        async with AsyncExitStack() as stack:
+            if self.budget is not None:
+                await stack.enter_async_context(self.budget.reserve(nbytes))
+            await stack.enter_async_context(self._requests)
+            yield
+
+    async def _read(self, fn, *args):
+        """Run fn on a reader thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, fn, *args)
+
+    def _read_object(self, uri: str) -> tuple[bytes, str | None, str]:
+        stream, mime_type = self.reader(uri)
+        with stream:
+            body = stream.read()
+        return body, mime_type, sha256_checksum(body)
+
+    def _read_part(self, uri: str, offset: int, length: int):
+        body = self.reader.read_range(uri, offset, length)
+        return body, sha256_checksum(body)
+
+    async def _transfer_one(self, transaction: Transaction) -> None:
+        t = transaction
+        try:
+            size = await self._read(self.reader.size, t.input)
+            if self.writer.use_multipart(size):
+                upload = await self._create_multipart(t, size)
+                await asyncio.gather(
+                    *[self._transfer_part(upload, n) for n in upload.pending]
+                )
+                await self._complete_multipart(upload)
+            else:
+                print(f"{t.input} -> {t.output}")
+                async with self._slot(size):
+                    body, mime_type, checksum = await self._read(
+                        self._read_object, t.input
+                    )
+                    remote_checksum = await self.writer.put_object(
+                        body, t.output, mime_type, checksum
+                    )
+                if self.do_checksum and remote_checksum not in (
+                    None,
+                    checksum,
+                ):
+                    raise CheckSumException(
+                        error=f"Expected checksum {checksum}, "
+                        f"destination reported {remote_checksum}",
+                        operation="checksum",
+                    )
+                t.success = True
+        except Exception as e:
+            t.exception = e
+
+        self._finish(t)
+
+    async def _create_multipart(
+        self, transaction: Transaction, size: int
+    ) -> MultipartTransfer:
+        """See TransferAgent._create_multipart"""
+        part_size = self.writer.get_part_size(size)
+
+        if transaction.upload_id is not None:
+            upload = MultipartTransfer(transaction, size, part_size)
+            try:
+                parts = await self.writer.list_parts(
+                    transaction.output, transaction.upload_id
+                )
+            except TransferException:
+                parts = None
+
+            if parts is not None and upload.resume(parts):
+                print(
+                    f"{transaction.input} -> {transaction.output} "
+                    f"(resuming, {len(upload.pending)} parts left)"
+                )
+                return upload
+
+            if parts is not None:
+                await self.writer.abort_multipart_upload(
+                    transaction.output, transaction.upload_id
+                )
+
+        print(f"{transaction.input} -> {transaction.output} (multipart)")
+        transaction.upload_id = await self.writer.create_multipart_upload(
+            transaction.output, self.reader.guess_mime_type(transaction.input)
+        )
+        transaction.parts = []
+
+        return MultipartTransfer(transaction, size, part_size)
+
+    async def _transfer_part(self, upload: MultipartTransfer, part_number: int):
+        t = upload.transaction
+        part, exception = None, None
+        try:
+            if not upload.failed:
+                offset, length = upload.ranges[part_number]
+                async with self._slot(length):
+                    body, checksum = await self._read(
+                        self._read_part, t.input, offset, length
+                    )
+                    part = await self.writer.upload_part(
+                        body, t.output, upload.upload_id, part_number, checksum
+                    )
+        except Exception as e:
+            exception = e
+
+        upload.part_done(part, exception)
+
+    async def _complete_multipart(self, upload: MultipartTransfer) -> None:
+        """See TransferAgent._complete_multipart, except that the
+        transaction is finished by the caller"""
+        t = upload.transaction
+        try:
+            if not upload.failed:
+                await self.writer.complete_multipart_upload(
+                    t.output, upload.upload_id, upload.parts
+                )
+                t.success = True
+        except CheckSumException as e:
+            t.exception = e
+            try:
+                await self.writer.abort_multipart_upload(
+                    t.output, upload.upload_id
+                )
+            except RemoteException as abort_error:
+                # left to expire, a new upload is started anyway
+                logger.warning(
+                    "could not abort upload of %s: %s",
+                    t.output,
+                    abort_error.error,
+                )
+            t.upload_id, t.parts = None, []
+        except Exception as e:
+            t.exception = e
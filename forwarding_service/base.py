@@ -1,6 +1,23 @@
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterator
 import mimetypes
 
+from .filters import Filter
+from .utils import stream_size
+
+
+@dataclass
+class ScanEntry:
+    """Item found when listing a source"""
+
+    uri: str
+    # path relative to the listed source
+    path: str
+    # size in bytes and modification time (timestamp), when known
+    size: int | None = None
+    mtime: float | None = None
+
 
 class BaseReader(ABC):
     @abstractmethod
@@ -15,12 +32,45 @@ class BaseReader(ABC):
     def list(self, *args, **kwargs):
         pass
 
+    def scan(
+        self, uri, files_only=True, filter: Filter | None = None
+    ) -> Iterator[ScanEntry]:
+        """
+        Yield entries of items present at uri, selected by filter.
+        Defaults to the URIs given by list, keeping their name as path.
+        """
+        for in_uri in self.list(uri, files_only=files_only):
+            entry = ScanEntry(uri=in_uri, path=in_uri.split("/")[-1])
+            if filter is None or filter.match(
+                entry.uri, entry.path, entry.size, entry.mtime
+            ):
+                yield entry
+
     @staticmethod
     def guess_mime_type(uri):
         return mimetypes.guess_type(uri)[0]
 
+    def open(self, uri):
+        """
+        Return a readable (and seekable) file-like object on uri.
+        Defaults to the in-memory buffer returned by read, readers
+        that can stream their content should override this.
+        """
+        return self.read(uri)
+
+    def size(self, uri) -> int:
+        """Size in bytes of the object at uri"""
+        with self.open(uri) as stream:
+            return stream_size(stream)
+
+    def read_range(self, uri, offset: int, length: int) -> bytes:
+        """Read length bytes of the object at uri, starting at offset"""
+        with self.open(uri) as stream:
+            stream.seek(offset)
+            return stream.read(length)
+
     def __call__(self, uri):
-        bytes_ = self.read(uri)
+        bytes_ = self.open(uri)
         type_ = self.guess_mime_type(uri)
 
         return bytes_, type_
@@ -32,7 +82,40 @@ class BaseReader(ABC):
 class BaseWriter(ABC):
     @abstractmethod
     def __call__(self, *args, **kwargs):
+        """
+        Write stream to uri.
+        Returns the SHA-256 checksum of the written object as reported
+        by the destination, or None when it reports none.
+        """
         pass
 
+    def set_concurrency(self, n: int) -> None:
+        """Prepare for up to n concurrent calls, e.g. by sizing connection
+        pools. Called by TransferAgent whenever it starts its workers."""
+        pass
+
+    def use_multipart(self, size: int) -> bool:
+        """Whether an object of size bytes is sent in several parts.
+        Writers returning True must implement the multipart methods below."""
+        return False
+
+    def get_part_size(self, size: int) -> int:
+        raise NotImplementedError
+
+    def create_multipart_upload(self, uri, mime_type=None) -> str:
+        raise NotImplementedError
+
+    def upload_part(self, body: bytes, uri, upload_id, part_number) -> dict:
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, uri, upload_id, parts: list[dict]):
+        raise NotImplementedError
+
+    def list_parts(self, uri, upload_id) -> list[dict]:
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, uri, upload_id):
+        raise NotImplementedError
+
     def refresh_credentials(self):
         pass
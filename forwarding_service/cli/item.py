@@ -1,3 +1,5 @@
+from typing import Optional
+
 import typer
 from forwarding_service import make_session
 from forwarding_service.models import Item
@@ -17,17 +19,23 @@ def ls(
     status: Annotated[str, typer.Option()] | None = None,
     limit: Annotated[int, typer.Option()] = 50,
     sort_on: Annotated[str, typer.Option()] | None = None,
+    after: Annotated[
+        Optional[str],
+        typer.Option(help="token of the page to list, as printed"),
+    ] = None,
 ):
-    """list items"""
+    """list items, limit at a time"""
 
     args = dict(locals())
     query = Query(make_session(), Item)
-    items = query.get(
+    items, after = query.page(
         ItemQueryArgs(
             **args
     ))
     items = [dict(item) for item in items]
     print(items)
+    if after is not None:
+        print(f"next page: --after {after}")
 
 
 if __name__ == "__main__":
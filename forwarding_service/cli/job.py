@@ -1,28 +1,100 @@
+from datetime import datetime
+from typing import List, Optional
+
 import typer
+from sqlalchemy import exists
+from forwarding_service.cli.options import (
+    TransferOptions,
+    with_transfer_options,
+)
+from forwarding_service.filters import FilterSpec
 from forwarding_service.job_manager import JobManager
 from forwarding_service.query import Query, JobQueryArgs
 from forwarding_service import make_session
-from forwarding_service.models import Job
+from forwarding_service.models import Item, Job
+from forwarding_service.server import submit
 from rich import print
 from typing_extensions import Annotated
 
 app = typer.Typer()
 
 
+def _submit(options: TransferOptions, request: dict) -> bool:
+    """Submit request to the daemon, if running, returns whether it was.
+    Warns of the transfer options given, as the daemon uses its own"""
+    reply = submit(request)
+    if reply is None:
+        return False
+    if "error" in reply:
+        print(reply["error"])
+        raise typer.Exit(code=1)
+
+    print("submitted job", reply["job_id"])
+    changed = options.changed()
+    if changed:
+        print(
+            "[yellow]warning:[/yellow] ignored by the daemon, which runs jobs "
+            f"with the options of serve: {', '.join(changed)}. "
+            "Use --no-daemon to run the job with them."
+        )
+    return True
+
+
 @app.command()
+@with_transfer_options
 def run(
     source: Annotated[str, typer.Argument()],
     destination: Annotated[str, typer.Argument()],
     regexp: Annotated[str, typer.Option()] = ".*",
-    n_threads: Annotated[int, typer.Option()] = 30,
-    use_vault: Annotated[bool, typer.Option()] = False,
+    include: Annotated[Optional[List[str]], typer.Option()] = None,
+    exclude: Annotated[Optional[List[str]], typer.Option()] = None,
+    include_regex: Annotated[Optional[List[str]], typer.Option()] = None,
+    exclude_regex: Annotated[Optional[List[str]], typer.Option()] = None,
+    min_size: Annotated[Optional[int], typer.Option()] = None,
+    max_size: Annotated[Optional[int], typer.Option()] = None,
+    newer_than: Annotated[Optional[datetime], typer.Option()] = None,
+    older_than: Annotated[Optional[datetime], typer.Option()] = None,
+    priority: Annotated[
+        int, typer.Option(min=1, help="share of the daemon's workers")
+    ] = 1,
+    max_transfers: Annotated[
+        Optional[int],
+        typer.Option(min=1, help="files sent at once by the daemon, at most"),
+    ] = None,
+    daemon: Annotated[
+        bool, typer.Option(help="submit to the daemon (serve), if running")
+    ] = True,
+    options: TransferOptions = None,
 ):
     """Run job"""
-    if use_vault:
-        jm = JobManager.local_to_s3_via_vault(n_threads=n_threads)
-    else:
-        jm = JobManager.local_to_s3(n_threads=n_threads)
-    job = jm.init(source, destination, regexp)
+    filter_spec = FilterSpec(
+        include=include or [],
+        exclude=exclude or [],
+        include_regex=include_regex or [],
+        exclude_regex=exclude_regex or [],
+        min_size=min_size,
+        max_size=max_size,
+        newer_than=newer_than,
+        older_than=older_than,
+    )
+    if daemon and _submit(
+        options,
+        {
+            "command": "run",
+            "source": source,
+            "destination": destination,
+            "regexp": regexp,
+            "filter_spec": filter_spec.to_dict(),
+            "priority": priority,
+            "max_transfers": max_transfers,
+        }
+    ):
+        return
+
+    jm = options.make_job_manager()
+    job = jm.init(
+        source, destination, regexp, filter_spec, priority, max_transfers
+    )
     print("created job", job.id)
     jm.parse_and_commit_items(job)
     print("parsed job", job.id)
@@ -31,21 +103,44 @@ def run(
 
 
 @app.command()
+@with_transfer_options
 def resume(
     id: Annotated[str, typer.Argument()],
-    n_threads: Annotated[int, typer.Option()] = 30,
-    use_vault: Annotated[bool, typer.Option()] = False,
+    priority: Annotated[
+        Optional[int],
+        typer.Option(min=1, help="share of the daemon's workers"),
+    ] = None,
+    max_transfers: Annotated[
+        Optional[int],
+        typer.Option(min=1, help="files sent at once by the daemon, at most"),
+    ] = None,
+    daemon: Annotated[
+        bool, typer.Option(help="submit to the daemon (serve), if running")
+    ] = True,
+    options: TransferOptions = None,
 ):
     """Resume job"""
-    if use_vault:
-        jm = JobManager.local_to_s3_via_vault(n_threads=n_threads)
-    else:
-        jm = JobManager.local_to_s3(n_threads=n_threads)
-    query = Query(make_session(), Job)
+    request = {
+        "command": "resume",
+        "id": id,
+        "priority": priority,
+        "max_transfers": max_transfers,
+    }
+    if daemon and _submit(options, request):
+        return
+
+    jm = options.make_job_manager()
+    query = Query(jm.session, Job)
     if query.exists(id):
-        jm.resume(query.get(JobQueryArgs(id=id))[0])
+        job = query.get(JobQueryArgs(id=id))[0]
+        # kept for the runs of the daemon
+        if priority is not None:
+            job.priority = priority
+        if max_transfers is not None:
+            job.max_transfers = max_transfers
+        jm.resume(job)
     else:
-        f'{id} not found'
+        print(f'{id} not found')
 
 
 @app.command()
@@ -57,22 +152,45 @@ def ls(
     destination: Annotated[str, typer.Option()] | None = None,
     limit: Annotated[int, typer.Option()] = 10,
     sort_on: Annotated[str, typer.Option()] = 'created_at',
+    after: Annotated[
+        Optional[str],
+        typer.Option(help="token of the page to list, as printed"),
+    ] = None,
 ):
-    """list jobs"""
+    """list jobs, most recent first"""
     args = dict(locals())
     query = Query(make_session(), Job)
-    jobs = query.get(JobQueryArgs(**args))
+    jobs, after = query.page(JobQueryArgs(**args))
     jobs = [job.to_detailed_dict() for job in jobs]
     print(jobs)
+    if after is not None:
+        print(f"next page: --after {after}")
 
 
 @app.command()
 def rm(
     id: Annotated[str, typer.Argument()],
+    use_vault: Annotated[bool, typer.Option()] = False,
 ):
-    """Delete job and related items"""
+    """Delete job and related items, aborting unfinished uploads"""
     query = Query(make_session(), Job)
-    query.delete(JobQueryArgs(id=id))
+    jobs = query.get(JobQueryArgs(id=id))
+    if not jobs:
+        print(f'{id} not found')
+        return
+    has_uploads = query.session.query(
+        exists().where(Item.job_id == jobs[0].id, Item.upload_id.isnot(None))
+    ).scalar()
+    if not has_uploads:
+        # nothing to abort, no need for credentials
+        query.delete(JobQueryArgs(id=id))
+        return
+
+    if use_vault:
+        jm = JobManager.local_to_s3_via_vault()
+    else:
+        jm = JobManager.local_to_s3()
+    jm.delete(jm.session.get(Job, jobs[0].id))
 
 
 if __name__ == "__main__":
@@ -1,11 +1,23 @@
+import logging
+
 import typer
-from forwarding_service.cli import job, item
+from decouple import config
+from forwarding_service.cli import job, item, serve
 
 app = typer.Typer()
 app.add_typer(job.app, name='job')
 app.add_typer(item.app, name='item')
+app.command()(serve.serve)
 
 def main():
+    # INFO of the app only, not of botocore, urllib3...
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    logging.getLogger("forwarding_service").setLevel(
+        config("FORW_SERV_LOG_LEVEL", default="INFO")
+    )
     app()
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+import functools
+import inspect
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+import typer
+from forwarding_service.concurrency import AIMDController
+from forwarding_service.enum_types import TransferOrder
+from forwarding_service.job_manager import MEMORY_BUDGET, JobManager
+from typing_extensions import Annotated
+
+
+@dataclass
+class TransferOptions:
+    """Options of the transfers of jobs, shared by job run, job resume and
+    serve (see with_transfer_options), with the help of each one"""
+
+    n_threads: int = 30
+    checkpoint_every: int = 100
+    checkpoint_interval: float = 10.0
+    adaptive: bool = False
+    min_threads: int = 4
+    max_threads: int = 64
+    max_attempts: int = 5
+    memory_budget: int = MEMORY_BUDGET
+    order: TransferOrder = "largest-first"
+    asyncio: bool = field(
+        default=False,
+        metadata={"help": "send files from an event loop (aiobotocore)"},
+    )
+    max_in_flight: int = 1000
+    processes: int = field(
+        default=1, metadata={"help": "worker processes sending files"}
+    )
+    lease_ttl: Optional[float] = field(
+        default=None,
+        metadata={
+            "help": "claim files under leases of this many seconds, "
+            "to share jobs with other hosts"
+        },
+    )
+    use_vault: bool = False
+
+    def changed(self) -> list[str]:
+        """Options given with another value than their default, as flags"""
+        return [
+            "--" + f.name.replace("_", "-")
+            for f in fields(self)
+            if getattr(self, f.name) != f.default
+        ]
+
+    def make_job_manager(self) -> JobManager:
+        factory = (
+            JobManager.local_to_s3_via_vault
+            if self.use_vault
+            else JobManager.local_to_s3
+        )
+        return factory(
+            n_threads=self.n_threads,
+            checkpoint_every=self.checkpoint_every,
+            checkpoint_interval=self.checkpoint_interval,
+            concurrency=self._make_concurrency(),
+            max_attempts=self.max_attempts,
+            memory_budget=self.memory_budget,
+            order=self.order,
+            max_in_flight=self.max_in_flight if self.asyncio else None,
+            processes=self.processes if self.processes > 1 else None,
+            lease_ttl=self.lease_ttl,
+        )
+
+    def _make_concurrency(self) -> AIMDController | None:
+        """Controller adapting the number of threads, starting from
+        n_threads"""
+        if not self.adaptive:
+            return None
+        return AIMDController(
+            self.min_threads, self.max_threads, initial=self.n_threads
+        )
+
+
+def with_transfer_options(command):
+    """
+    Give a command the options of TransferOptions, after its own ones,
+    which it receives as its options parameter, so that they are declared
+    once for all commands.
+    """
+    signature = inspect.signature(command)
+    parameters = [
+        p for p in signature.parameters.values() if p.name != "options"
+    ] + [
+        inspect.Parameter(
+            f.name,
+            inspect.Parameter.KEYWORD_ONLY,
+            default=f.default,
+            annotation=Annotated[
+                f.type, typer.Option(help=f.metadata.get("help"))
+            ],
+        )
+        for f in fields(TransferOptions)
+    ]
+
+    @functools.wraps(command)
+    def wrapper(**kwargs):
+        options = TransferOptions(
+            **{f.name: kwargs.pop(f.name) for f in fields(TransferOptions)}
+        )
+        return command(options=options, **kwargs)
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    wrapper.__annotations__ = {p.name: p.annotation for p in parameters}
+    return wrapper
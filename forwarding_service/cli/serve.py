@@ -0,0 +1,25 @@
+import typer
+from forwarding_service.cli.options import (
+    TransferOptions,
+    with_transfer_options,
+)
+from forwarding_service.server import SOCKET_PATH, JobServer
+from rich import print
+from typing_extensions import Annotated
+
+
+@with_transfer_options
+def serve(
+    socket_path: Annotated[str, typer.Option()] = SOCKET_PATH,
+    options: TransferOptions = None,
+):
+    """Run the jobs submitted by job run and job resume, with clients set
+    up once, until interrupted"""
+    jm = options.make_job_manager()
+    with JobServer(jm, socket_path) as server:
+        server.start()
+        print("listening on", server.socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("stopped, queued jobs are run on restart")
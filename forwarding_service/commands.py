@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
 
+from sqlalchemy import delete, func, select, update
+
 from .enum_types import ItemStatus, JobError
 from .exceptions import CheckSumException, TransferException
-from .models import Item, Transaction
+from .models import Item, Job, Part, Transaction
+from .utils import batched
 
 
 class Command(ABC):
@@ -19,6 +22,15 @@ class CommandWithSession(Command):
 
 
 class UpdateItemStatusCommand(CommandWithSession):
+    """
+    Mark items of successful transactions as transferred, with one UPDATE
+    statement per chunk of chunk_size items, and add them to the progress
+    counters of their job. Record the error and multipart upload of failed
+    ones so they can be resumed. Changes are committed once.
+    """
+
+    chunk_size = 500
+
     def execute(self, payload: Transaction | list[Transaction]):
         if self.threaded:
             return
@@ -26,16 +38,87 @@ class UpdateItemStatusCommand(CommandWithSession):
         if isinstance(payload, Transaction):
             payload = [payload]
 
+        now = datetime.now()
+        done = [t for t in payload if t.success]
+        for chunk in batched(done, self.chunk_size):
+            ids = [t.item_id for t in chunk]
+            self._count_done(ids, now)
+            self.session.execute(
+                update(Item)
+                .where(Item.id.in_(ids))
+                .values(
+                    status=ItemStatus.TRANSFERRED,
+                    transferred_at=now,
+                    upload_id=None,
+                    attempts=Item.attempts + 1,
+                    lease_owner=None,
+                    lease_expires_at=None,
+                )
+            )
+
+            ids = [t.item_id for t in chunk if t.upload_id is not None]
+            if ids:
+                self.session.execute(delete(Part).where(Part.item_id.in_(ids)))
+
         for t in payload:
-            item = self.session.query(Item).get(t.item_id)
             if t.success:
-                item.status = ItemStatus.TRANSFERRED
-                item.transferred_at = datetime.now()
-                self.session.commit()
+                continue
+            item = self.session.query(Item).get(t.item_id)
+            item.attempts += 1
+            item.last_error = self._describe(t.exception)
+            if t.upload_id != item.upload_id or t.parts:
+                self._save_upload(item, t)
+
+        self.session.commit()
+
+    def _count_done(self, ids: list, now: datetime) -> None:
+        """Add items about to be marked as transferred to job counters"""
+        counts = self.session.execute(
+            select(Item.job_id, func.count(), func.sum(Item.size))
+            .where(Item.id.in_(ids), Item.status != ItemStatus.TRANSFERRED)
+            .group_by(Item.job_id)
+        ).all()
+        for job_id, num_items, num_bytes in counts:
+            num_bytes = num_bytes or 0
+            self.session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(
+                    num_done_items=Job.num_done_items + num_items,
+                    num_done_bytes=Job.num_done_bytes + num_bytes,
+                    run_done_bytes=Job.run_done_bytes + num_bytes,
+                    last_transfer_at=now,
+                )
+            )
+
+    @staticmethod
+    def _describe(exception) -> str | None:
+        if exception is None:
+            return None
+        operation = getattr(exception, "operation", None)
+        operation = f" ({operation})" if operation else ""
+        message = getattr(exception, "error", str(exception))
+        return f"{type(exception).__name__}{operation}: {message}"
+
+    @staticmethod
+    def _save_upload(item: Item, transaction: Transaction):
+        """Record multipart upload of failed transaction so it can be resumed"""
+        if item.upload_id != transaction.upload_id:
+            item.upload_id = transaction.upload_id
+            item.parts = []
+
+        saved = {p.part_number for p in item.parts}
+        item.parts += [
+            Part.from_dict(p)
+            for p in transaction.parts
+            if p["PartNumber"] not in saved
+        ]
 
 
 class UpdateJobErrorCommand(CommandWithSession):
-    """Set error fields of job record according to exception"""
+    """Set error fields of job records according to exceptions of
+    transactions that are not retried, which may belong to several jobs,
+    the most severe error and the last message of each job are kept"""
 
     def execute(self, payload: Transaction | list[Transaction]):
         if self.threaded:
@@ -44,23 +127,65 @@ class UpdateJobErrorCommand(CommandWithSession):
         if isinstance(payload, Transaction):
             payload = [payload]
 
-        exceptions = [t.exception for t in payload if t.exception]
-        if len(payload) == 0:
+        failed = [t for t in payload if t.exception and not t.retry]
+        if len(failed) == 0:
             return
-        item = self.session.query(Item).get(payload[0].item_id)
-        job = item.job
 
-        for e in exceptions:
-            if type(e) == CheckSumException:
+        for t in failed:
+            job = self.session.query(Item).get(t.item_id).job
+            e = t.exception
+            if isinstance(e, CheckSumException):
                 job.error = max(job.error, JobError.CHECKSUM_ERROR)
-            elif type(e) == TransferException:
+            elif isinstance(e, TransferException):
                 job.error = max(job.error, JobError.TRANSFER_ERROR)
-            job.info["message"] = e.error
-            job.info["operation"] = e.operation
-            self.session.commit()
+
+            # assign a new dict, as changes to the JSON column are not
+            # tracked
+            job.info = {
+                "message": getattr(e, "error", str(e)),
+                "operation": getattr(e, "operation", ""),
+            }
+
+        self.session.commit()
+
+
+class RefreshJobProgressCommand(CommandWithSession):
+    """
+    Recount the progress counters of jobs (all of them by default) from
+    their items, with one grouped query, e.g. for databases created before
+    the counters, or edited by hand.
+    """
+
+    def execute(self, job_ids: list | None = None):
+        query = select(
+            Item.job_id,
+            func.count(),
+            func.sum(Item.size),
+            func.count().filter(Item.status == ItemStatus.TRANSFERRED),
+            func.sum(Item.size).filter(Item.status == ItemStatus.TRANSFERRED),
+        ).group_by(Item.job_id)
+        if job_ids is not None:
+            query = query.where(Item.job_id.in_(job_ids))
+
+        for job_id, n, nbytes, n_done, nbytes_done in self.session.execute(
+            query
+        ).all():
+            self.session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(
+                    num_items=n,
+                    num_bytes=nbytes or 0,
+                    num_done_items=n_done,
+                    num_done_bytes=nbytes_done or 0,
+                )
+            )
+        self.session.commit()
 
 
 class RaiseExceptionCommand(Command):
+    """Raise the first exception of transactions that are not retried"""
+
     def __init__(self, threaded=False):
         self.threaded = threaded
 
@@ -71,6 +196,22 @@ class RaiseExceptionCommand(Command):
         if isinstance(results, Transaction):
             results = [results]
 
-        exceptions = [r.exception for r in results if r.exception]
+        exceptions = [
+            r.exception for r in results if r.exception and not r.retry
+        ]
         if exceptions:
             raise exceptions[0]
+
+
+class RecordToJournalCommand(Command):
+    """Hand transactions over to a Journal, which writes them to the database"""
+
+    def __init__(self, journal):
+        self.journal = journal
+
+    def execute(self, payload: Transaction | list[Transaction]):
+        if isinstance(payload, Transaction):
+            payload = [payload]
+
+        for t in payload:
+            self.journal.put(t)
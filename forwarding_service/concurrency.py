@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition, Lock
+
+from .exceptions import ThrottleException
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimit:
+    """Semaphore whose number of slots can be changed while in use"""
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._in_use = 0
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def set_limit(self, limit: int) -> None:
+        """Slots in use above a lowered limit are released as usual,
+        new ones are only granted once below it"""
+        with self._condition:
+            self._limit = limit
+            self._condition.notify_all()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_use >= self._limit:
+                self._condition.wait()
+            self._in_use += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ByteBudget:
+    """
+    Semaphore weighted in bytes, bounding the memory held by transfers.
+
+    A transfer of nbytes is admitted once they fit under limit, in order
+    of arrival, so that large ones are not starved by smaller ones.
+    A transfer larger than limit is admitted alone.
+
+    Occupancy (in_use, peak) and the time spent waiting for the budget
+    are recorded.
+    """
+
+    def __init__(self, limit: int):
+        assert limit > 0, f"got limit = {limit}. Should be > 0"
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self.num_acquired = 0
+        self.num_waits = 0
+        self.wait_time = 0.0
+
+        self._waiting = deque()
+        self._condition = Condition()
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + nbytes <= self.limit
+
+    def acquire(self, nbytes: int) -> None:
+        with self._condition:
+            ticket = object()
+            self._waiting.append(ticket)
+            start = time.perf_counter()
+            waited = False
+            while self._waiting[0] is not ticket or not self._fits(nbytes):
+                waited = True
+                self._condition.wait()
+            self._waiting.popleft()
+
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+            self.num_acquired += 1
+            if waited:
+                self.num_waits += 1
+                self.wait_time += time.perf_counter() - start
+            # the next in line may fit as well
+            self._condition.notify_all()
+
+    def release(self, nbytes: int) -> None:
+        with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def to_dict(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "peak": self.peak,
+            "occupancy": round(self.in_use / self.limit, 3),
+            "peak_occupancy": round(self.peak / self.limit, 3),
+            "acquired": self.num_acquired,
+            "waits": self.num_waits,
+            "wait_time": round(self.wait_time, 3),
+        }
+
+
+class AsyncByteBudget(ByteBudget):
+    """ByteBudget shared by the coroutines of one event loop"""
+
+    def __init__(self, limit: int):
+        super().__init__(limit)
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, nbytes: int) -> None:
+        async with self._condition:
+            ticket = object()
+            self._waiting.append(ticket)
+            start = time.perf_counter()
+            waited = False
+            try:
+                while self._waiting[0] is not ticket or not self._fits(nbytes):
+                    waited = True
+                    await self._condition.wait()
+            except asyncio.CancelledError:
+                # give way to the next in line
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+                raise
+            self._waiting.popleft()
+
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+            self.num_acquired += 1
+            if waited:
+                self.num_waits += 1
+                self.wait_time += time.perf_counter() - start
+            self._condition.notify_all()
+
+    async def release(self, nbytes: int) -> None:
+        async with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int):
+        await self.acquire(nbytes)
+        try:
+            yield
+        finally:
+            await self.release(nbytes)
+
+
+class AIMDController:
+    """
+    Adapts the number of concurrent transfers, between min_limit and
+    max_limit, with additive increase / multiplicative decrease (AIMD).
+
+    Outcomes of transfers are recorded as they complete. Every interval
+    seconds, the limit is:
+    - multiplied by decrease_factor when transfers were throttled, failed
+      more often than error_threshold, or when throughput fell by more
+      than tolerance after the last increase,
+    - increased by increase otherwise, probing for more throughput.
+
+    Each decision is logged, and kept in decisions.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        initial: int | None = None,
+        interval: float = 5.0,
+        increase: int = 1,
+        decrease_factor: float = 0.5,
+        error_threshold: float = 0.05,
+        tolerance: float = 0.1,
+    ):
+        assert (
+            1 <= min_limit <= max_limit
+        ), f"got limits [{min_limit}, {max_limit}]. Should be 1 <= min <= max"
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.tolerance = tolerance
+
+        initial = min_limit if initial is None else initial
+        self.slots = ConcurrencyLimit(self._clamp(initial))
+        self.decisions = []
+
+        self._lock = Lock()
+        self._throughput = None
+        self._increased = False
+        self._reset(time.monotonic())
+
+    @property
+    def limit(self) -> int:
+        return self.slots.limit
+
+    @contextmanager
+    def transfer(self, nbytes: int):
+        """Hold a slot during the transfer of nbytes, and record its outcome"""
+        with self.slots:
+            try:
+                yield
+            except Exception as e:
+                self.record(0, e)
+                raise
+            self.record(nbytes)
+
+    def record(self, nbytes: int, exception: Exception | None = None) -> None:
+        with self._lock:
+            self._num_transfers += 1
+            self._bytes += nbytes
+            if isinstance(exception, ThrottleException):
+                self._num_throttled += 1
+            elif exception is not None:
+                self._num_errors += 1
+
+            now = time.monotonic()
+            if now - self._start >= self.interval:
+                self._adjust(now)
+
+    def _adjust(self, now: float) -> None:
+        throughput = self._bytes / (now - self._start)
+        error_rate = self._num_errors / self._num_transfers
+
+        limit = self.limit
+        if self._num_throttled > 0:
+            reason = f"{self._num_throttled} throttled"
+        elif error_rate > self.error_threshold:
+            reason = f"error rate {error_rate:.1%}"
+        elif self._increased and throughput < self._throughput * (
+            1 - self.tolerance
+        ):
+            reason = "throughput fell"
+        else:
+            reason = None
+
+        if reason is None:
+            new_limit = self._clamp(limit + self.increase)
+            reason = "no congestion"
+        else:
+            new_limit = self._clamp(int(limit * self.decrease_factor))
+
+        decision = {
+            "limit": limit,
+            "new_limit": new_limit,
+            "reason": reason,
+            "throughput": throughput,
+            "transfers": self._num_transfers,
+            "errors": self._num_errors,
+            "throttled": self._num_throttled,
+        }
+        self.decisions.append(decision)
+        logger.info(
+            "concurrency %d -> %d (%s): %.1f MiB/s, %d transfers, "
+            "%d errors, %d throttled",
+            limit,
+            new_limit,
+            reason,
+            throughput / 2**20,
+            self._num_transfers,
+            self._num_errors,
+            self._num_throttled,
+        )
+
+        if new_limit != limit:
+            self.slots.set_limit(new_limit)
+        self._increased = new_limit > limit
+        self._throughput = throughput
+        self._reset(now)
+
+    def _reset(self, now: float) -> None:
+        self._start = now
+        self._num_transfers = 0
+        self._num_errors = 0
+        self._num_throttled = 0
+        self._bytes = 0
+
+    def _clamp(self, limit: int) -> int:
+        return min(max(limit, self.min_limit), self.max_limit)
@@ -0,0 +1,119 @@
+import os
+from pathlib import Path
+from threading import Lock
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine
+
+from .schema import migrate
+
+DB_PATH = config("FORW_SERV_DB_PATH", "~/.cache/forwarding_service.db")
+# database shared by several hosts instead, e.g. postgresql://host/db
+DB_URL = config("FORW_SERV_DB_URL", default="")
+
+# SQLite settings, applied to each connection
+JOURNAL_MODE = config("FORW_SERV_DB_JOURNAL_MODE", default="WAL")
+SYNCHRONOUS = config("FORW_SERV_DB_SYNCHRONOUS", default="NORMAL")
+# in KiB, as a negative cache_size, i.e. 64 MiB
+CACHE_SIZE = config("FORW_SERV_DB_CACHE_SIZE", default=64 * 1024, cast=int)
+MMAP_SIZE = config("FORW_SERV_DB_MMAP_SIZE", default=256 * 1024**2, cast=int)
+# seconds to wait for a lock held by another connection or process
+BUSY_TIMEOUT = config("FORW_SERV_DB_BUSY_TIMEOUT", default=30.0, cast=float)
+
+_engines = {}
+_lock = Lock()
+
+
+def default_db_url() -> str:
+    if DB_URL:
+        return DB_URL
+
+    return f"sqlite:///{Path(DB_PATH).expanduser()}"
+
+
+def create_db_engine(
+    db_url: str,
+    journal_mode: str = JOURNAL_MODE,
+    synchronous: str = SYNCHRONOUS,
+    cache_size: int = CACHE_SIZE,
+    mmap_size: int = MMAP_SIZE,
+    busy_timeout: float = BUSY_TIMEOUT,
+) -> Engine:
+    """
+    Engine of db_url. For SQLite:
+    - connections are pooled (rather than opened for each session), so that
+      their page cache outlives sessions, and may be used by other threads
+      than the one that opened them, e.g. the journal's,
+    - WAL journaling, so that readers do not block the writer and commits
+      append to the log instead of copying pages to a rollback journal,
+      with synchronous=NORMAL, i.e. a sync at checkpoints only: commits
+      survive a crash of the process, not necessarily a power loss,
+    - cache_size KiB of page cache and mmap_size bytes of memory mapped
+      I/O per connection,
+    - a lock held by another connection is waited for up to busy_timeout
+      seconds, instead of failing with "database is locked".
+    """
+    if not db_url.startswith("sqlite"):
+        return create_engine(db_url)
+
+    engine = create_engine(
+        db_url,
+        connect_args={"check_same_thread": False, "timeout": busy_timeout},
+        poolclass=QueuePool,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA cache_size=-{cache_size}")
+        cursor.execute(f"PRAGMA mmap_size={mmap_size}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout * 1000)}")
+        cursor.close()
+
+    return engine
+
+
+def get_engine(db_url: str | None = None) -> Engine:
+    """
+    Engine of db_url (default: FORW_SERV_DB_URL or FORW_SERV_DB_PATH),
+    created and migrated once per process, and shared by the sessions of
+    the process.
+    """
+    if db_url is None:
+        db_url = default_db_url()
+
+    # engines (and their connections) are not inherited by forked processes
+    key = (os.getpid(), db_url)
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_db_engine(db_url)
+            _migrate(engine)
+            _engines[key] = engine
+
+    return engine
+
+
+def dispose_engines() -> None:
+    """Close the connections of the engines of this process"""
+    with _lock:
+        for key in [key for key in _engines if key[0] == os.getpid()]:
+            _engines.pop(key).dispose()
+
+
+def _migrate(engine: Engine) -> None:
+    added = migrate(engine)
+
+    if "job.num_done_items" in added:
+        # progress counters of jobs created before them
+        from sqlmodel import Session
+
+        from .commands import RefreshJobProgressCommand
+
+        with Session(engine) as session:
+            RefreshJobProgressCommand(session).execute()
@@ -20,3 +20,14 @@ class JobError(enum.IntEnum):
     TRANSFER_ERROR = 1
     CHECKSUM_ERROR = 2
     AUTH_ERROR = 3
+
+
+class TransferOrder(str, enum.Enum):
+    """Order in which the items of a job are sent"""
+
+    # by input URI, i.e. directory by directory as listed from the source
+    SCAN = "scan"
+    # largest first, so that no large file is left for the end
+    LARGEST_FIRST = "largest-first"
+    # alternately largest and smallest
+    MIXED = "mixed"
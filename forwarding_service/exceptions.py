@@ -4,9 +4,17 @@ class RemoteException(Exception):
         self.error = error
         self.operation = operation
 
+    def __reduce__(self):
+        # pickled by keyword arguments too, e.g. sent by worker processes
+        return self.__class__, (self.error, self.operation)
+
 class TransferException(RemoteException):
     pass
 
+class ThrottleException(TransferException):
+    """Request rejected by the remote for exceeding its request rate"""
+    pass
+
 class AuthenticationError(RemoteException):
     pass
 
@@ -28,3 +36,9 @@ class InitDuplicateJobException(Exception):
     def __init__(self, error):
 
         self.error = error
+
+
+class JobNotParsedException(Exception):
+    def __init__(self, error):
+
+        self.error = error
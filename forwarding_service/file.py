@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
 from urllib.parse import urlparse
-from .base import BaseReader
+from .base import BaseReader, ScanEntry
+from .filters import Filter
 import os
 import io
 
 
 class FileSystemReader(BaseReader):
+    def __init__(self, n_threads: int = 8):
+        """
+        :param n_threads: Number of threads listing directories in parallel
+        """
+        self.n_threads = n_threads
+
     def read(self, uri: str):
         uri = urlparse(uri)
         with open(uri.path, "rb") as f:
@@ -13,18 +23,117 @@ class FileSystemReader(BaseReader):
 
         return fileobj
 
+    def open(self, uri: str):
+        return open(urlparse(uri).path, "rb")
+
+    def size(self, uri: str) -> int:
+        return os.path.getsize(urlparse(uri).path)
+
     def exists(self, uri):
         return os.path.exists(urlparse(uri).path)
 
-    def list(self, uri, files_only=True):
+    def list(self, uri, files_only=True) -> Iterator[str]:
         """
-        Return URIs of all items present at path
+        Yield URIs of all items present at path, and in its subdirectories
+        """
+        return (entry.uri for entry in self.scan(uri, files_only=files_only))
+
+    def scan(
+        self, uri, files_only=True, filter: Filter | None = None
+    ) -> Iterator[ScanEntry]:
+        """
+        Yield entries of all items present at path, walking subdirectories
+        in parallel. Entries are yielded as directories are listed.
+        Items are selected with filter as they are found, and excluded
+        directories are not walked.
+        Entries of files carry their size and modification time.
         """
         path = urlparse(uri).path
         if os.path.isfile(path):
-            return [path]
+            st = os.stat(path)
+            entry = ScanEntry(
+                uri="file://" + path,
+                path=os.path.basename(path),
+                size=st.st_size,
+                mtime=st.st_mtime,
+            )
+            if _select(entry, filter):
+                yield entry
+            return
+
+        yield from scan_tree(path, files_only, self.n_threads, filter)
+
+
+def _select(entry: ScanEntry, filter: Filter | None) -> bool:
+    if filter is None:
+        return True
+    return filter.match(entry.uri, entry.path, entry.size, entry.mtime)
+
+
+def _scan_dir(path: str, prefix: str, files_only: bool, filter: Filter | None):
+    """
+    List one directory, relying on the file type reported by the directory
+    listing. Files are stat'ed once (DirEntry caches the result) for their
+    size and modification time, which filters then use as well.
+    Symbolic links to directories are not followed.
+    Returns entries and subdirectories as (path, prefix) pairs.
+    """
+    entries, subdirs = [], []
+    with os.scandir(path) as it:
+        for dir_entry in it:
+            is_dir = dir_entry.is_dir(follow_symlinks=False)
+            if is_dir:
+                if filter is not None and filter.prune(prefix + dir_entry.name):
+                    continue
+                subdirs.append((dir_entry.path, prefix + dir_entry.name + "/"))
+            if is_dir and files_only:
+                continue
+            if files_only and not dir_entry.is_file():
+                continue
+
+            entry = ScanEntry(
+                uri="file://" + dir_entry.path,
+                path=prefix + dir_entry.name,
+            )
+            if not is_dir and dir_entry.is_file():
+                st = dir_entry.stat()
+                entry.size, entry.mtime = st.st_size, st.st_mtime
+            if _select(entry, filter):
+                entries.append(entry)
+
+    return entries, subdirs
+
+
+def scan_tree(
+    root: str,
+    files_only: bool = True,
+    n_threads: int = 8,
+    filter: Filter | None = None,
+) -> Iterator[ScanEntry]:
+    """
+    Recursively yield entries under directory root, with paths relative
+    to root. At most 2 * n_threads directories are listed at a time.
+    """
+    todo = deque([(root, "")])
+    in_flight = set()
 
-        list_ = [path + f for f in os.listdir(path)]
-        list_ = ["file://" + f for f in list_ if (os.path.isfile(f) or not files_only)]
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        try:
+            while todo or in_flight:
+                while todo and len(in_flight) < 2 * n_threads:
+                    path, prefix = todo.popleft()
+                    in_flight.add(
+                        executor.submit(
+                            _scan_dir, path, prefix, files_only, filter
+                        )
+                    )
 
-        return list_
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries, subdirs = future.result()
+                    todo.extend(subdirs)
+                    yield from entries
+        finally:
+            # generator closed early, or listing failed
+            for future in in_flight:
+                future.cancel()
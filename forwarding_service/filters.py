@@ -0,0 +1,115 @@
+import fnmatch
+import json
+import re
+from datetime import datetime
+
+from pydantic import BaseModel, validator
+
+
+class FilterSpec(BaseModel):
+    """
+    Selection of source items, stored on Job.
+
+    Globs and regular expressions are matched against paths relative to
+    the source, e.g. "sub/dir/file.tif". Exclusions take precedence over
+    inclusions, and also apply to directories (tested with a trailing
+    slash, e.g. "tmp/"), which are then not walked at all.
+    """
+
+    include: list[str] = []
+    exclude: list[str] = []
+    include_regex: list[str] = []
+    exclude_regex: list[str] = []
+    min_size: int | None = None
+    max_size: int | None = None
+    newer_than: datetime | None = None
+    older_than: datetime | None = None
+
+    @validator("include_regex", "exclude_regex", each_item=True)
+    def check_regex(cls, value):
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise ValueError(f"invalid regular expression {value!r}: {e}")
+        return value
+
+    def to_dict(self) -> dict:
+        """JSON compatible dict of set fields"""
+        return json.loads(self.json(exclude_defaults=True))
+
+
+def _compile(globs: list[str], regexes: list[str]) -> re.Pattern | None:
+    """Single regular expression matching any of globs or regexes"""
+    patterns = [fnmatch.translate(g) for g in globs]
+    patterns += [f"(?:{r})" for r in regexes]
+    if not patterns:
+        return None
+
+    return re.compile("|".join(patterns))
+
+
+class Filter:
+    """
+    Compiled FilterSpec, along with the regular expression of the job
+    (matched against URIs), built once per job and applied by readers
+    while listing the source.
+    """
+
+    def __init__(
+        self, spec: FilterSpec | None = None, regexp: str | None = None
+    ):
+        spec = spec or FilterSpec()
+        self.regexp = re.compile(regexp) if regexp else None
+        self.include = _compile(spec.include, spec.include_regex)
+        self.exclude = _compile(spec.exclude, spec.exclude_regex)
+        self.min_size = spec.min_size
+        self.max_size = spec.max_size
+        self.newer_than = (
+            spec.newer_than.timestamp() if spec.newer_than else None
+        )
+        self.older_than = (
+            spec.older_than.timestamp() if spec.older_than else None
+        )
+
+    @classmethod
+    def from_job(cls, job):
+        spec = (
+            FilterSpec.parse_obj(job.filter_spec) if job.filter_spec else None
+        )
+        return cls(spec, regexp=job.regexp)
+
+    def prune(self, path: str) -> bool:
+        """Whether directory at (relative) path is excluded"""
+        return self.exclude is not None and bool(self.exclude.match(path + "/"))
+
+    def match(
+        self,
+        uri: str,
+        path: str,
+        size: int | None = None,
+        mtime: float | None = None,
+    ) -> bool:
+        """
+        Whether item is selected.
+        size and mtime (timestamp) are only checked when given.
+        """
+        if self.regexp is not None and not self.regexp.match(uri):
+            return False
+        if self.exclude is not None and self.exclude.match(path):
+            return False
+        if self.include is not None and not self.include.match(path):
+            return False
+
+        if size is not None:
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+
+        if mtime is not None:
+            if self.newer_than is not None and mtime < self.newer_than:
+                return False
+            if self.older_than is not None and mtime > self.older_than:
+                return False
+
+        return True
@@ -1,67 +1,222 @@
+import uuid
+from contextlib import nullcontext
+from datetime import datetime
+from functools import partial
+from operator import methodcaller
+from typing import Iterator
+from uuid import UUID
+
 from decouple import config
 from pydantic import ValidationError
+from sqlalchemy import delete, exists, insert
+from sqlmodel import Session, select
 
 from . import make_session
+
 from .commands import (
     RaiseExceptionCommand,
+    RecordToJournalCommand,
+    RefreshJobProgressCommand,
     UpdateItemStatusCommand,
     UpdateJobErrorCommand,
 )
-from .enum_types import ItemStatus, JobError, JobStatus
+from .async_agent import AsyncTransferAgent
+from .concurrency import AIMDController
+from .enum_types import ItemStatus, JobError, JobStatus, TransferOrder
 from .exceptions import (
     AuthenticationError,
     InitDuplicateJobException,
     InitException,
     InitSrcException,
+    JobNotParsedException,
+    TransferException,
 )
-from .models import Item, Job, Transaction
-from .query import JobQueryArgs, Query
+from .filters import Filter, FilterSpec
+from .journal import Journal
+from .lease import ItemLeases
+from .models import Item, Job, Part, Transaction
+from .process_agent import ProcessTransferAgent
+from .query import JobQueryArgs, Query, keyset_pages
+from .retry import RetryPolicy
 from .transfer_agent import TransferAgent
-from .utils import _match_file_extension
+from .utils import batched
 from .auth import VaultCredentials
+from .base import ScanEntry
+
+
+# bytes of files and parts held in memory by transfers at once
+MEMORY_BUDGET = config("FORW_SERV_MEMORY_BUDGET", default=1024**3, cast=int)
+
+
+def _make_agent(
+    make_writer,
+    n_threads: int,
+    checkpoint_every: int,
+    checkpoint_interval: float,
+    concurrency: AIMDController | None,
+    max_attempts: int,
+    memory_budget: int | None,
+    max_in_flight: int | None,
+    processes: int | None,
+) -> TransferAgent:
+    """
+    Agent sending local files to S3: threaded, or running on an event loop
+    when max_in_flight is given, within this process or, with processes,
+    within as many worker processes, which share the memory budget.
+    make_writer builds the writer from its class, S3Writer or AsyncS3Writer,
+    and must be picklable with processes.
+    """
+    from .file import FileSystemReader
+    from .s3 import AsyncS3Writer, S3Writer
+
+    if processes is not None:
+        make_worker_agent = partial(
+            _make_agent,
+            make_writer,
+            n_threads=n_threads,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            # workers make one attempt, retries are up to this process
+            concurrency=None,
+            max_attempts=1,
+            memory_budget=memory_budget // processes if memory_budget else None,
+            max_in_flight=max_in_flight,
+            processes=None,
+        )
+        return ProcessTransferAgent(
+            reader=FileSystemReader(),
+            writer=make_writer(S3Writer),
+            make_agent=make_worker_agent,
+            n_processes=processes,
+            max_in_flight_per_process=max_in_flight or 2 * n_threads,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            retry_policy=RetryPolicy(max_attempts),
+        )
+
+    if max_in_flight is not None:
+        return AsyncTransferAgent(
+            reader=FileSystemReader(),
+            writer=make_writer(AsyncS3Writer),
+            max_in_flight=max_in_flight,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            retry_policy=RetryPolicy(max_attempts),
+            memory_budget=memory_budget,
+        )
+
+    return TransferAgent(
+        reader=FileSystemReader(),
+        writer=make_writer(S3Writer),
+        n_threads=n_threads,
+        checkpoint_every=checkpoint_every,
+        checkpoint_interval=checkpoint_interval,
+        concurrency=concurrency,
+        retry_policy=RetryPolicy(max_attempts),
+        memory_budget=memory_budget,
+    )
+
+
+def _interleave(descending: Iterator, ascending: Iterator, key) -> Iterator:
+    """
+    Alternate the rows of two iterators over the same rows, in descending
+    and ascending order of key, until they meet, so that each row is
+    yielded once.
+    """
+    high = low = None
+    for row_desc, row_asc in zip(descending, ascending):
+        if low is not None and key(row_desc) <= low:
+            return
+        high = key(row_desc)
+        yield row_desc
+
+        if key(row_asc) >= high:
+            return
+        low = key(row_asc)
+        yield row_asc
 
 
 class JobManager:
+    parse_chunk_size = 10000
+    # items looked up at once when resuming a parse
+    lookup_chunk_size = 900
+    # items read at once from the database when running a job
+    page_size = 1000
+
     def __init__(
         self,
         session,
         transfer_agent: TransferAgent,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+        leases: ItemLeases | None = None,
     ):
         self.session = session
         self.transfer_agent = transfer_agent
+        self.order = order
+        # items are claimed under leases, when shared with other workers
+        self.leases = leases
 
     def run(self, job: Job) -> Job:
+        job = self._attach(job)
         if job.status == JobStatus.DONE:
             return job
 
         self._refresh_credentials(job)
+        if job.status < JobStatus.PARSED:
+            raise JobNotParsedException(
+                f"Job {job.id} is not parsed, resume it to parse its source."
+            )
 
-        items = [
-            item for item in job.items if item.status != ItemStatus.TRANSFERRED
-        ]
+        self._start_progress(job)
 
-        self._setup_commands()
-        transactions = [
-            Transaction(item_id=i.id, input=i.in_uri, output=i.out_uri)
-            for i in items
-        ]
-        self.transfer_agent.run(transactions)
-
-        if job.num_done_items() == len(job.items):
+        journal = self._setup_commands()
+        leases = (
+            self.leases.held(self.session.get_bind())
+            if self.leases is not None
+            else nullcontext()
+        )
+        with leases:
+            journal.start()
+            try:
+                self.transfer_agent.run(self._pending_transactions(job))
+            finally:
+                journal.close()
+                self.session.expire_all()
+
+        if not self._has_pending_items(job):
             job.status = JobStatus.DONE
 
         self.session.commit()
 
         return job
 
-    def init(self, source: str, destination: str, regexp: str = ".*") -> Job:
+    def init(
+        self,
+        source: str,
+        destination: str,
+        regexp: str = ".*",
+        filter_spec: FilterSpec | dict | None = None,
+        priority: int = 1,
+        max_transfers: int | None = None,
+    ) -> Job:
         """
         Performs basic checks on source and destination, checks for duplicates,
         and returns a Job instance for the next step(s).
+        priority and max_transfers apply when run along with other jobs,
+        see JobScheduler.
         """
         try:
+            if filter_spec is not None:
+                filter_spec = FilterSpec.parse_obj(filter_spec).to_dict()
             job = Job.validate(
-                {"source": source, "destination": destination, "regexp": regexp}
+                {
+                    "source": source,
+                    "destination": destination,
+                    "regexp": regexp,
+                    "filter_spec": filter_spec,
+                    "priority": priority,
+                    "max_transfers": max_transfers,
+                }
             )
         except ValidationError as e:
             raise InitException(e.errors)
@@ -84,58 +239,243 @@ class JobManager:
 
     def parse_and_commit_items(self, job: Job) -> Job:
         """
-        Builds a list of items to transfer by parsing source,
-        and commits items to database.
+        Builds items to transfer by parsing source, and commits them to
+        database in chunks of parse_chunk_size items, along with the number
+        of items parsed so far.
+        An interrupted parse continues where it left off.
         """
+        job = self._attach(job)
         if job.status >= JobStatus.PARSED:
             return job
 
         self._refresh_credentials(job)
 
         # parse source
-        in_uris = self._parse_source(
-            job.source,
-            files_only=True,
-            pattern_filter=job.regexp,
-            is_regex=True,
+        entries = self._parse_source(
+            job.source, files_only=True, filter=Filter.from_job(job)
         )
 
-        if job.destination[-1] == "/":
-            # concatenate in_uri name
-            out_uris = [
-                job.destination + in_uri.split("/")[-1] for in_uri in in_uris
-            ]
+        # items committed before are only looked up when resuming a parse
+        resuming = job.num_items > 0
+        for chunk in batched(entries, self.parse_chunk_size):
+            if resuming:
+                chunk = self._skip_committed_items(job, chunk)
+            self._insert_items(job, chunk)
+
+        job.status = JobStatus.PARSED
+        self.session.commit()
+
+        return job
+
+    def _attach(self, job: Job) -> Job:
+        """job as an instance of this session, e.g. when it was loaded by
+        another one"""
+        if job in self.session:
+            return job
+
+        return self.session.get(Job, job.id)
+
+    def _start_progress(self, job: Job) -> None:
+        """Recount progress of job, and reset the counters of this run"""
+        RefreshJobProgressCommand(self.session).execute([job.id])
+        self.session.refresh(job)
+        job.run_started_at = datetime.now()
+        job.run_done_bytes = 0
+        job.last_transfer_at = None
+        self.session.commit()
+
+    def _has_pending_items(self, job: Job) -> bool:
+        return self.session.query(
+            exists().where(
+                Item.job_id == job.id, Item.status != ItemStatus.TRANSFERRED
+            )
+        ).scalar()
+
+    def _pending_transactions(self, job: Job) -> Iterator[Transaction]:
+        """
+        Transactions of the items of job left to transfer, read from the
+        database page by page as they are consumed, so that transfers start
+        right away and memory does not grow with the number of items.
+        Rows are read as tuples, not ORM objects, and each page is read in
+        a database transaction of its own, so as not to hold back the
+        journal's writes. With leases, pages are the batches claimed.
+        """
+        if self.leases is not None:
+            pages = self.leases.claims(self.session, job, self.order)
+        else:
+            pages = batched(self._pending_items(job), self.page_size)
+
+        for rows in pages:
+            parts = self._load_parts([r.id for r in rows if r.upload_id])
+            self.session.commit()
+
+            for r in rows:
+                yield Transaction(
+                    item_id=r.id,
+                    input=r.in_uri,
+                    output=r.out_uri,
+                    upload_id=r.upload_id,
+                    parts=parts.get(r.id, []),
+                    size=r.size,
+                )
+
+    def _pending_items(self, job: Job) -> Iterator:
+        """
+        Pending items of job in self.order, with keyset pagination.
+        Items of unknown size come last when ordering by size.
+        """
+        pending = select(
+            Item.id, Item.in_uri, Item.out_uri, Item.upload_id, Item.size
+        ).where(Item.job_id == job.id, Item.status == ItemStatus.PENDING)
+
+        def pages(query, columns, descending=False):
+            for rows in keyset_pages(
+                self.session, query, columns, self.page_size, descending
+            ):
+                yield from rows
+
+        if self.order == TransferOrder.SCAN:
+            yield from pages(pending, [Item.in_uri])
+            return
+
+        sized = pending.where(Item.size.isnot(None))
+        by_size = [Item.size, Item.id]
+        if self.order == TransferOrder.LARGEST_FIRST:
+            yield from pages(sized, by_size, descending=True)
         else:
-            out_uris = [job.destination]
-
-        items = [
-            Item(
-                in_uri=in_uri,
-                out_uri=out_uri,
-                status=ItemStatus.PENDING,
-                job_id=job.id,
+            yield from _interleave(
+                pages(sized, by_size, descending=True),
+                pages(sized, by_size),
+                key=lambda r: (r.size, r.id),
+            )
+        yield from pages(pending.where(Item.size.is_(None)), [Item.in_uri])
+
+    def _load_parts(self, item_ids: list) -> dict[UUID, list[dict]]:
+        """Parts already sent of the multipart uploads of items"""
+        parts = {}
+        if not item_ids:
+            return parts
+
+        for part in self.session.execute(
+            select(Part.item_id, Part.part_number, Part.etag, Part.checksum)
+            .where(Part.item_id.in_(item_ids))
+            .order_by(Part.item_id, Part.part_number)
+        ):
+            parts.setdefault(part.item_id, []).append(
+                {
+                    "PartNumber": part.part_number,
+                    "ETag": part.etag,
+                    "ChecksumSHA256": part.checksum,
+                }
             )
-            for in_uri, out_uri in zip(in_uris, out_uris)
-        ]
 
-        self.session.add_all(items)
+        return parts
+
+    def _skip_committed_items(
+        self, job: Job, entries: list[ScanEntry]
+    ) -> list[ScanEntry]:
+        committed = set()
+        # within the bound parameters of a statement (999 for old SQLite)
+        for entries_chunk in batched(entries, self.lookup_chunk_size):
+            in_uris = [entry.uri for entry in entries_chunk]
+            committed.update(
+                self.session.execute(
+                    select(Item.in_uri).where(
+                        Item.job_id == job.id, Item.in_uri.in_(in_uris)
+                    )
+                ).scalars()
+            )
 
-        job.status = JobStatus.PARSED
+        return [entry for entry in entries if entry.uri not in committed]
+
+    def _insert_items(self, job: Job, entries: list[ScanEntry]) -> None:
+        """Insert items without building ORM objects, and commit"""
+        if len(entries) == 0:
+            return
+
+        now = datetime.now()
+        self.session.execute(
+            insert(Item),
+            [
+                {
+                    "id": uuid.uuid4(),
+                    "in_uri": entry.uri,
+                    "out_uri": self._make_out_uri(job, entry),
+                    "size": entry.size,
+                    "mtime": datetime.fromtimestamp(entry.mtime)
+                    if entry.mtime is not None
+                    else None,
+                    "status": ItemStatus.PENDING,
+                    "job_id": job.id,
+                    "created_at": now,
+                    "transferred_at": now,
+                }
+                for entry in entries
+            ],
+        )
+        job.num_items += len(entries)
+        job.num_bytes += sum(entry.size or 0 for entry in entries)
         self.session.commit()
 
-        return job
+    @staticmethod
+    def _make_out_uri(job: Job, entry: ScanEntry) -> str:
+        if job.destination[-1] == "/":
+            # mirror the directory structure of source
+            return job.destination + entry.path
+
+        return job.destination
 
     def resume(self, job: Job) -> Job:
+        job = self._attach(job)
         if job.status < JobStatus.DONE:
             job.error = JobError.NONE
             job.info = None
             self.session.commit()
+            # carries on with an interrupted parse, if any
+            self.parse_and_commit_items(job)
             self.run(job)
         else:
             print(f"Job {job.id} already done.")
 
         return job
 
+    def delete(self, job: Job) -> None:
+        """
+        Delete job and its items, aborting multipart uploads
+        left unfinished by its items.
+        """
+        self._refresh_credentials(job)
+
+        # only items with an upload, rather than all of them
+        uploads = self.session.execute(
+            select(Item.out_uri, Item.upload_id).where(
+                Item.job_id == job.id, Item.upload_id.isnot(None)
+            )
+        ).all()
+        for out_uri, upload_id in uploads:
+            try:
+                self.transfer_agent.writer.abort_multipart_upload(
+                    out_uri, upload_id
+                )
+            except TransferException as e:
+                # upload already completed, aborted or expired
+                print(f"Could not abort upload of {out_uri}: {e.error}")
+
+        # in bulk, as the cascade of the relationships loads every item
+        items = select(Item.id).where(Item.job_id == job.id)
+        self.session.execute(
+            delete(Part).where(Part.item_id.in_(items)),
+            execution_options={"synchronize_session": False},
+        )
+        self.session.execute(
+            delete(Item).where(Item.job_id == job.id),
+            execution_options={"synchronize_session": False},
+        )
+        # items loaded before are gone
+        self.session.expire(job, ["items"])
+        self.session.delete(job)
+        self.session.commit()
+
     def _source_exists(self, uri: str) -> bool:
         return self.transfer_agent.reader.exists(uri)
 
@@ -143,39 +483,38 @@ class JobManager:
         self,
         uri: str,
         files_only: bool = False,
-        pattern_filter: str = "*.*",
-        is_regex: bool = False,
-    ) -> list[str]:
-        list_ = self.transfer_agent.reader.list(uri, files_only=files_only)
-
-        list_ = [
-            item
-            for item in list_
-            if _match_file_extension(item, pattern_filter, is_regex)
-        ]
-        return list_
+        filter: Filter | None = None,
+    ) -> Iterator[ScanEntry]:
+        return self.transfer_agent.reader.scan(
+            uri, files_only=files_only, filter=filter
+        )
 
-    def _setup_commands(self) -> None:
+    def _setup_commands(self) -> Journal:
         """Assign commands to underlying transfer agent.
 
-        Depending on regime (sequential, threaded),
-        some commands will be skipped as threads cannot handle
-        committing to database and raising exceptions
+        Outcomes of transactions are recorded by a journal, i.e. a single
+        thread with its own session, which is returned (not started).
+        Depending on regime (sequential, threaded), exceptions are raised
+        right after a transaction, or at each checkpoint of the agent,
+        as threads cannot raise exceptions to the caller.
         """
         threaded = self.transfer_agent.n_threads > 1
 
-        self.transfer_agent.post_batch_commands = [
-            UpdateItemStatusCommand(self.session),
-            UpdateJobErrorCommand(self.session),
-            RaiseExceptionCommand(),
-        ]
+        session = Session(self.session.get_bind())
+        journal = Journal(
+            [UpdateItemStatusCommand(session), UpdateJobErrorCommand(session)],
+            session=session,
+        )
+
+        self.transfer_agent.post_batch_commands = [RaiseExceptionCommand()]
 
         self.transfer_agent.post_transaction_commands = [
-            UpdateItemStatusCommand(self.session, threaded),
-            UpdateJobErrorCommand(self.session, threaded),
+            RecordToJournalCommand(journal),
             RaiseExceptionCommand(threaded),
         ]
 
+        return journal
+
     def _refresh_credentials(self, job) -> None:
         try:
             self.transfer_agent.refresh_credentials()
@@ -187,66 +526,117 @@ class JobManager:
 
     @classmethod
     def local_to_s3(
-        cls, db_url: str = None, n_threads=30, split_ratio: float = 0.1
+        cls,
+        db_url: str = None,
+        n_threads=30,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        concurrency: AIMDController | None = None,
+        max_attempts: int = 5,
+        memory_budget: int | None = MEMORY_BUDGET,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+        max_in_flight: int | None = None,
+        processes: int | None = None,
+        lease_ttl: float | None = None,
     ):
-        from .file import FileSystemReader
-        from .s3 import S3Writer
-
-        writer = S3Writer.from_profile_name(
-            profile_name=config("FORW_SERV_AWS_PROFILE_NAME", "default")
-        )
-        agent = TransferAgent(
-            reader=FileSystemReader(),
-            writer=writer,
+        profile_name = config("FORW_SERV_AWS_PROFILE_NAME", "default")
+        agent = _make_agent(
+            methodcaller("from_profile_name", profile_name=profile_name),
             n_threads=n_threads,
-            split_ratio=split_ratio,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            memory_budget=memory_budget,
+            max_in_flight=max_in_flight,
+            processes=processes,
         )
 
         session = make_session(db_url)
-        job_manager = cls(session=session, transfer_agent=agent)
+        job_manager = cls(
+            session=session,
+            transfer_agent=agent,
+            order=order,
+            leases=ItemLeases(ttl=lease_ttl) if lease_ttl else None,
+        )
 
         return job_manager
 
     @classmethod
     def local_to_s3_auth(
-            cls, auth_client, db_url: str = None, n_threads=30, split_ratio: float = 0.1
+        cls,
+        auth_client,
+        db_url: str = None,
+        n_threads=30,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        concurrency: AIMDController | None = None,
+        max_attempts: int = 5,
+        memory_budget: int | None = MEMORY_BUDGET,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+        max_in_flight: int | None = None,
+        processes: int | None = None,
+        lease_ttl: float | None = None,
     ):
-        from .file import FileSystemReader
-        from .s3 import S3Writer
-
-        writer = S3Writer.from_auth_client(auth_client)
-        agent = TransferAgent(
-            reader=FileSystemReader(),
-            writer=writer,
+        agent = _make_agent(
+            methodcaller("from_auth_client", auth_client),
             n_threads=n_threads,
-            split_ratio=split_ratio,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            memory_budget=memory_budget,
+            max_in_flight=max_in_flight,
+            processes=processes,
         )
 
         session = make_session(db_url)
-        job_manager = cls(session=session, transfer_agent=agent)
+        job_manager = cls(
+            session=session,
+            transfer_agent=agent,
+            order=order,
+            leases=ItemLeases(ttl=lease_ttl) if lease_ttl else None,
+        )
 
         return job_manager
 
     @classmethod
     def local_to_s3_via_vault(
-            cls, db_url: str = None, n_threads=30, split_ratio: float = 0.1
+        cls,
+        db_url: str = None,
+        n_threads=30,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        concurrency: AIMDController | None = None,
+        max_attempts: int = 5,
+        memory_budget: int | None = MEMORY_BUDGET,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+        max_in_flight: int | None = None,
+        processes: int | None = None,
+        lease_ttl: float | None = None,
     ):
-        from .file import FileSystemReader
-        from .s3 import S3Writer
-
         auth_client = VaultCredentials(config('FORW_SERV_VAULT_URL'),
                                        config('FORW_SERV_VAULT_TOKEN_PATH'),
                                        config('FORW_SERV_VAULT_ROLE_ID'),
                                        config('FORW_SERV_VAULT_SECRET_ID'))
-        writer = S3Writer.from_auth_client(auth_client)
-        agent = TransferAgent(
-            reader=FileSystemReader(),
-            writer=writer,
+        agent = _make_agent(
+            methodcaller("from_auth_client", auth_client),
             n_threads=n_threads,
-            split_ratio=split_ratio,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            memory_budget=memory_budget,
+            max_in_flight=max_in_flight,
+            processes=processes,
         )
 
         session = make_session(db_url)
-        job_manager = cls(session=session, transfer_agent=agent)
+        job_manager = cls(
+            session=session,
+            transfer_agent=agent,
+            order=order,
+            leases=ItemLeases(ttl=lease_ttl) if lease_ttl else None,
+        )
 
         return job_manager
@@ -0,0 +1,111 @@
+import threading
+import time
+from queue import Empty, SimpleQueue
+
+from .commands import Command
+from .models import Transaction
+
+_STOP = object()
+
+
+class Journal:
+    """
+    Single writer of transfer outcomes to the database.
+
+    Worker threads put completed transactions on a queue, and a dedicated
+    thread hands them over to commands (e.g. UpdateItemStatusCommand) in
+    groups, at most every interval seconds, so that each group is written
+    in one database transaction and workers never wait for the database.
+
+    The commands should use a session of their own (session), that is not
+    used by other threads until the journal is closed. It is rolled back
+    when a command fails, and closed along with the journal.
+    """
+
+    def __init__(
+        self,
+        commands: list[Command],
+        session=None,
+        interval: float = 0.05,
+    ):
+        self.commands = commands
+        self.session = session
+        self.interval = interval
+        self.exception = None
+
+        self._queue = SimpleQueue()
+        self._thread = None
+
+    def put(self, transaction: Transaction) -> None:
+        self._queue.put(transaction)
+
+    def flush(self) -> None:
+        """Wait until the transactions put so far are written"""
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="journal", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Write remaining transactions and stop the writer thread.
+        Raises the first exception a command raised, if any.
+        """
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        if self.session is not None:
+            self.session.close()
+
+        if self.exception is not None:
+            exception, self.exception = self.exception, None
+            raise exception
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            group, stopped = self._next_group()
+            flushed = group and isinstance(group[-1], threading.Event)
+            written = group.pop() if flushed else None
+            if group:
+                self._write(group)
+            if written is not None:
+                written.set()
+
+    def _next_group(self) -> tuple[list[Transaction], bool]:
+        """Transactions received within interval seconds of the first one,
+        or until flushed"""
+        group = []
+        transaction = self._queue.get()
+        deadline = time.monotonic() + self.interval
+        while transaction is not _STOP:
+            group.append(transaction)
+            if isinstance(transaction, threading.Event):
+                # see flush
+                return group, False
+            try:
+                transaction = self._queue.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except Empty:
+                return group, False
+
+        return group, True
+
+    def _write(self, group: list[Transaction]) -> None:
+        try:
+            for cmd in self.commands:
+                cmd.execute(group)
+        except Exception as e:
+            if self.session is not None:
+                self.session.rollback()
+            if self.exception is None:
+                self.exception = e
@@ -0,0 +1,193 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator
+
+from sqlalchemy import or_, select, update
+from sqlmodel import Session
+
+from .enum_types import ItemStatus, TransferOrder
+from .models import Item, Job
+
+logger = logging.getLogger(__name__)
+
+
+class ItemLeases:
+    """
+    Leases of the pending items of jobs, so that several workers, e.g. on
+    several hosts sharing a PostgreSQL database, run the same job without
+    sending an item twice.
+
+    A worker (owner) claims the items it sends in batches of batch_size.
+    Rows being claimed by other workers are skipped rather than waited for
+    (SELECT ... FOR UPDATE SKIP LOCKED), and items leased to another owner
+    are skipped until their lease expires, ttl seconds after it was taken
+    or last renewed: the items of a worker that died are then claimed by
+    the others. Leases held are renewed every ttl / 3 seconds by a thread
+    of their own, and released at the end of the run.
+
+    Expiry times are in UTC, by the clock of each worker, which should be
+    synchronized (e.g. NTP) to well within ttl.
+    """
+
+    def __init__(
+        self,
+        owner: str | None = None,
+        ttl: float = 300.0,
+        batch_size: int = 100,
+    ):
+        assert ttl > 0, f"got ttl = {ttl}. Should be > 0"
+        assert batch_size >= 1, f"got batch_size = {batch_size}. Should be >= 1"
+        self.owner = owner or (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.ttl = ttl
+        self.batch_size = batch_size
+
+    def claims(
+        self,
+        session: Session,
+        job: Job,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+    ) -> Iterator[list]:
+        """Batches of pending items of job claimed as they are consumed,
+        until there are none left to claim"""
+        while batch := self.claim(session, job, order):
+            yield batch
+
+    def claim(
+        self,
+        session: Session,
+        job: Job,
+        order: TransferOrder = TransferOrder.LARGEST_FIRST,
+    ) -> list:
+        """
+        Lease up to batch_size pending items of job that are not leased,
+        or whose lease has expired, in order (mixed is taken as largest
+        first). Returns rows of the leased items, and commits.
+        """
+        expiry = self._expiry()
+        for statement, order_by in self._claim_statements(job, order, expiry):
+            num_leased = session.execute(statement).rowcount
+            if num_leased > 0:
+                break
+        else:
+            session.commit()
+            return []
+
+        rows = session.execute(
+            select(
+                Item.id, Item.in_uri, Item.out_uri, Item.upload_id, Item.size
+            )
+            .where(
+                Item.lease_owner == self.owner,
+                Item.lease_expires_at == expiry,
+            )
+            .order_by(*order_by)
+        ).all()
+        session.commit()
+
+        return rows
+
+    def _claim_statements(
+        self, job: Job, order: TransferOrder, expiry: datetime
+    ) -> list[tuple]:
+        """
+        Statements leasing a batch of items, tried in turn until one
+        leases some, along with the order of the batch.
+        Each one is a single UPDATE of the rows selected FOR UPDATE SKIP
+        LOCKED, which is atomic even where rows cannot be locked (SQLite).
+        """
+        now = datetime.utcnow()
+        claimable = select(Item.id).where(
+            Item.job_id == job.id,
+            Item.status == ItemStatus.PENDING,
+            or_(Item.lease_expires_at.is_(None), Item.lease_expires_at < now),
+        )
+
+        if order == TransferOrder.SCAN:
+            batches = [(claimable, (Item.in_uri,))]
+        else:
+            # items of unknown size last, as with unleased runs
+            batches = [
+                (
+                    claimable.where(Item.size.isnot(None)),
+                    (Item.size.desc(), Item.id.desc()),
+                ),
+                (claimable.where(Item.size.is_(None)), (Item.in_uri,)),
+            ]
+
+        return [
+            (
+                update(Item)
+                .where(
+                    Item.id.in_(
+                        query.order_by(*order_by)
+                        .limit(self.batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                )
+                .values(lease_owner=self.owner, lease_expires_at=expiry)
+                .execution_options(synchronize_session=False),
+                order_by,
+            )
+            for query, order_by in batches
+        ]
+
+    def renew(self, session: Session) -> int:
+        """Extend the leases of pending items held, returns their number"""
+        num_renewed = session.execute(
+            update(Item)
+            .where(
+                Item.lease_owner == self.owner,
+                Item.status == ItemStatus.PENDING,
+            )
+            .values(lease_expires_at=self._expiry())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+
+        return num_renewed
+
+    def release(self, session: Session) -> int:
+        """Give up the leases of items held, returns their number"""
+        num_released = session.execute(
+            update(Item)
+            .where(Item.lease_owner == self.owner)
+            .values(lease_owner=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+
+        return num_released
+
+    @contextmanager
+    def held(self, engine):
+        """Renew leases while in context, and release them on exit"""
+        stopped = threading.Event()
+
+        def heartbeat():
+            with Session(engine) as session:
+                while not stopped.wait(self.ttl / 3):
+                    try:
+                        self.renew(session)
+                    except Exception:
+                        session.rollback()
+                        logger.exception("could not renew leases")
+
+        thread = threading.Thread(target=heartbeat, name="leases", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
+            with Session(engine) as session:
+                self.release(session)
+
+    def _expiry(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.ttl)
@@ -4,14 +4,22 @@ from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from pydantic.networks import AnyUrl, FileUrl
-from sqlalchemy import JSON
+from sqlalchemy import JSON, Index
 from sqlmodel import Column, Enum, Field, Relationship, SQLModel
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from .enum_types import ItemStatus, JobError, JobStatus
+from .progress import format_eta, format_throughput
 
 
 class Job(SQLModel, table=True):
+    __table_args__ = (
+        # duplicate check of JobManager.init
+        Index("ix_job_source_destination", "source", "destination"),
+        # pages of jobs, most recent first (see Query)
+        Index("ix_job_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[UUID] = Field(
         default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False
     )
@@ -29,6 +37,34 @@ class Job(SQLModel, table=True):
     destination: AnyUrl
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
     regexp: str
+    # FilterSpec of items to transfer, see filters.py
+    filter_spec: Dict[Any, Any] | None = Field(
+        sa_column=Column(JSON), default=None
+    )
+    # items committed to database so far, and their total size
+    num_items: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    num_bytes: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # progress, kept up to date along with the status of items
+    num_done_items: int = Field(
+        default=0, sa_column_kwargs={"server_default": "0"}
+    )
+    num_done_bytes: int = Field(
+        default=0, sa_column_kwargs={"server_default": "0"}
+    )
+    # bytes sent since the start of the last run, and time of the last transfer
+    run_started_at: Optional[datetime] = None
+    run_done_bytes: int = Field(
+        default=0, sa_column_kwargs={"server_default": "0"}
+    )
+    last_transfer_at: Optional[datetime] = None
+    # when submitted to the daemon (see server.py), until its run ends
+    queued_at: Optional[datetime] = None
+    # share of the workers of the daemon, when running along with other
+    # jobs, and files sent at once at most (see JobScheduler)
+    priority: int = Field(
+        default=1, ge=1, sa_column_kwargs={"server_default": "1"}
+    )
+    max_transfers: Optional[int] = Field(default=None, ge=1)
     items: List["Item"] = Relationship(
         sa_relationship_kwargs={"cascade": "delete"}, back_populates="job"
     )
@@ -36,33 +72,59 @@ class Job(SQLModel, table=True):
     class Config:
         validate_assignment = True
 
-    def num_done_items(self):
-        return sum(
-            [item.status == ItemStatus.TRANSFERRED for item in self.items]
-        )
+    def throughput(self) -> float | None:
+        """Bytes per second sent in the last run"""
+        if self.run_started_at is None or self.last_transfer_at is None:
+            return None
+        elapsed = (self.last_transfer_at - self.run_started_at).total_seconds()
+        if elapsed <= 0:
+            return None
+        return self.run_done_bytes / elapsed
 
     def to_detailed_dict(self):
-        result = dict(self)
-        n_items = len(self.items)
-        done_items = self.num_done_items()
-        result["total_num_items"] = n_items
-        result["num_done_items"] = done_items
-        if n_items > 0:
-            result["progress"] = "{}%".format((done_items / n_items) * 100)
+        """Job fields along with its progress, read from the job record only"""
+        # loads expired attributes, unlike dict(self)
+        result = {name: getattr(self, name) for name in self.__fields__}
+        result["total_num_items"] = self.num_items
+        if self.num_bytes > 0:
+            progress = self.num_done_bytes / self.num_bytes
+            result["progress"] = "{:.1f}%".format(progress * 100)
+        elif self.num_items > 0:
+            progress = self.num_done_items / self.num_items
+            result["progress"] = "{:.1f}%".format(progress * 100)
         else:
             result["progress"] = "nan"
 
-        result.pop('_sa_instance_state', None)
+        throughput = self.throughput()
+        result["throughput"] = format_throughput(throughput)
+        result["eta"] = format_eta(
+            self.num_bytes - self.num_done_bytes, throughput
+        )
 
         return result
 
 
 class Item(SQLModel, table=True):
+    __table_args__ = (
+        # items of a job by status, pending ones by size (see JobManager)
+        Index("ix_item_job_id_status_size", "job_id", "status", "size", "id"),
+        # items of a job by input URI, to skip those already parsed
+        Index("ix_item_job_id_in_uri", "job_id", "in_uri"),
+        # pages of the items of a job (see Query)
+        Index("ix_item_job_id_id", "job_id", "id"),
+        # items leased to a worker (see ItemLeases)
+        Index("ix_item_lease_owner", "lease_owner"),
+    )
+
+    # indexed as the primary key
     id: Optional[UUID] = Field(
-        default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False
+        default_factory=uuid.uuid4, primary_key=True, nullable=False
     )
     in_uri: str
     out_uri: str
+    # as found when listing the source
+    size: Optional[int] = None
+    mtime: Optional[datetime] = None
 
     status: ItemStatus = Field(
         default=ItemStatus.PENDING, sa_column=Column(Enum(ItemStatus))
@@ -72,10 +134,53 @@ class Item(SQLModel, table=True):
     transferred_at: Optional[datetime] = Field(default_factory=datetime.now)
     job: Optional[Job] = Relationship(back_populates="items")
 
+    # transfer attempts so far, and error of the last failed one
+    attempts: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    last_error: Optional[str] = None
+
+    # multipart upload in progress, if any
+    upload_id: Optional[str] = None
+    parts: List["Part"] = Relationship(
+        sa_relationship_kwargs={"cascade": "all, delete-orphan"},
+        back_populates="item",
+    )
+
+    # worker sending the item, until when (UTC) unless renewed
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+
     class Config:
         validate_assignment = True
 
 
+class Part(SQLModel, table=True):
+    """Part of a multipart upload already sent for an item"""
+
+    id: Optional[UUID] = Field(
+        default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False
+    )
+    item_id: UUID = Field(default=None, foreign_key="item.id", index=True)
+    part_number: int
+    etag: str
+    checksum: Optional[str] = None
+    item: Optional[Item] = Relationship(back_populates="parts")
+
+    @classmethod
+    def from_dict(cls, part: dict):
+        return cls(
+            part_number=part["PartNumber"],
+            etag=part["ETag"],
+            checksum=part.get("ChecksumSHA256"),
+        )
+
+    def to_dict(self):
+        return {
+            "PartNumber": self.part_number,
+            "ETag": self.etag,
+            "ChecksumSHA256": self.checksum,
+        }
+
+
 @dataclass
 class Transaction:
     item_id: str | None = None
@@ -83,3 +188,11 @@ class Transaction:
     output: str | None = None
     success: bool = False
     exception = None
+    # multipart upload id and parts already sent, as returned by the writer
+    upload_id: str | None = None
+    parts: list[dict] = field(default_factory=list)
+    # attempts made in the current run, and whether a failed one is retried
+    attempts: int = 0
+    retry: bool = False
+    # size of the file, when known, e.g. to share workers among jobs
+    size: int | None = None
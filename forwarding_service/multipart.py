@@ -0,0 +1,71 @@
+from threading import Lock
+
+from .models import Transaction
+
+
+class MultipartTransfer:
+    """
+    State of the multipart upload of one transaction,
+    shared by the threads that send its parts.
+
+    Parts are recorded on transaction.parts as they complete, so that
+    an interrupted upload can be resumed from transaction.upload_id.
+    """
+
+    def __init__(self, transaction: Transaction, size: int, part_size: int):
+        self.transaction = transaction
+        self.ranges = {
+            part_number: (offset, min(part_size, size - offset))
+            for part_number, offset in enumerate(
+                range(0, size, part_size), start=1
+            )
+        }
+        self.pending = list(self.ranges)
+        self._num_remaining = len(self.pending)
+        self._lock = Lock()
+
+    @property
+    def upload_id(self) -> str:
+        return self.transaction.upload_id
+
+    @property
+    def parts(self) -> list[dict]:
+        return self.transaction.parts
+
+    @property
+    def failed(self) -> bool:
+        return self.transaction.exception is not None
+
+    def resume(self, parts: list[dict]) -> bool:
+        """
+        Skip parts already uploaded, as listed by the writer.
+        Returns False if they do not match the current part layout,
+        in which case the upload cannot be resumed.
+        """
+        for part in parts:
+            offset_length = self.ranges.get(part["PartNumber"])
+            if offset_length is None or offset_length[1] != part["Size"]:
+                return False
+
+        done = {part["PartNumber"] for part in parts}
+        self.transaction.parts = [
+            {k: v for k, v in part.items() if k != "Size"} for part in parts
+        ]
+        self.pending = [n for n in self.ranges if n not in done]
+        self._num_remaining = len(self.pending)
+
+        return True
+
+    def part_done(self, part: dict | None = None, exception=None) -> bool:
+        """
+        Record the outcome of one part.
+        Returns True for the last one, i.e. when the upload can be completed.
+        """
+        with self._lock:
+            if part is not None:
+                self.parts.append(part)
+            if exception is not None and not self.failed:
+                self.transaction.exception = exception
+            self._num_remaining -= 1
+
+            return self._num_remaining == 0
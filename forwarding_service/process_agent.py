@@ -0,0 +1,268 @@
+import itertools
+import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+from multiprocessing.connection import wait
+from typing import Callable, Iterable
+
+from .commands import Command
+from .exceptions import TransferException
+from .models import Transaction
+from .reader_writer import BaseReader, BaseWriter
+from .retry import RetryPolicy
+from .transfer_agent import TransferAgent
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+
+class ProcessTransferAgent(TransferAgent):
+    """
+    TransferAgent sharding transactions over n_processes worker processes,
+    for links faster than one interpreter can feed, as checksums, request
+    signing and printing all hold its GIL.
+
+    Each worker builds an agent of its own with make_agent, i.e. its own
+    reader, writer and S3 session. A transaction goes to the worker with
+    the fewest in flight, up to max_in_flight_per_process at once, so that
+    a slow worker does not hold back the others. Workers are spawned, so
+    make_agent must be picklable, e.g. a function of a module, or a
+    functools.partial of one.
+
+    Workers make a single attempt of each transaction and send back its
+    outcome. Commands, checkpoints and retries run in this process, which
+    therefore alone writes to the database: a retried transaction goes to
+    whichever worker is free. Each worker has a queue and a pipe of its
+    own, as one exiting unexpectedly could leave the locks of shared ones
+    held: its transactions in flight fail (and are retried), and it is
+    replaced.
+
+    reader and writer are used by this process only, e.g. to refresh
+    credentials or abort the uploads of a deleted job.
+    """
+
+    def __init__(
+        self,
+        reader: BaseReader,
+        writer: BaseWriter,
+        make_agent: Callable[[], TransferAgent],
+        n_processes: int = 2,
+        max_in_flight_per_process: int = 60,
+        post_transaction_commands: list[Command] = [],
+        post_batch_commands: list[Command] = [],
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        retry_policy: RetryPolicy | None = None,
+        start_method: str = "spawn",
+    ):
+        assert (
+            n_processes >= 1
+        ), f"got n_processes = {n_processes}. Should be >= 1"
+        super().__init__(
+            reader=reader,
+            writer=writer,
+            post_transaction_commands=post_transaction_commands,
+            post_batch_commands=post_batch_commands,
+            n_threads=n_processes * max_in_flight_per_process,
+            checkpoint_every=checkpoint_every,
+            checkpoint_interval=checkpoint_interval,
+            retry_policy=retry_policy,
+        )
+        self.make_agent = make_agent
+        self.n_processes = n_processes
+        self.start_method = start_method
+
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = []
+        # workers, and the transactions sent to them
+        self._workers_lock = threading.Lock()
+        self._keys = itertools.count()
+        self._stopping = False
+
+    @property
+    def max_in_flight(self) -> int:
+        return self.n_threads
+
+    def run(self, transactions: Iterable[Transaction]) -> None:
+        """See TransferAgent.run. Workers are started and stopped with it"""
+        self._stopping = False
+        self._workers = [
+            _Worker(self._context, self.make_agent)
+            for _ in range(self.n_processes)
+        ]
+        receiver = threading.Thread(
+            target=self._receive, name="receiver", daemon=True
+        )
+        receiver.start()
+        try:
+            super().run(transactions)
+        finally:
+            self._stopping = True
+            with self._workers_lock:
+                workers = list(self._workers)
+            for worker in workers:
+                worker.stop()
+            receiver.join()
+            self._workers = []
+
+    def metrics(self) -> dict:
+        """Workers log their own metrics"""
+        return {"processes": self.n_processes}
+
+    def _get_pool(self) -> None:
+        return None
+
+    def _submit(self, fn, *args) -> None:
+        """Send the transaction of _transfer_one to the least busy worker"""
+        (transaction,) = args
+        key = next(self._keys)
+        with self._workers_lock:
+            worker = min(self._workers, key=lambda w: len(w.sent))
+            worker.sent[key] = transaction
+        worker.tasks.put((key, transaction))
+
+    def _receive(self) -> None:
+        """Finish transactions as their outcome comes back from workers,
+        until all workers have stopped"""
+        while True:
+            with self._workers_lock:
+                connections = {w.results: w for w in self._workers}
+            if not connections:
+                return
+
+            for connection in wait(list(connections), timeout=1.0):
+                worker = connections[connection]
+                try:
+                    key, result = pickle.loads(connection.recv_bytes())
+                except EOFError:
+                    self._exited(worker)
+                    continue
+
+                with self._workers_lock:
+                    transaction = worker.sent.pop(key)
+                transaction.success = result.success
+                transaction.exception = result.exception
+                transaction.upload_id = result.upload_id
+                transaction.parts = result.parts
+                self._finish_reported(transaction)
+
+    def _exited(self, worker: "_Worker") -> None:
+        """Forget a worker that exited, once its results are all read.
+        Unless stopping, replace it and fail its transactions in flight"""
+        worker.process.join()
+        worker.results.close()
+        with self._workers_lock:
+            index = self._workers.index(worker)
+            if self._stopping:
+                self._workers.pop(index)
+                return
+            self._workers[index] = _Worker(self._context, self.make_agent)
+
+        logger.error(
+            "transfer worker %d exited with code %d",
+            worker.process.pid,
+            worker.process.exitcode,
+        )
+        worker.discard()
+        for transaction in worker.sent.values():
+            transaction.success = False
+            transaction.exception = TransferException(
+                error="worker process exited with code "
+                f"{worker.process.exitcode}",
+                operation="",
+            )
+            self._finish_reported(transaction)
+
+    def _finish_reported(self, transaction: Transaction) -> None:
+        """_finish, on the receiver thread, which must go on whatever the
+        commands raise, as worker threads of TransferAgent do"""
+        try:
+            self._finish(transaction)
+        except Exception:
+            logger.exception("command failed on %s", transaction.input)
+
+
+class _Worker:
+    """Worker process, with its queue of transactions to send, the pipe of
+    their outcomes, and those in flight, by key"""
+
+    def __init__(self, context, make_agent):
+        self.tasks = context.Queue()
+        self.results, results = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_work,
+            args=(make_agent, self.tasks, results, _package_logger().level),
+            daemon=True,
+        )
+        self.process.start()
+        # so that reading results fails (EOFError) once the worker exits
+        results.close()
+        self.sent = {}
+
+    def stop(self) -> None:
+        """Let the worker finish and exit, its results are read until EOF"""
+        self.tasks.put(_STOP)
+
+    def discard(self) -> None:
+        """Give up the queue of a worker that exited unexpectedly"""
+        self.tasks.cancel_join_thread()
+        self.tasks.close()
+
+
+class _ReportCommand(Command):
+    """Send the outcome of transactions of a worker back to the parent"""
+
+    def __init__(self, results, keys: dict):
+        self.results = results
+        self.keys = keys
+        self.lock = threading.Lock()
+
+    def execute(self, transaction: Transaction):
+        key = self.keys.pop(id(transaction))
+        try:
+            message = pickle.dumps((key, transaction))
+            pickle.loads(message)
+        except Exception:
+            # exceptions of some libraries do not survive pickling
+            e = transaction.exception
+            transaction.exception = TransferException(
+                error=f"{type(e).__name__}: {e}", operation=""
+            )
+            message = pickle.dumps((key, transaction))
+        # sent by the threads of the worker's agent
+        with self.lock:
+            self.results.send_bytes(message)
+
+
+def _work(make_agent, tasks, results, log_level: int) -> None:
+    """Transfer transactions of tasks, until told to stop"""
+    # interrupts are for the parent, which lets transfers in flight finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig()
+    _package_logger().setLevel(log_level)
+
+    agent = make_agent()
+    keys = {}
+    agent.post_transaction_commands = [_ReportCommand(results, keys)]
+    agent.post_batch_commands = []
+    agent.retry_policy = None
+
+    def receive():
+        while (task := tasks.get()) is not _STOP:
+            key, transaction = task
+            keys[id(transaction)] = key
+            yield transaction
+
+    try:
+        agent.run(receive())
+    finally:
+        agent.close()
+        results.close()
+
+
+def _package_logger() -> logging.Logger:
+    """Logger of the app, whose level is set apart from the root's"""
+    return logging.getLogger(__name__.rpartition(".")[0])
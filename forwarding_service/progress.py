@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+MiB = 1024 * 1024
+
+
+def format_throughput(throughput: float | None) -> str | None:
+    if throughput is None:
+        return None
+    return f"{throughput / MiB:.1f} MiB/s"
+
+
+def format_eta(remaining_bytes: int, throughput: float | None) -> str | None:
+    """Time left at throughput, e.g. '1:02:03'"""
+    if remaining_bytes <= 0 or not throughput:
+        return None
+    return str(timedelta(seconds=round(remaining_bytes / throughput)))
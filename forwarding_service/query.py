@@ -1,7 +1,11 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
 from uuid import UUID
 
-from pydantic import BaseModel, validate_arguments
+from pydantic import BaseModel, parse_obj_as, validate_arguments
+from pydantic.json import pydantic_encoder
+from sqlalchemy import and_, exists, or_, tuple_
 from sqlmodel import Session
 
 from .enum_types import ItemStatus, JobError, JobStatus
@@ -9,10 +13,65 @@ from .models import Job
 from .utils import check_field_exists, filter_table
 
 
+def keyset_pages(
+    session: Session,
+    query,
+    columns: list,
+    page_size: int = 1000,
+    descending: bool = False,
+):
+    """
+    Yield the rows of select query page by page, ordered on columns,
+    which must identify rows uniquely and be selected by query.
+    Each page starts after the last row of the previous one (keyset
+    pagination), so that fetching a page does not depend on how many
+    rows came before it, unlike with OFFSET.
+    """
+    order = [c.desc() if descending else c.asc() for c in columns]
+
+    key = None
+    while True:
+        page = query
+        if key is not None:
+            page = page.where(_after(columns, key, descending))
+
+        rows = session.execute(page.order_by(*order).limit(page_size)).all()
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+
+        key = [getattr(rows[-1], c.key) for c in columns]
+
+
+def _after(columns: list, key: list, descending: bool = False):
+    """Condition on rows that come after key, in the order of columns"""
+    if len(columns) > 1:
+        position, key = tuple_(*columns), tuple(key)
+    else:
+        position, key = columns[0], key[0]
+
+    return position < key if descending else position > key
+
+
+def _after_nulls_last(columns: list, key: list, descending: bool = False):
+    """_after, where the first of columns is nullable and ordered with
+    NULLs last, as comparisons with NULL are never true"""
+    column, value = columns[0], key[0]
+    tie = _after(columns[1:], key[1:], descending)
+    if value is None:
+        return and_(column.is_(None), tie)
+
+    beyond = column < value if descending else column > value
+    return or_(beyond, and_(column == value, tie), column.is_(None))
+
+
 class QueryArgs(BaseModel):
     id: UUID | None = None
     limit: int = 50
     sort_on: str | None = None
+    # token of the next page, as returned by Query.page
+    after: str | None = None
     source: str | None = None
     destination: str | None = None
 
@@ -30,12 +89,34 @@ class ItemQueryArgs(QueryArgs):
 
 
 class Query:
+    """
+    Jobs or items (model) matching query arguments, page by page.
+
+    Objects are ordered on sort_on (most recent first), then on id, which
+    is the only order when sort_on is not set. A page starts after the
+    last object of the previous one, given by an opaque token (keyset
+    pagination), so that the cost of a page does not depend on how many
+    came before it. Objects whose sort_on is NULL come last.
+    """
+
     def __init__(self, session: Session, model: BaseModel):
         self.session = session
         self.model = model
 
     @validate_arguments
     def get(self, query_args: QueryArgs | None = QueryArgs()):
+        objects, _ = self.page(query_args)
+
+        return objects
+
+    @validate_arguments
+    def page(
+        self, query_args: QueryArgs | None = QueryArgs()
+    ) -> tuple[list, str | None]:
+        """
+        Up to limit objects after query_args.after, and the token of the
+        next page, None if this page is the last one.
+        """
         check_field_exists(self.model, query_args.sort_on)
 
         query = filter_table(
@@ -44,24 +125,57 @@ class Query:
             **dict(query_args),
         )
 
-        if query_args.sort_on is not None:
-            field = getattr(Job, query_args.sort_on)
-            query = query.order_by(field.desc())
+        columns = [self.model.id]
+        if query_args.sort_on not in (None, "id"):
+            columns.insert(0, getattr(self.model, query_args.sort_on))
+        descending = query_args.sort_on is not None
+        order = [c.desc() if descending else c.asc() for c in columns]
+        after = _after
+        if len(columns) > 1 and columns[0].expression.nullable:
+            order.insert(0, columns[0].is_(None))
+            after = _after_nulls_last
 
-        query = query.limit(query_args.limit)
+        if query_args.after is not None:
+            key = self._decode(query_args.after, columns)
+            query = query.filter(after(columns, key, descending))
 
-        objects = query.all()[::-1]
+        query = query.order_by(*order).limit(query_args.limit)
 
-        return objects
+        objects = query.all()
 
-    @validate_arguments
-    def exists(self, id: UUID):
-        count = self.session.query(self.model).count()
+        after = None
+        if objects and len(objects) == query_args.limit:
+            after = self._encode(objects[-1], columns)
 
-        if count > 0:
-            return True
+        return objects, after
 
-        return False
+    @validate_arguments
+    def exists(self, id: UUID) -> bool:
+        return self.session.query(
+            exists().where(self.model.id == id)
+        ).scalar()
+
+    def _encode(self, obj, columns: list) -> str:
+        key = [getattr(obj, c.key) for c in columns]
+        return urlsafe_b64encode(
+            json.dumps(key, default=pydantic_encoder).encode()
+        ).decode()
+
+    def _decode(self, token: str, columns: list) -> list:
+        try:
+            key = json.loads(urlsafe_b64decode(token.encode()))
+            assert len(key) == len(columns)
+            return [
+                parse_obj_as(self.model.__fields__[c.key].outer_type_, value)
+                if value is not None
+                else None
+                for c, value in zip(columns, key)
+            ]
+        except Exception:
+            raise ValueError(
+                f"invalid page token {token!r} for {self.model.__name__} "
+                "with these query arguments"
+            )
 
     @validate_arguments
     def delete(self, query_args: QueryArgs | None = QueryArgs()):
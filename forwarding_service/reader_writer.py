@@ -2,6 +2,58 @@ import hashlib
 from base64 import b64encode
 
 from .base import BaseReader, BaseWriter
+from .exceptions import CheckSumException
+
+
+class HashingStream:
+    """
+    Wraps a readable stream and updates a SHA-256 digest with the bytes
+    read through it, so that the checksum is computed while the writer
+    consumes the data instead of in a separate pass.
+
+    Bytes are hashed once, in order: seeking back (e.g. when a request
+    is retried) and re-reading does not alter the digest.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._hash = hashlib.sha256()
+        self._num_hashed = 0
+
+    def read(self, size=-1):
+        position = self.stream.tell()
+        data = self.stream.read(size)
+
+        start = self._num_hashed - position
+        if 0 <= start < len(data):
+            self._hash.update(data[start:])
+            self._num_hashed += len(data) - start
+
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.stream.seek(offset, whence)
+
+    def tell(self):
+        return self.stream.tell()
+
+    def close(self):
+        self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def num_hashed(self) -> int:
+        return self._num_hashed
+
+    @property
+    def checksum(self) -> str:
+        """Base64 encoded SHA-256 digest of the bytes read so far"""
+        return b64encode(self._hash.digest()).decode()
 
 
 class ReaderWriter:
@@ -15,21 +67,29 @@ class ReaderWriter:
         self.writer = writer
         self.do_checksum = do_checksum
 
-    @staticmethod
-    def compute_sha256_checksum(bytes_) -> str:
-        checksum = hashlib.sha256(bytes_.getbuffer())
-        checksum = b64encode(checksum.digest()).decode()
-        return checksum
-
     def send(self, in_uri: str, out_uri: str) -> None:
         print(f"{in_uri} -> {out_uri}")
         bytes_, type_ = self.reader(in_uri)
 
-        checksum = None
-        if self.do_checksum:
-            checksum = self.compute_sha256_checksum(bytes_)
+        with HashingStream(bytes_) as stream:
+            remote_checksum = self.writer(stream, out_uri, type_)
+
+            if self.do_checksum:
+                self.verify_checksum(stream, remote_checksum)
+
+    @staticmethod
+    def verify_checksum(stream: HashingStream, remote_checksum: str | None):
+        """Compare the checksum of what was read with the one reported
+        by the destination, if any."""
+        if remote_checksum is None:
+            return
 
-        self.writer(bytes_, out_uri, type_, checksum)
+        if remote_checksum != stream.checksum:
+            raise CheckSumException(
+                error=f"Expected checksum {stream.checksum}, "
+                f"destination reported {remote_checksum}",
+                operation="checksum",
+            )
 
     def refresh_credentials(self) -> None:
         self.reader.refresh_credentials()
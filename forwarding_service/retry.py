@@ -0,0 +1,45 @@
+import random
+
+from .exceptions import AuthenticationError, RemoteException
+from .models import Transaction
+
+
+class RetryPolicy:
+    """
+    Retries of failed transfers, up to max_attempts attempts per item and run.
+
+    The n-th retry waits for a random delay between 0 and
+    base_delay * 2**(n - 1) seconds, capped at max_delay ("full jitter"),
+    so that items throttled together are not retried together.
+
+    Only errors of the remote (e.g. throttling, network errors, checksum
+    mismatches) are retried, other errors (missing file, credentials)
+    would fail again.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        assert (
+            max_attempts >= 1
+        ), f"got max_attempts = {max_attempts}. Should be >= 1"
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, transaction: Transaction) -> bool:
+        e = transaction.exception
+        return (
+            not transaction.success
+            and transaction.attempts < self.max_attempts
+            and isinstance(e, RemoteException)
+            and not isinstance(e, AuthenticationError)
+        )
+
+    def delay(self, attempts: int) -> float:
+        """Seconds to wait before the attempt following attempts ones"""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return random.uniform(0, cap)
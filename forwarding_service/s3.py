@@ -1,31 +1,243 @@
+import queue
+import time
+from contextlib import contextmanager
+from threading import Lock
 from urllib.parse import urlparse
 
 import boto3
 from aws_error_utils import get_aws_error_info
 from botocore.client import ClientError as BotoClientError
+from botocore.config import Config
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError
+from decouple import config
 
 from .base import BaseWriter
-from .exceptions import TransferException
+from .exceptions import (
+    CheckSumException,
+    RemoteException,
+    ThrottleException,
+    TransferException,
+)
+from .utils import composite_checksum, sha256_checksum, stream_size
+
+MiB = 1024 * 1024
+
+# S3 limits on multipart uploads
+MIN_PART_SIZE = 5 * MiB
+MAX_NUM_PARTS = 10000
+
+MULTIPART_THRESHOLD = config(
+    "FORW_SERV_MULTIPART_THRESHOLD", default=64 * MiB, cast=int
+)
+PART_SIZE = config("FORW_SERV_PART_SIZE", default=16 * MiB, cast=int)
+
+# Connections to S3, shared by the threads of a writer
+CONNECT_TIMEOUT = config("FORW_SERV_S3_CONNECT_TIMEOUT", default=10, cast=float)
+READ_TIMEOUT = config("FORW_SERV_S3_READ_TIMEOUT", default=60, cast=float)
+MAX_ATTEMPTS = config("FORW_SERV_S3_MAX_ATTEMPTS", default=5, cast=int)
+
+# errors of requests rejected for exceeding the request rate
+THROTTLE_CODES = {
+    "SlowDown",
+    "ServiceUnavailable",
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+}
+
+
+def transfer_config(max_concurrency: int) -> Config:
+    """
+    botocore configuration of a client shared by max_concurrency threads:
+    one pooled connection per thread, kept alive between requests, so that
+    threads neither wait for a connection nor reconnect for each request.
+    """
+    return Config(
+        max_pool_connections=max_concurrency,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={"max_attempts": MAX_ATTEMPTS, "mode": "standard"},
+    )
+
+
+class ConnectionPoolMetrics:
+    """
+    Use of the HTTP connection pools of botocore clients:
+    - requests: connections taken from a pool, one per request
+    - connections: connections opened, the others being reused
+    - discarded: connections closed on release, the pool being full
+    - wait_time: seconds spent getting a connection from a pool
+    - connect_time: seconds spent opening connections
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.discarded = 0
+        self.wait_time = 0.0
+        self.connect_time = 0.0
+        self._lock = Lock()
+
+    @property
+    def reused(self) -> int:
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        return self.reused / self.requests if self.requests else 0.0
+
+    def add(self, **counts) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reuse_ratio, 3),
+            "discarded": self.discarded,
+            "wait_time": round(self.wait_time, 3),
+            "connect_time": round(self.connect_time, 3),
+        }
+
+    def instrument(self, client) -> None:
+        """
+        Record the use of the connection pools of a botocore client.
+        Pools are created on the first request to each host, so this must
+        be called before the client is used. Clients without an HTTP
+        session (e.g. mocks) are left as they are.
+        """
+        endpoint = getattr(client, "_endpoint", None)
+        http_session = getattr(endpoint, "http_session", None)
+        manager = getattr(http_session, "_manager", None)
+        if manager is None:
+            return
+
+        manager.pool_classes_by_scheme = {
+            scheme: self._pool_class(pool_class)
+            for scheme, pool_class in manager.pool_classes_by_scheme.items()
+        }
+
+    def _pool_class(self, pool_class):
+        metrics = self
+
+        class Connection(pool_class.ConnectionCls):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                finally:
+                    metrics.add(
+                        connections=1, connect_time=time.perf_counter() - start
+                    )
+
+        class Pool(pool_class):
+            ConnectionCls = Connection
+
+            def _get_conn(self, timeout=None):
+                start = time.perf_counter()
+                conn = super()._get_conn(timeout)
+                metrics.add(requests=1, wait_time=time.perf_counter() - start)
+                return conn
+
+            def _put_conn(self, conn):
+                if self.pool is not None:
+                    try:
+                        self.pool.put(conn, block=False)
+                        return
+                    except queue.Full:
+                        metrics.add(discarded=1)
+                super()._put_conn(conn)
+
+        Pool.__name__ = f"Instrumented{pool_class.__name__}"
+        return Pool
 
 
 class S3Writer(BaseWriter):
-    def __init__(self, session, *args, **kwargs):
+    """
+    Writes streams to S3.
+    Objects smaller than multipart_threshold are sent with a single PUT,
+    larger ones are read and uploaded part by part, so that at most
+    one part is held in memory at a time.
+
+    Single PUTs let botocore checksum the body as it is sent and return
+    the SHA-256 checksum S3 computed. Each part of a multipart upload is
+    hashed once in memory and sent with its checksum, which S3 verifies
+    on receipt. Completed uploads are checked against the composite
+    checksum (checksum of part checksums) reported by S3.
+
+    Besides the sequential multipart upload of __call__, the multipart
+    operations are exposed so that parts of one object can be sent
+    concurrently (see TransferAgent).
+
+    The client is shared by all threads, its connection pool being sized
+    for max_concurrency of them (see set_concurrency). The use of the pool
+    is recorded in metrics.
+    """
+
+    def __init__(
+        self,
+        session,
+        multipart_threshold: int = MULTIPART_THRESHOLD,
+        part_size: int = PART_SIZE,
+        max_concurrency: int = 10,
+        *args,
+        **kwargs,
+    ):
+        assert (
+            part_size >= MIN_PART_SIZE
+        ), f"got part_size = {part_size}. Should be >= {MIN_PART_SIZE}"
+
         self.session = session
-        self.client = self.session.client('s3')
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.metrics = ConnectionPoolMetrics()
+        self.max_concurrency = 0
+        self.set_concurrency(max_concurrency)
 
     @classmethod
-    def from_profile_name(cls, profile_name):
+    def from_profile_name(cls, profile_name, **kwargs):
         session = boto3.Session(profile_name=profile_name)
-        self.client = session.client('s3')
+        return cls(session, **kwargs)
 
     @classmethod
-    def from_auth_client(cls, auth_client):
+    def from_auth_client(cls, auth_client, **kwargs):
         creds = auth_client.get_credentials()
         session = boto3.Session(aws_access_key_id=creds['aws_access_key_id'],
                                    aws_secret_access_key=creds['aws_secret_access_key'])
-        writer = cls(session)
+        writer = cls(session, **kwargs)
         return writer
 
+    def set_concurrency(self, n: int) -> None:
+        """
+        Size the connection pool for n concurrent requests.
+        The pool only grows: a new client is built when n exceeds the
+        current size, which must not happen while requests are running.
+        """
+        if n <= self.max_concurrency:
+            return
+
+        self.max_concurrency = n
+        self.client = self.session.client("s3", config=transfer_config(n))
+        self.metrics.instrument(self.client)
+
+    def use_multipart(self, size: int) -> bool:
+        return size >= self.multipart_threshold
+
+    def get_part_size(self, size: int) -> int:
+        """Part size for an object of size bytes, grown (by whole MiBs)
+        when needed to stay under the maximum number of parts"""
+        min_part_size = -(-size // MAX_NUM_PARTS)
+        if min_part_size <= self.part_size:
+            return self.part_size
+
+        return -(-min_part_size // MiB) * MiB
+
     def __call__(
         self,
         bytes_,
@@ -33,20 +245,359 @@ class S3Writer(BaseWriter):
         mime_type=None,
         checksum=None,
     ):
-        uri = urlparse(uri)
+        """
+        Upload stream to uri.
+        If given, checksum is the expected SHA-256 of the whole object.
 
-        try:
-            return self.client.put_object(
+        Returns the SHA-256 checksum of the object reported by S3,
+        or None for multipart uploads, whose parts are verified one by one.
+        """
+        if self.use_multipart(stream_size(bytes_)):
+            self._upload_multipart(bytes_, uri, mime_type)
+            return None
+
+        bucket, key = self._split_uri(uri)
+        checksum = {"ChecksumSHA256": checksum} if checksum else {}
+        with self._translate_errors():
+            response = self.client.put_object(
                 Body=bytes_,
-                Bucket=uri.netloc,
-                Key=uri.path[1:],
+                Bucket=bucket,
+                Key=key,
+                ContentType=mime_type if mime_type else '',
+                ChecksumAlgorithm="SHA256",
+                **checksum,
+            )
+        return response.get("ChecksumSHA256")
+
+    def create_multipart_upload(self, uri, mime_type=None) -> str:
+        """Start a multipart upload to uri and return its id"""
+        bucket, key = self._split_uri(uri)
+        with self._translate_errors():
+            response = self.client.create_multipart_upload(
+                Bucket=bucket,
+                Key=key,
                 ContentType=mime_type if mime_type else '',
                 ChecksumAlgorithm="SHA256",
+            )
+        return response["UploadId"]
+
+    def upload_part(self, body: bytes, uri, upload_id, part_number) -> dict:
+        """
+        Upload one part along with its SHA-256 checksum.
+        Returns the part as expected by complete_multipart_upload.
+        """
+        bucket, key = self._split_uri(uri)
+        checksum = sha256_checksum(body)
+        with self._translate_errors():
+            response = self.client.upload_part(
+                Body=body,
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                ChecksumAlgorithm="SHA256",
                 ChecksumSHA256=checksum,
             )
+        return {
+            "PartNumber": part_number,
+            "ETag": response["ETag"],
+            "ChecksumSHA256": checksum,
+        }
+
+    def complete_multipart_upload(self, uri, upload_id, parts: list[dict]):
+        """
+        Assemble uploaded parts into the final object, and check the
+        composite (checksum of part checksums) SHA-256 reported by S3.
+        """
+        bucket, key = self._split_uri(uri)
+        parts = self._sorted_parts(parts)
+        with self._translate_errors():
+            response = self.client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+
+        self._check_composite_checksum(parts, response)
+
+    def list_parts(self, uri, upload_id) -> list[dict]:
+        """Parts already uploaded, with their size"""
+        bucket, key = self._split_uri(uri)
+        parts, marker = [], 0
+        while True:
+            with self._translate_errors():
+                response = self.client.list_parts(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumberMarker=marker,
+                )
+            parts += self._listed_parts(response)
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
+
+    def abort_multipart_upload(self, uri, upload_id):
+        bucket, key = self._split_uri(uri)
+        with self._translate_errors():
+            self.client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id
+            )
+
+    def _upload_multipart(self, stream, uri, mime_type=None):
+        part_size = self.get_part_size(stream_size(stream))
+        upload_id = self.create_multipart_upload(uri, mime_type)
+
+        try:
+            parts = [
+                self.upload_part(body, uri, upload_id, part_number)
+                for part_number, body in enumerate(
+                    iter(lambda: stream.read(part_size), b""), start=1
+                )
+            ]
+            self.complete_multipart_upload(uri, upload_id, parts)
+        except RemoteException:
+            self.abort_multipart_upload(uri, upload_id)
+            raise
+
+    @staticmethod
+    def _sorted_parts(parts: list[dict]) -> list[dict]:
+        """Parts as expected by CompleteMultipartUpload"""
+        return [
+            {k: p[k] for k in ("PartNumber", "ETag", "ChecksumSHA256")}
+            for p in sorted(parts, key=lambda p: p["PartNumber"])
+        ]
+
+    @staticmethod
+    def _check_composite_checksum(parts: list[dict], response: dict) -> None:
+        remote_checksum = response.get("ChecksumSHA256")
+        checksum = composite_checksum([p["ChecksumSHA256"] for p in parts])
+        # S3 suffixes composite checksums with the number of parts
+        if remote_checksum and (
+            remote_checksum.split("-")[0] != checksum.split("-")[0]
+        ):
+            raise CheckSumException(
+                error=f"Expected composite checksum {checksum}, "
+                f"S3 reported {remote_checksum}",
+                operation="CompleteMultipartUpload",
+            )
+
+    @staticmethod
+    def _listed_parts(response: dict) -> list[dict]:
+        """Parts of a ListParts response, with their size"""
+        return [
+            {
+                "PartNumber": p["PartNumber"],
+                "ETag": p["ETag"],
+                "ChecksumSHA256": p.get("ChecksumSHA256"),
+                "Size": p["Size"],
+            }
+            for p in response.get("Parts", [])
+        ]
+
+    @staticmethod
+    def _split_uri(uri):
+        uri = urlparse(uri)
+        return uri.netloc, uri.path[1:]
+
+    @staticmethod
+    @contextmanager
+    def _translate_errors():
+        """Raise boto client and network errors as our own exceptions"""
+        try:
+            yield
+        except (BotoConnectionError, HTTPClientError) as e:
+            raise TransferException(error=str(e), operation="")
         except BotoClientError as e:
             e = get_aws_error_info(e)
+            if e.code == "BadDigest":
+                raise CheckSumException(
+                    error=e.message, operation=e.operation_name
+                )
+            if e.code in THROTTLE_CODES:
+                raise ThrottleException(
+                    error=e.message, operation=e.operation_name
+                )
             raise TransferException(error=e.message, operation=e.operation_name)
 
     def refresh_credentials(self):
         pass
+
+
+class AsyncS3Writer:
+    """
+    Counterpart of S3Writer for AsyncTransferAgent: the same operations,
+    as coroutines of an aiobotocore client, which is an optional
+    dependency (pip install aiobotocore). Requests of all coroutines are
+    sent over one pool of max_concurrency connections.
+
+    Objects smaller than multipart_threshold are sent from memory with a
+    single PUT, larger ones part by part. Checksums are computed by the
+    caller, out of the event loop, sent along with the data for S3 to
+    verify, and checked against the ones S3 reports.
+
+    The client is opened and closed along with the writer, used as an
+    async context manager.
+    """
+
+    def __init__(
+        self,
+        session=None,
+        multipart_threshold: int = MULTIPART_THRESHOLD,
+        part_size: int = PART_SIZE,
+        max_concurrency: int = 1000,
+        credentials: dict | None = None,
+    ):
+        assert (
+            part_size >= MIN_PART_SIZE
+        ), f"got part_size = {part_size}. Should be >= {MIN_PART_SIZE}"
+
+        self.session = session
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.credentials = credentials or {}
+        self.client = None
+        self._client_context = None
+
+    @classmethod
+    def from_profile_name(cls, profile_name, **kwargs):
+        from aiobotocore.session import AioSession
+
+        return cls(AioSession(profile=profile_name), **kwargs)
+
+    @classmethod
+    def from_auth_client(cls, auth_client, **kwargs):
+        creds = auth_client.get_credentials()
+        credentials = {
+            "aws_access_key_id": creds["aws_access_key_id"],
+            "aws_secret_access_key": creds["aws_secret_access_key"],
+        }
+        return cls(credentials=credentials, **kwargs)
+
+    async def __aenter__(self):
+        session = self.session
+        if session is None:
+            from aiobotocore.session import get_session
+
+            session = get_session()
+
+        self._client_context = session.create_client(
+            "s3",
+            config=transfer_config(self.max_concurrency),
+            **self.credentials,
+        )
+        self.client = await self._client_context.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc):
+        client_context, self._client_context = self._client_context, None
+        self.client = None
+        await client_context.__aexit__(*exc)
+
+    def set_concurrency(self, n: int) -> None:
+        """Size the connection pool for n concurrent requests, from the
+        next time the client is opened"""
+        self.max_concurrency = max(self.max_concurrency, n)
+
+    use_multipart = S3Writer.use_multipart
+    get_part_size = S3Writer.get_part_size
+
+    async def put_object(
+        self, body: bytes, uri, mime_type=None, checksum=None
+    ) -> str | None:
+        """
+        Upload body to uri, along with its SHA-256 checksum if given.
+        Returns the SHA-256 checksum of the object reported by S3.
+        """
+        bucket, key = S3Writer._split_uri(uri)
+        checksum = {"ChecksumSHA256": checksum} if checksum else {}
+        with S3Writer._translate_errors():
+            response = await self.client.put_object(
+                Body=body,
+                Bucket=bucket,
+                Key=key,
+                ContentType=mime_type if mime_type else '',
+                ChecksumAlgorithm="SHA256",
+                **checksum,
+            )
+        return response.get("ChecksumSHA256")
+
+    async def create_multipart_upload(self, uri, mime_type=None) -> str:
+        bucket, key = S3Writer._split_uri(uri)
+        with S3Writer._translate_errors():
+            response = await self.client.create_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                ContentType=mime_type if mime_type else '',
+                ChecksumAlgorithm="SHA256",
+            )
+        return response["UploadId"]
+
+    async def upload_part(
+        self, body: bytes, uri, upload_id, part_number, checksum=None
+    ) -> dict:
+        """
+        Upload one part along with its SHA-256 checksum (computed here if
+        not given). Returns the part as expected by
+        complete_multipart_upload.
+        """
+        bucket, key = S3Writer._split_uri(uri)
+        checksum = checksum or sha256_checksum(body)
+        with S3Writer._translate_errors():
+            response = await self.client.upload_part(
+                Body=body,
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                ChecksumAlgorithm="SHA256",
+                ChecksumSHA256=checksum,
+            )
+        return {
+            "PartNumber": part_number,
+            "ETag": response["ETag"],
+            "ChecksumSHA256": checksum,
+        }
+
+    async def complete_multipart_upload(
+        self, uri, upload_id, parts: list[dict]
+    ):
+        bucket, key = S3Writer._split_uri(uri)
+        parts = S3Writer._sorted_parts(parts)
+        with S3Writer._translate_errors():
+            response = await self.client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+
+        S3Writer._check_composite_checksum(parts, response)
+
+    async def list_parts(self, uri, upload_id) -> list[dict]:
+        bucket, key = S3Writer._split_uri(uri)
+        parts, marker = [], 0
+        while True:
+            with S3Writer._translate_errors():
+                response = await self.client.list_parts(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumberMarker=marker,
+                )
+            parts += S3Writer._listed_parts(response)
+            if not response.get("IsTruncated"):
+                return parts
+            marker = response["NextPartNumberMarker"]
+
+    async def abort_multipart_upload(self, uri, upload_id):
+        bucket, key = S3Writer._split_uri(uri)
+        with S3Writer._translate_errors():
+            await self.client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id
+            )
+
+    def refresh_credentials(self):
+        pass
@@ -0,0 +1,325 @@
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+from uuid import UUID
+
+from sqlmodel import Session
+
+from .commands import (
+    Command,
+    RecordToJournalCommand,
+    UpdateItemStatusCommand,
+    UpdateJobErrorCommand,
+)
+from .enum_types import JobStatus
+from .exceptions import JobNotParsedException
+from .job_manager import JobManager
+from .journal import Journal
+from .models import Job, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+class JobScheduler:
+    """
+    Runs several jobs at once on the transfer agent of one job manager,
+    i.e. a single pool of workers and of S3 connections, so that a large
+    job does not hold back small ones until it is done.
+
+    Jobs share the workers by weighted fair queuing: each file sent is
+    charged to its job, its size plus file_cost (that of a request) over
+    the priority of the job, and the job charged the least so far sends
+    the next file. A job of priority 3 thus gets three times the
+    throughput of a job of priority 1, as long as both have files left.
+    A job starts level with the least charged of the running ones, rather
+    than making up for the time it was not running.
+
+    A job sends at most max_transfers files at once, if set, the workers
+    it cannot use going to the others. Both are fields of the job.
+
+    Jobs can be added while the scheduler runs, e.g. by the daemon, and
+    each one is marked as done as soon as its files are sent. Failures are
+    recorded on the job of the file, without stopping the others, and the
+    throughput of each job is logged every log_interval seconds (see
+    metrics), as well as shown by job ls.
+    """
+
+    # bytes a file is charged besides its size
+    file_cost = 64 * 1024
+    # seconds between logs of the metrics of jobs
+    log_interval = 60.0
+
+    def __init__(
+        self,
+        job_manager: JobManager,
+        on_finished: Callable[[Job], None] | None = None,
+    ):
+        self.job_manager = job_manager
+        # called with each job whose run ended, on the thread of run
+        self.on_finished = on_finished
+
+        # jobs added, and running ones, along with transactions in flight,
+        # which complete on other threads
+        self._lock = threading.Condition()
+        self._added = []
+        self._shares = {}
+        self._owners = {}
+        self._closed = False
+        self._journal = None
+        self._last_log = time.monotonic()
+
+    def add(self, job_id: UUID) -> None:
+        """Run job along with the others, from any thread"""
+        with self._lock:
+            self._added.append(job_id)
+            self._lock.notify_all()
+
+    def wait(self) -> bool:
+        """Wait for a job to be added, returns False once closed"""
+        with self._lock:
+            while not self._added and not self._closed:
+                self._lock.wait()
+            return not self._closed
+
+    def close(self) -> None:
+        """Stop waiting for jobs, running ones go on"""
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+
+    def run(self) -> None:
+        """Run the jobs added, and those added meanwhile, until all ended"""
+        job_manager = self.job_manager
+        self._journal = self._setup_commands()
+        leases = (
+            job_manager.leases.held(job_manager.session.get_bind())
+            if job_manager.leases is not None
+            else nullcontext()
+        )
+        with leases:
+            self._journal.start()
+            try:
+                job_manager.transfer_agent.run(self._transactions())
+            finally:
+                self._journal.close()
+                job_manager.session.expire_all()
+                # left by a failed run
+                for share in list(self._shares.values()):
+                    self._finish(share)
+                logger.info("jobs metrics: %s", self.metrics())
+
+    def metrics(self) -> dict:
+        """Progress and throughput of running jobs, by job id"""
+        with self._lock:
+            return {
+                str(job_id): share.to_dict()
+                for job_id, share in self._shares.items()
+            }
+
+    def _setup_commands(self) -> Journal:
+        """See JobManager._setup_commands. Exceptions are not raised, so
+        that the failures of a job do not end the others"""
+        agent = self.job_manager.transfer_agent
+        session = Session(self.job_manager.session.get_bind())
+        journal = Journal(
+            [UpdateItemStatusCommand(session), UpdateJobErrorCommand(session)],
+            session=session,
+        )
+
+        agent.post_batch_commands = []
+        agent.post_transaction_commands = [
+            RecordToJournalCommand(journal),
+            _CompleteCommand(self),
+        ]
+
+        return journal
+
+    def _transactions(self) -> Iterator[Transaction | None]:
+        """Transactions of jobs in the order of their share, or None when
+        none can be sent until transfers in flight complete"""
+        while True:
+            self._start_added()
+            self._finish_sent()
+            if not self._shares:
+                return
+            self._log_metrics()
+
+            share = self._next_share()
+            if share is None:
+                # jobs at their max_transfers, or with their last files
+                # in flight
+                yield None
+                continue
+
+            try:
+                t = next(share.transactions)
+            except StopIteration:
+                share.exhausted = True
+                continue
+            except Exception:
+                logger.exception("job %s failed", share.job_id)
+                self.job_manager.session.rollback()
+                share.exhausted = True
+                continue
+
+            with self._lock:
+                share.in_flight += 1
+                share.charged += (
+                    (t.size or 0) + self.file_cost
+                ) / share.priority
+                self._owners[t.item_id] = share
+            yield t
+
+    def _start_added(self) -> None:
+        """Start the runs of added jobs, on the thread of run"""
+        with self._lock:
+            added, self._added = self._added, []
+
+        job_manager = self.job_manager
+        session = job_manager.session
+        for job_id in added:
+            if job_id in self._shares:
+                continue
+            job = session.get(Job, job_id)
+            if job is None:
+                # deleted since
+                continue
+
+            if job.status == JobStatus.DONE:
+                self._ended(job)
+                continue
+
+            try:
+                job_manager._refresh_credentials(job)
+                if job.status < JobStatus.PARSED:
+                    raise JobNotParsedException(
+                        f"Job {job.id} is not parsed, resume it to parse "
+                        "its source."
+                    )
+                job_manager._start_progress(job)
+            except Exception:
+                logger.exception("job %s failed", job_id)
+                session.rollback()
+                self._ended(job)
+                continue
+
+            share = _Share(
+                job_id=job_id,
+                priority=job.priority,
+                max_transfers=job.max_transfers,
+                transactions=job_manager._pending_transactions(job),
+            )
+            with self._lock:
+                share.charged = min(
+                    (s.charged for s in self._shares.values()), default=0.0
+                )
+                self._shares[job_id] = share
+            logger.info("job %s started", job_id)
+
+    def _next_share(self) -> "_Share | None":
+        """Least charged job with files left, that may send one more"""
+        with self._lock:
+            ready = [
+                s
+                for s in self._shares.values()
+                if not s.exhausted
+                and (s.max_transfers is None or s.in_flight < s.max_transfers)
+            ]
+            return min(ready, key=lambda s: s.charged, default=None)
+
+    def _finish_sent(self) -> None:
+        """Finish jobs whose files were all sent, once their outcome is
+        written"""
+        with self._lock:
+            sent = [
+                s
+                for s in self._shares.values()
+                if s.exhausted and s.in_flight == 0
+            ]
+        if not sent:
+            return
+
+        self._journal.flush()
+        for share in sent:
+            self._finish(share)
+
+    def _finish(self, share: "_Share") -> None:
+        """Mark job of share as done, unless files are left"""
+        with self._lock:
+            del self._shares[share.job_id]
+        logger.info("job %s: %s", share.job_id, share.to_dict())
+
+        session = self.job_manager.session
+        job = session.get(Job, share.job_id)
+        if job is None:
+            return
+        session.refresh(job)
+        if not self.job_manager._has_pending_items(job):
+            job.status = JobStatus.DONE
+        session.commit()
+        self._ended(job)
+
+    def _ended(self, job: Job) -> None:
+        logger.info("job %s ended %s", job.id, job.status.name)
+        if self.on_finished is not None:
+            self.on_finished(job)
+
+    def _complete(self, transaction: Transaction) -> None:
+        """Count a transaction out of the transfers in flight of its job,
+        unless it is retried"""
+        if transaction.retry:
+            return
+
+        with self._lock:
+            share = self._owners.pop(transaction.item_id)
+            share.in_flight -= 1
+            if transaction.success:
+                share.num_done_items += 1
+                share.num_done_bytes += transaction.size or 0
+
+    def _log_metrics(self) -> None:
+        if time.monotonic() - self._last_log < self.log_interval:
+            return
+        self._last_log = time.monotonic()
+        logger.info("jobs metrics: %s", self.metrics())
+
+
+@dataclass
+class _Share:
+    """Job run by a JobScheduler, with its transactions left to send"""
+
+    job_id: UUID
+    priority: int
+    max_transfers: int | None
+    transactions: Iterator[Transaction]
+    # cost of the files sent, over priority
+    charged: float = 0.0
+    in_flight: int = 0
+    exhausted: bool = False
+    num_done_items: int = 0
+    num_done_bytes: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def to_dict(self) -> dict:
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "priority": self.priority,
+            "max_transfers": self.max_transfers,
+            "in_flight": self.in_flight,
+            "num_done_items": self.num_done_items,
+            "num_done_bytes": self.num_done_bytes,
+            "throughput": self.num_done_bytes / elapsed if elapsed > 0 else 0,
+        }
+
+
+class _CompleteCommand(Command):
+    """Tell a JobScheduler that a transaction completed"""
+
+    def __init__(self, scheduler: JobScheduler):
+        self.scheduler = scheduler
+
+    def execute(self, transaction: Transaction):
+        self.scheduler._complete(transaction)
@@ -0,0 +1,111 @@
+import hashlib
+
+from sqlalchemy import Column, MetaData, String, Table, inspect, select
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlmodel import SQLModel
+
+# version of the schema a database was last migrated to, kept apart from
+# the tables of the models
+_version_metadata = MetaData()
+schema_version_table = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", String, nullable=False),
+)
+
+
+def schema_version(dialect) -> str:
+    """Digest of the DDL of the models, changing along with them"""
+    digest = hashlib.sha256()
+    for table in SQLModel.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            digest.update(
+                str(CreateIndex(index).compile(dialect=dialect)).encode()
+            )
+
+    return digest.hexdigest()
+
+
+def migrate(engine) -> list[str]:
+    """
+    Bring the database up to date with the models: create missing
+    tables, columns and indexes, unless it was already migrated to the
+    current schema_version, which is then a single query.
+    Returns the added columns, as "table.column".
+    """
+    version = schema_version(engine.dialect)
+    _version_metadata.create_all(engine)
+    with engine.connect() as connection:
+        current = connection.execute(
+            select(schema_version_table.c.version)
+        ).scalar()
+    if current == version:
+        return []
+
+    SQLModel.metadata.create_all(engine)
+    added = add_missing_columns(engine)
+    add_missing_indexes(engine)
+
+    with engine.begin() as connection:
+        connection.execute(schema_version_table.delete())
+        connection.execute(schema_version_table.insert(), {"version": version})
+
+    return added
+
+
+def add_missing_columns(engine) -> list[str]:
+    """
+    Add columns introduced since the database file was created,
+    as SQLModel.metadata.create_all only creates missing tables.
+    Returns the added columns, as "table.column".
+    """
+    inspector = inspect(engine)
+    added = []
+
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            definition = "{} {}".format(
+                column.name, column.type.compile(dialect=engine.dialect)
+            )
+            if column.server_default is not None:
+                definition += f" DEFAULT {column.server_default.arg}"
+
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {definition}"
+                )
+            added.append(f"{table.name}.{column.name}")
+
+    return added
+
+
+def add_missing_indexes(engine) -> list[str]:
+    """
+    Create indexes introduced since the database file was created,
+    as SQLModel.metadata.create_all only creates those of missing tables.
+    Returns the names of the created indexes.
+    """
+    inspector = inspect(engine)
+    added = []
+
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+
+            index.create(engine)
+            added.append(index.name)
+
+    return added
@@ -0,0 +1,229 @@
+import json
+import logging
+import socket
+import socketserver
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from queue import SimpleQueue
+
+from decouple import config
+from sqlmodel import Session, select
+
+from .enum_types import JobError, JobStatus
+from .exceptions import (
+    InitDuplicateJobException,
+    InitException,
+    InitSrcException,
+)
+from .job_manager import JobManager
+from .models import Job
+from .scheduler import JobScheduler
+
+logger = logging.getLogger(__name__)
+
+# socket the daemon (forwarding_service serve) listens on
+SOCKET_PATH = config(
+    "FORW_SERV_SOCKET_PATH", default="~/.cache/forwarding_service.sock"
+)
+
+_STOP = None
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Daemon running the jobs submitted over a Unix socket with a single job
+    manager, i.e. the same S3 clients, connection pools, credentials and
+    database engine for all jobs, set up once. Jobs are parsed in turn, and
+    run at once, sharing workers according to their priority (see
+    JobScheduler).
+
+    Requests and replies are single lines of JSON:
+    - {"command": "run", "source": ..., "destination": ..., "regexp": ...,
+      "filter_spec": ..., "priority": ..., "max_transfers": ...} creates a
+      job, which is parsed and run,
+    - {"command": "resume", "id": ..., "priority": ..., "max_transfers": ...}
+      resumes a job, with new priority and max_transfers, if given,
+    both replying {"job_id": ...} as soon as the job is queued, or
+    {"error": ...}.
+
+    Queued jobs are marked as such in the database (Job.queued_at) until
+    their run ends, so that those left queued or running when the daemon
+    stops are queued again when it restarts.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, job_manager: JobManager, socket_path: str = SOCKET_PATH):
+        self.job_manager = job_manager
+        self.scheduler = JobScheduler(job_manager, on_finished=self._ended)
+        self.socket_path = Path(socket_path).expanduser()
+        self._jobs = SimpleQueue()
+        self._background = []
+
+        if _is_served(self.socket_path):
+            raise OSError(f"a daemon already listens on {self.socket_path}")
+        # left over by a daemon that did not stop cleanly
+        self.socket_path.unlink(missing_ok=True)
+        super().__init__(str(self.socket_path), _RequestHandler)
+
+    def start(self) -> None:
+        """Queue the jobs left queued, and start parsing and running jobs"""
+        with self._session() as session:
+            queued = session.exec(
+                select(Job.id)
+                .where(Job.queued_at.isnot(None))
+                .order_by(Job.queued_at)
+            ).all()
+        for job_id in queued:
+            logger.info("job %s queued again", job_id)
+            self._jobs.put(job_id)
+
+        self._background = [
+            threading.Thread(target=target, name=name, daemon=True)
+            for target, name in [
+                (self._parse_jobs, "parser"),
+                (self._run_jobs, "runner"),
+            ]
+        ]
+        for thread in self._background:
+            thread.start()
+
+    def server_close(self) -> None:
+        """Stop listening. Jobs queued or running are left queued"""
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+        if self._background:
+            self._jobs.put(_STOP)
+            self.scheduler.close()
+
+    def reply(self, request: dict) -> dict:
+        """Reply to a request"""
+        command = request.get("command")
+        with self._session() as session:
+            if command == "run":
+                job = self._init(session, request)
+            elif command == "resume":
+                job = session.get(Job, uuid.UUID(request["id"]))
+                if job is None:
+                    return {"error": f"{request['id']} not found"}
+                # from the next run of the job, if running
+                for name in ["priority", "max_transfers"]:
+                    if request.get(name) is not None:
+                        setattr(job, name, request[name])
+                session.commit()
+            else:
+                return {"error": f"unknown command {command}"}
+
+            job_id = job.id
+            if job.queued_at is None:
+                job.queued_at = datetime.now()
+                session.commit()
+                self._jobs.put(job_id)
+
+        return {"job_id": str(job_id)}
+
+    def _init(self, session: Session, request: dict) -> Job:
+        """Check and create the job of request, with a session of the
+        request's thread"""
+        job_manager = JobManager(session, self.job_manager.transfer_agent)
+        return job_manager.init(
+            request["source"],
+            request["destination"],
+            request.get("regexp", ".*"),
+            request.get("filter_spec"),
+            request.get("priority", 1),
+            request.get("max_transfers"),
+        )
+
+    def _session(self) -> Session:
+        return Session(self.job_manager.session.get_bind())
+
+    def _parse_jobs(self) -> None:
+        """Parse queued jobs in turn, if needed, and hand them over to the
+        scheduler, until the server is closed"""
+        with self._session() as session:
+            job_manager = JobManager(session, self.job_manager.transfer_agent)
+            while (job_id := self._jobs.get()) is not _STOP:
+                job = session.get(Job, job_id)
+                if job is None:
+                    # deleted since
+                    continue
+                try:
+                    if job.status < JobStatus.DONE:
+                        job.error = JobError.NONE
+                        job.info = None
+                        session.commit()
+                    # carries on with an interrupted parse, if any
+                    job_manager.parse_and_commit_items(job)
+                except Exception:
+                    session.rollback()
+                    logger.exception("job %s failed", job_id)
+                    job.queued_at = None
+                    session.commit()
+                    continue
+                self.scheduler.add(job_id)
+
+    def _run_jobs(self) -> None:
+        """Run parsed jobs, until the server is closed"""
+        while self.scheduler.wait():
+            try:
+                self.scheduler.run()
+            except Exception:
+                self.job_manager.session.rollback()
+                logger.exception("run of jobs failed")
+
+    def _ended(self, job: Job) -> None:
+        """Mark a job whose run ended as no longer queued"""
+        job.queued_at = None
+        self.job_manager.session.commit()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # connection closed without a request, see _is_served
+            return
+        try:
+            request = json.loads(line)
+            reply = self.server.reply(request)
+        except (
+            InitException,
+            InitSrcException,
+            InitDuplicateJobException,
+        ) as e:
+            reply = {"error": str(e.error)}
+        except Exception as e:
+            logger.exception("request failed")
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+def submit(request: dict, socket_path: str = SOCKET_PATH) -> dict | None:
+    """Reply of the daemon to request, or None if no daemon is running"""
+    path = Path(socket_path).expanduser()
+    if not path.exists():
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(path))
+            client.sendall((json.dumps(request) + "\n").encode())
+            with client.makefile() as replies:
+                return json.loads(replies.readline())
+    except (ConnectionRefusedError, FileNotFoundError):
+        # left over by a daemon that did not stop cleanly
+        return None
+
+
+def _is_served(path: Path) -> bool:
+    """Whether a daemon listens on the socket at path"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+
+    return True
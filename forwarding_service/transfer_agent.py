@@ -1,17 +1,51 @@
-from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from dataclasses import replace
+from queue import Empty, SimpleQueue
+from typing import Iterable
 
 from .commands import Command
-from .exceptions import RemoteException
+from .concurrency import AIMDController, ByteBudget
+from .exceptions import CheckSumException, RemoteException, TransferException
 from .models import Transaction
+from .multipart import MultipartTransfer
 from .reader_writer import BaseReader, BaseWriter, ReaderWriter
-from .utils import chunks
+from .retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
 
 
 class TransferAgent(ReaderWriter):
     """ Wraps a low-level ReaderWriter and adds (threaded) batch transactions.
         Allows to set commands/callbacks:
         - post_transaction_commands: list of commands to execute after each transaction (file)
-        - post_batch_commands: list of commands to execute after each batch of transactions (set of files)
+        - post_batch_commands: list of commands to execute on the transactions
+          completed since the last checkpoint, i.e. every checkpoint_every
+          completions or checkpoint_interval seconds, and at the end of a run
+
+        Transactions are fed to a long-lived pool of n_threads workers, keeping
+        at most max_in_flight of them queued or running: a new transfer starts
+        as soon as another one completes.
+
+        Files that the writer sends in several parts are split into one task
+        per part, so that the parts of a large file are spread over the
+        worker threads along with other files.
+
+        With a concurrency controller, n_threads is its upper bound, and
+        the number of files or parts sent at once is adapted while running.
+
+        With a memory_budget (in bytes), a file or part is only sent once
+        its size fits in the budget, along with those being sent, which
+        bounds the memory held by workers whatever the number of threads.
+
+        With a retry policy, failed transactions are submitted again after
+        a delay, while other transactions go on. Commands receive each
+        attempt, failed ones to be retried having transaction.retry set.
      """
     def __init__(
         self,
@@ -20,54 +54,348 @@ class TransferAgent(ReaderWriter):
         post_transaction_commands: list[Command] = [],
         post_batch_commands: list[Command] = [],
         n_threads: int = 30,
-        split_ratio: float = 0.1,
+        checkpoint_every: int = 100,
+        checkpoint_interval: float = 10.0,
+        concurrency: AIMDController | None = None,
+        retry_policy: RetryPolicy | None = None,
+        memory_budget: int | None = None,
     ):
         super().__init__(reader=reader, writer=writer, do_checksum=True)
         self.post_transaction_commands = post_transaction_commands
         self.post_batch_commands = post_batch_commands
+        self.concurrency = concurrency
+        if concurrency is not None:
+            n_threads = concurrency.max_limit
         self.n_threads = n_threads
+        self.retry_policy = retry_policy
+        self.budget = ByteBudget(memory_budget) if memory_budget else None
 
         assert (
-            split_ratio <= 1
-        ), f"got split_ratio = {split_ratio}. Should be <= 1"
-        self.split_ratio = split_ratio
-
-    def run(self, transactions: list[Transaction]) -> None:
-        n_threads = min(self.n_threads, len(transactions))
-        if n_threads > 1:
-            for batch in self._split_to_batches(transactions):
-                self._run_threaded(batch)
-        else:
-            self._run_sequential(transactions)
+            checkpoint_every >= 1
+        ), f"got checkpoint_every = {checkpoint_every}. Should be >= 1"
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
 
-    def _split_to_batches(self, transactions: list[Transaction]):
-        batch_size = round(self.split_ratio * len(transactions))
-        n_batches = round(len(transactions) / batch_size)
+        self._pool = None
+        self._executor = None
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+        # first exception raised by a worker, which ends the run
+        self._error = None
+        self._finished = SimpleQueue()
+        self._completed = []
+        self._last_checkpoint = time.monotonic()
+        # heap of (due time, sequence number, transaction) to retry
+        self._retries = []
+        self._sequence = itertools.count()
 
-        batches = chunks(transactions, n_batches)
-        return batches
+    @property
+    def max_in_flight(self) -> int:
+        """Transactions queued or running at once, so that workers never idle"""
+        return 2 * self.n_threads
 
-    def _run_threaded(self, transactions: list[Transaction]) -> None:
-        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
-            _ = [executor.submit(self._transfer_one, t) for t in transactions]
+    def run(self, transactions: Iterable[Transaction]) -> None:
+        """
+        Transfer transactions, which are consumed lazily. None stands for
+        nothing to send for now (e.g. see JobScheduler): transfers in
+        flight are collected before the next transaction is asked for.
+        Transfers still in flight when a command (or a worker) raises are
+        waited for, and checkpointed, before the exception is propagated.
+        """
+        self._executor = self._get_pool()
+        self._error = None
+        self._finished = SimpleQueue()
+        self._completed = []
+        self._last_checkpoint = time.monotonic()
+        self._retries = []
 
-        for cmd in self.post_batch_commands:
-            cmd.execute(transactions)
+        num_in_flight = 0
+        try:
+            for t in transactions:
+                if t is None:
+                    num_in_flight -= self._collect()
+                    num_in_flight += self._submit_retries()
+                    continue
+                while num_in_flight >= self.max_in_flight:
+                    num_in_flight -= self._collect()
+                    num_in_flight += self._submit_retries()
+                num_in_flight += 1
+                self._submit(self._transfer_one, t)
+
+            while num_in_flight > 0 or self._retries:
+                num_in_flight -= self._collect()
+                num_in_flight += self._submit_retries()
+        finally:
+            # transactions of a failed worker may never finish
+            while num_in_flight > 0 and self._error is None:
+                num_in_flight -= self._collect(checkpoint=False)
+            # a worker may fail after finishing its transaction
+            self._wait_futures()
+            self._collect(checkpoint=False, block=False)
+            self._checkpoint()
+            logger.info("transfer metrics: %s", self.metrics())
+        if self._error is not None:
+            raise self._error
+
+    def metrics(self) -> dict:
+        """Use of the memory budget, concurrency and connections"""
+        metrics = {}
+        if self.budget is not None:
+            metrics["memory_budget"] = self.budget.to_dict()
+        if self.concurrency is not None:
+            metrics["concurrency"] = self.concurrency.limit
+        writer_metrics = getattr(self.writer, "metrics", None)
+        if writer_metrics is not None:
+            metrics["connection_pool"] = writer_metrics.to_dict()
+
+        return metrics
+
+    def close(self) -> None:
+        """Shut down worker threads"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_pool(self) -> ThreadPoolExecutor | None:
+        """Worker pool, kept across runs. None when sequential"""
+        if self.n_threads <= 1:
+            return None
+
+        if self._pool is not None and self._pool._max_workers != self.n_threads:
+            self.close()
+        if self._pool is None:
+            self.writer.set_concurrency(self.n_threads)
+            self._pool = ThreadPoolExecutor(max_workers=self.n_threads)
+
+        return self._pool
+
+    def _collect(self, checkpoint: bool = True, block: bool = True) -> int:
+        """
+        Wait for at least one transaction to complete, or (with checkpoint)
+        for the next checkpoint or retry to be due.
+        Returns the number of completed transactions, failed ones to be
+        retried being put on the retry queue.
+        With checkpoint, raises the exception of a failed worker, if any.
+        """
+        timeout = None if block else 0
+        if checkpoint:
+            deadline = self._last_checkpoint + self.checkpoint_interval
+            if self._retries:
+                deadline = min(deadline, self._retries[0][0])
+            timeout = max(deadline - time.monotonic(), 0)
+
+        num_collected = 0
+        try:
+            t = self._finished.get(timeout=timeout)
+            while True:
+                if isinstance(t, Exception):
+                    self._error = self._error or t
+                else:
+                    self._completed.append(t)
+                    num_collected += 1
+                    if t.retry:
+                        self._schedule_retry(t)
+                t = self._finished.get_nowait()
+        except Empty:
+            pass
+
+        if checkpoint and self._error is not None:
+            raise self._error
+
+        due = (len(self._completed) >= self.checkpoint_every) or (
+            time.monotonic() - self._last_checkpoint >= self.checkpoint_interval
+        )
+        if checkpoint and due:
+            self._checkpoint()
+
+        return num_collected
+
+    def _schedule_retry(self, transaction: Transaction) -> None:
+        """Put a new attempt of failed transaction on the retry queue"""
+        due = time.monotonic() + self.retry_policy.delay(transaction.attempts)
+        # commands may still hold the failed attempt, retry a copy of it
+        retry = replace(transaction, parts=list(transaction.parts), retry=False)
+        heapq.heappush(self._retries, (due, next(self._sequence), retry))
 
-    def _run_sequential(self, transactions: list[Transaction]) -> None:
-        breakpoint()
-        for t in transactions:
-            self._transfer_one(t)
+    def _submit_retries(self) -> int:
+        """Submit transactions whose retry is due, returns their number"""
+        num_submitted = 0
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now:
+            _, _, t = heapq.heappop(self._retries)
+            print(f"{t.input} -> {t.output} (attempt {t.attempts + 1})")
+            self._submit(self._transfer_one, t)
+            num_submitted += 1
+
+        return num_submitted
+
+    def _checkpoint(self) -> None:
+        completed, self._completed = self._completed, []
+        self._last_checkpoint = time.monotonic()
+
+        if not completed:
+            return
 
         for cmd in self.post_batch_commands:
-            cmd.execute(transactions)
+            cmd.execute(completed)
+
+    def _submit(self, fn, *args) -> None:
+        """Run fn on the worker threads, or right away when sequential"""
+        if self._executor is None:
+            try:
+                fn(*args)
+            except Exception as e:
+                self._error = self._error or e
+                raise
+        else:
+            future = self._executor.submit(fn, *args)
+            with self._futures_lock:
+                self._futures.add(future)
+            future.add_done_callback(self._done)
+
+    def _done(self, future: Future) -> None:
+        """Hand the exception of a worker, if any, to the run loop"""
+        e = future.exception()
+        if e is not None:
+            logger.error("transfer worker failed", exc_info=e)
+            self._finished.put(e)
+        # only once handed over, as the run ends when no future is left
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def _wait_futures(self) -> None:
+        """Wait for the worker threads, including tasks they submit"""
+        while True:
+            with self._futures_lock:
+                futures = set(self._futures)
+            if not futures:
+                return
+            wait(futures)
+
+    @contextmanager
+    def _slot(self, nbytes: int):
+        """Context of a transfer of nbytes, held within the memory budget
+        and the concurrency limit, if any"""
+        with ExitStack() as stack:
+            if self.budget is not None:
+                stack.enter_context(self.budget.reserve(nbytes))
+            if self.concurrency is not None:
+                stack.enter_context(self.concurrency.transfer(nbytes))
+            yield
+
+    def _finish(self, transaction: Transaction) -> None:
+        transaction.attempts += 1
+        transaction.retry = (
+            self.retry_policy is not None
+            and self.retry_policy.should_retry(transaction)
+        )
+        try:
+            for cmd in self.post_transaction_commands:
+                cmd.execute(transaction)
+        finally:
+            self._finished.put(transaction)
 
     def _transfer_one(self, transaction: Transaction) -> None:
+        upload = None
         try:
-            self.send(transaction.input, transaction.output)
-            transaction.success = True
-        except RemoteException as e:
+            size = self.reader.size(transaction.input)
+            if self.writer.use_multipart(size):
+                upload = self._create_multipart(transaction, size)
+            else:
+                with self._slot(size):
+                    self.send(transaction.input, transaction.output)
+                transaction.success = True
+        except Exception as e:
             transaction.exception = e
 
-        for cmd in self.post_transaction_commands:
-            cmd.execute(transaction)
+        if upload is None:
+            self._finish(transaction)
+        elif not upload.pending:
+            self._complete_multipart(upload)
+        else:
+            # finished along with its last part
+            for part_number in upload.pending:
+                self._submit(self._transfer_part, upload, part_number)
+
+    def _create_multipart(
+        self, transaction: Transaction, size: int
+    ) -> MultipartTransfer:
+        """Resume the multipart upload of transaction, or start a new one"""
+        part_size = self.writer.get_part_size(size)
+
+        if transaction.upload_id is not None:
+            upload = MultipartTransfer(transaction, size, part_size)
+            try:
+                parts = self.writer.list_parts(
+                    transaction.output, transaction.upload_id
+                )
+            except TransferException:
+                # upload was aborted or has expired
+                parts = None
+
+            if parts is not None and upload.resume(parts):
+                print(
+                    f"{transaction.input} -> {transaction.output} "
+                    f"(resuming, {len(upload.pending)} parts left)"
+                )
+                return upload
+
+            if parts is not None:
+                self.writer.abort_multipart_upload(
+                    transaction.output, transaction.upload_id
+                )
+
+        print(f"{transaction.input} -> {transaction.output} (multipart)")
+        transaction.upload_id = self.writer.create_multipart_upload(
+            transaction.output, self.reader.guess_mime_type(transaction.input)
+        )
+        transaction.parts = []
+
+        return MultipartTransfer(transaction, size, part_size)
+
+    def _transfer_part(self, upload: MultipartTransfer, part_number: int):
+        t = upload.transaction
+        part, exception = None, None
+        try:
+            # no need to send the remaining parts of a failed upload
+            if not upload.failed:
+                offset, length = upload.ranges[part_number]
+                with self._slot(length):
+                    body = self.reader.read_range(t.input, offset, length)
+                    part = self.writer.upload_part(
+                        body, t.output, upload.upload_id, part_number
+                    )
+        except Exception as e:
+            exception = e
+
+        if upload.part_done(part, exception):
+            self._complete_multipart(upload)
+
+    def _complete_multipart(self, upload: MultipartTransfer) -> None:
+        """
+        Complete the upload once all parts are sent. Failed uploads are kept
+        (along with their parts) to be resumed, unless the parts are corrupt.
+        """
+        t = upload.transaction
+        try:
+            if not upload.failed:
+                self.writer.complete_multipart_upload(
+                    t.output, upload.upload_id, upload.parts
+                )
+                t.success = True
+        except CheckSumException as e:
+            t.exception = e
+            try:
+                self.writer.abort_multipart_upload(t.output, upload.upload_id)
+            except RemoteException as abort_error:
+                # left to expire, a new upload is started anyway
+                logger.warning(
+                    "could not abort upload of %s: %s",
+                    t.output,
+                    abort_error.error,
+                )
+            t.upload_id, t.parts = None, []
+        except Exception as e:
+            t.exception = e
+        finally:
+            self._finish(t)
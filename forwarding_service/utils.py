@@ -1,5 +1,5 @@
-import fnmatch
-import re
+import hashlib
+from base64 import b64decode, b64encode
 
 from sqlmodel import SQLModel
 from .models import Item
@@ -24,29 +24,39 @@ def filter_table(session, model: SQLModel, **kwargs):
 
     return query
 
-def chunks(l, n):
-    """Yield n number of striped chunks from l."""
-    for i in range(0, n):
-        yield l[i::n]
+def stream_size(stream) -> int:
+    """Size in bytes of a seekable stream, leaves its position unchanged"""
+    position = stream.tell()
+    size = stream.seek(0, 2)
+    stream.seek(position)
 
+    return size
 
-def _match_file_extension(filename: str, pattern: str, is_regex=False):
-    """
-    Function that return boolean, tell if the filename match the the given pattern
 
-    filename -- (str) Name of file
-    pattern -- (str) Pattern to filter file, can be '*.txt' if not regex, else '.*\txt'
-    is_regex -- Bool If pattern is a regex or not
-    """
-    if not is_regex:
-        pattern = fnmatch.translate(pattern)
+def sha256_checksum(data: bytes) -> str:
+    """Base64 encoded SHA-256 digest of data"""
+    return b64encode(hashlib.sha256(data).digest()).decode()
 
-    reobj = re.compile(pattern)
-    match = reobj.match(filename)
 
-    if match is None:
-        return False
-    return True
+def composite_checksum(checksums: list[str]) -> str:
+    """
+    Checksum of a multipart object as computed by S3: SHA-256 of the
+    concatenated (binary) part checksums, suffixed with the number of parts
+    """
+    digests = b"".join(b64decode(c) for c in checksums)
+    return "{}-{}".format(sha256_checksum(digests), len(checksums))
+
+
+def batched(iterable, n):
+    """Yield successive lists of (at most) n elements of iterable"""
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def check_field_exists(model, field):
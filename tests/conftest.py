@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
+import asyncio
 import io
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse
 
 import pytest
+from botocore.exceptions import ClientError
 from forwarding_service.base import BaseReader, BaseWriter
+from forwarding_service.commands import Command
 from forwarding_service.transfer_agent import TransferAgent
 from forwarding_service.enum_types import ItemStatus, JobError, JobStatus
 from forwarding_service.job_manager import JobManager
+from forwarding_service.models import Transaction
+from forwarding_service.utils import composite_checksum, sha256_checksum
+from sqlalchemy.pool import StaticPool
 from sqlmodel import Session, SQLModel, create_engine
 
 
@@ -63,9 +70,143 @@ class MockWriter(BaseWriter):
         pass
 
 
+class RecordCommand(Command):
+    def __init__(self):
+        self.payloads = []
+
+    def execute(self, payload):
+        self.payloads.append(payload)
+
+
+def make_transactions(n):
+    return [
+        Transaction(
+            item_id=str(i),
+            input=f"file:///root/path/project/file_{i}.ext",
+            output=f"s3://bucket/project/file_{i}.ext",
+        )
+        for i in range(n)
+    ]
+
+
+class MockS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client we use"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def _call(self, operation):
+        self.calls.append(operation)
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        self._call("PutObject")
+        body = Body if isinstance(Body, bytes) else Body.read()
+        self.objects[(Bucket, Key)] = body
+        return {"ChecksumSHA256": sha256_checksum(self.objects[(Bucket, Key)])}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("CreateMultipartUpload")
+        upload_id = "upload-{}".format(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Body, UploadId, PartNumber, **kwargs):
+        self._call("UploadPart")
+        self.uploads[UploadId][PartNumber] = Body
+        return {
+            "ETag": '"etag-{}"'.format(PartNumber),
+            "ChecksumSHA256": sha256_checksum(Body),
+        }
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._call("CompleteMultipartUpload")
+        parts = self.uploads.pop(UploadId)
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+        checksums = [sha256_checksum(parts[n]) for n in numbers]
+        return {"ChecksumSHA256": composite_checksum(checksums)}
+
+    def list_parts(self, UploadId, **kwargs):
+        self._call("ListParts")
+        if UploadId not in self.uploads:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchUpload", "Message": "not found"}},
+                "ListParts",
+            )
+        parts = self.uploads[UploadId]
+        return {
+            "Parts": [
+                {
+                    "PartNumber": n,
+                    "ETag": '"etag-{}"'.format(n),
+                    "ChecksumSHA256": sha256_checksum(body),
+                    "Size": len(body),
+                }
+                for n, body in sorted(parts.items())
+            ],
+            "IsTruncated": False,
+        }
+
+    def abort_multipart_upload(self, UploadId, **kwargs):
+        self._call("AbortMultipartUpload")
+        self.uploads.pop(UploadId, None)
+        return {}
+
+
+class MockBotoSession:
+    def __init__(self):
+        self._client = MockS3Client()
+
+    def client(self, *args, **kwargs):
+        return self._client
+
+
+class MockAioClient:
+    """MockS3Client whose operations are coroutines, as aiobotocore's"""
+
+    def __init__(self, client, latency=0.0):
+        self._client = client
+        self.latency = latency
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+
+    def __getattr__(self, name):
+        operation = getattr(self._client, name)
+
+        async def call(**kwargs):
+            self.num_in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+                return operation(**kwargs)
+            finally:
+                self.num_in_flight -= 1
+
+        return call
+
+
+class MockAioSession:
+    def __init__(self, latency=0.0):
+        self.client = MockAioClient(MockS3Client(), latency)
+
+    def create_client(self, *args, **kwargs):
+        @asynccontextmanager
+        async def client():
+            yield self.client
+
+        return client()
+
+
 @pytest.fixture
 def engine():
-    engine = create_engine("sqlite://")
+    # single connection shared by threads, e.g. the journal's
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
     SQLModel.metadata.create_all(engine)
     yield engine
 
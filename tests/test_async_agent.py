@@ -0,0 +1,156 @@
+from botocore.exceptions import ClientError
+from forwarding_service.async_agent import AsyncTransferAgent
+from forwarding_service.enum_types import JobStatus
+from forwarding_service.exceptions import CheckSumException, TransferException
+from forwarding_service.file import FileSystemReader
+from forwarding_service.job_manager import JobManager
+from forwarding_service.models import Transaction
+from forwarding_service.retry import RetryPolicy
+from forwarding_service.s3 import MiB, AsyncS3Writer
+
+from .conftest import (
+    MockAioSession,
+    MockReader,
+    RecordCommand,
+    make_transactions,
+)
+
+
+class CorruptUploadWriter(AsyncS3Writer):
+    """Parts reported corrupt on completion, and upload that cannot be
+    aborted"""
+
+    async def complete_multipart_upload(self, uri, upload_id, parts):
+        raise CheckSumException(
+            error="BadDigest", operation="CompleteMultipartUpload"
+        )
+
+    async def abort_multipart_upload(self, uri, upload_id):
+        raise TransferException(
+            error="connection reset", operation="AbortMultipartUpload"
+        )
+
+
+def make_writer(latency=0.0):
+    return AsyncS3Writer(
+        MockAioSession(latency), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+
+
+def test_run_with_commands():
+    per_transaction, per_batch = RecordCommand(), RecordCommand()
+    writer = make_writer()
+    agent = AsyncTransferAgent(
+        MockReader(),
+        writer,
+        post_transaction_commands=[per_transaction],
+        post_batch_commands=[per_batch],
+        max_in_flight=5,
+        checkpoint_every=10,
+    )
+    transactions = make_transactions(25)
+
+    agent.run(transactions)
+
+    assert all(t.success for t in transactions)
+    assert len(per_transaction.payloads) == 25
+    assert sum(len(batch) for batch in per_batch.payloads) == 25
+    assert len(per_batch.payloads) >= 2
+    objects = writer.session.client._client.objects
+    assert objects[("bucket", "project/file_0.ext")] == b"test"
+
+
+def test_requests_in_flight_are_bounded():
+    writer = make_writer(latency=0.01)
+    agent = AsyncTransferAgent(MockReader(), writer, max_in_flight=8)
+
+    agent.run(make_transactions(50))
+
+    assert writer.session.client.max_in_flight == 8
+    assert writer.max_concurrency >= 8
+
+
+def test_large_file_multipart(tmp_path):
+    data = bytes(range(256)) * (12 * MiB // 256 + 1)
+    (tmp_path / "large.bin").write_bytes(data)
+    writer = make_writer()
+    agent = AsyncTransferAgent(
+        FileSystemReader(), writer, memory_budget=10 * MiB
+    )
+    transaction = Transaction(
+        item_id="0",
+        input=f"file://{tmp_path}/large.bin",
+        output="s3://bucket/large.bin",
+    )
+
+    agent.run([transaction])
+
+    assert transaction.success
+    calls = writer.session.client._client.calls
+    assert calls.count("UploadPart") == 3
+    objects = writer.session.client._client.objects
+    assert objects[("bucket", "large.bin")] == data
+    assert agent.budget.peak <= 10 * MiB
+
+
+def test_failed_abort_of_corrupt_upload(tmp_path):
+    (tmp_path / "large.bin").write_bytes(b"0" * 12 * MiB)
+    writer = CorruptUploadWriter(
+        MockAioSession(), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    agent = AsyncTransferAgent(FileSystemReader(), writer)
+    transaction = Transaction(
+        item_id="0",
+        input=f"file://{tmp_path}/large.bin",
+        output="s3://bucket/large.bin",
+    )
+
+    agent.run([transaction])
+
+    assert not transaction.success
+    assert isinstance(transaction.exception, CheckSumException)
+    # started again on the next attempt
+    assert transaction.upload_id is None and transaction.parts == []
+
+
+def test_throttled_requests_are_retried():
+    writer = make_writer()
+    client = writer.session.client._client
+    put_object = client.put_object
+    failures = iter([True, True])
+
+    def throttled_put_object(**kwargs):
+        if next(failures, False):
+            raise ClientError(
+                {"Error": {"Code": "SlowDown", "Message": "slow down"}},
+                "PutObject",
+            )
+        return put_object(**kwargs)
+
+    client.put_object = throttled_put_object
+    command = RecordCommand()
+    agent = AsyncTransferAgent(
+        MockReader(),
+        writer,
+        post_transaction_commands=[command],
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001),
+    )
+    transactions = make_transactions(1)
+
+    agent.run(transactions)
+
+    attempts = command.payloads
+    assert [t.retry for t in attempts] == [True, True, False]
+    assert attempts[-1].success and attempts[-1].attempts == 3
+
+
+def test_job_manager_with_async_agent(session):
+    agent = AsyncTransferAgent(MockReader(), make_writer())
+    job_manager = JobManager(session=session, transfer_agent=agent)
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/")
+    job_manager.parse_and_commit_items(job)
+
+    job = job_manager.run(job)
+
+    assert job.status == JobStatus.DONE
+    assert job.num_done_items == 10
@@ -0,0 +1,41 @@
+import io
+
+import pytest
+from forwarding_service.exceptions import CheckSumException
+from forwarding_service.reader_writer import HashingStream, ReaderWriter
+from forwarding_service.utils import sha256_checksum
+
+from .conftest import MockReader, MockWriter
+
+
+class BadChecksumWriter(MockWriter):
+    def __call__(self, stream, *args, **kwargs):
+        stream.read()
+        return sha256_checksum(b"something else")
+
+
+def test_hashing_stream_single_pass():
+    data = b"0123456789" * 1000
+    stream = HashingStream(io.BytesIO(data))
+    while stream.read(777):
+        pass
+
+    assert stream.num_hashed == len(data)
+    assert stream.checksum == sha256_checksum(data)
+
+
+def test_hashing_stream_reread_after_seek():
+    data = b"0123456789" * 1000
+    stream = HashingStream(io.BytesIO(data))
+    stream.read(5000)
+    stream.seek(0)
+    stream.read()
+
+    assert stream.checksum == sha256_checksum(data)
+
+
+def test_checksum_mismatch_raises():
+    reader_writer = ReaderWriter(MockReader(), BadChecksumWriter())
+    with pytest.raises(CheckSumException):
+        reader_writer.send("file:///root/path/project/file_1.ext",
+                           "s3://bucket/project/file_1.ext")
@@ -0,0 +1,34 @@
+from typer.testing import CliRunner
+
+from forwarding_service.cli import job
+from forwarding_service.cli.main import app
+from forwarding_service.cli.options import TransferOptions
+
+
+def test_changed_transfer_options():
+    options = TransferOptions(n_threads=8, order="largest-first", asyncio=True)
+
+    assert options.changed() == ["--n-threads", "--asyncio"]
+
+
+def test_options_ignored_by_daemon_are_warned_of(monkeypatch):
+    requests = []
+
+    def submit(request):
+        requests.append(request)
+        return {"job_id": "0"}
+
+    monkeypatch.setattr(job, "submit", submit)
+    runner = CliRunner()
+
+    result = runner.invoke(app, ["job", "resume", "0", "--priority", "2"])
+    assert result.exit_code == 0
+    assert "warning" not in result.output
+    assert requests[-1]["priority"] == 2
+
+    result = runner.invoke(
+        app, ["job", "resume", "0", "--n-threads", "8", "--order", "scan"]
+    )
+    assert result.exit_code == 0
+    assert "ignored by the daemon" in result.output
+    assert "--n-threads, --order" in result.output
@@ -0,0 +1,82 @@
+from forwarding_service.commands import (
+    UpdateItemStatusCommand,
+    UpdateJobErrorCommand,
+)
+from forwarding_service.enum_types import ItemStatus, JobError
+from forwarding_service.exceptions import TransferException
+from forwarding_service.models import Item, Job, Transaction
+from sqlalchemy import event
+
+
+def make_job(session, n_items):
+    job = Job(source="file:///root/", destination="s3://bucket/", regexp=".*")
+    session.add(job)
+    session.add_all(
+        [
+            Item(in_uri=f"{i}", out_uri=f"{i}", job_id=job.id)
+            for i in range(n_items)
+        ]
+    )
+    session.commit()
+    return job
+
+
+def count_commits(session):
+    commits = []
+    event.listen(session, "after_commit", lambda s: commits.append(s))
+    return commits
+
+
+def test_bulk_status_update(session):
+    job = make_job(session, 1234)
+    items = session.query(Item).all()
+    commits = count_commits(session)
+
+    transactions = [
+        Transaction(item_id=item.id, success=(i % 2 == 0))
+        for i, item in enumerate(items)
+    ]
+    UpdateItemStatusCommand(session).execute(transactions)
+
+    num_done = (
+        session.query(Item)
+        .filter(Item.status == ItemStatus.TRANSFERRED)
+        .count()
+    )
+    assert num_done == 617
+    assert len(commits) == 1
+
+
+def test_job_error_single_commit(session):
+    job = make_job(session, 10)
+    commits = count_commits(session)
+
+    transactions = [
+        Transaction(item_id=item.id) for item in session.query(Item).all()
+    ]
+    for i, t in enumerate(transactions):
+        t.exception = TransferException(
+            error=f"error {i}", operation="transfer"
+        )
+    UpdateJobErrorCommand(session).execute(transactions)
+
+    session.expire_all()
+    assert job.error == JobError.TRANSFER_ERROR
+    assert job.info["message"] == "error 9"
+    assert len(commits) == 1
+
+
+def test_job_error_of_several_jobs(session):
+    ok, failing = make_job(session, 2), make_job(session, 2)
+
+    transactions = [
+        Transaction(item_id=item.id) for item in ok.items + failing.items
+    ]
+    transactions[-1].exception = TransferException(
+        error="error", operation="transfer"
+    )
+    UpdateJobErrorCommand(session).execute(transactions)
+
+    session.expire_all()
+    assert ok.error == JobError.NONE
+    assert failing.error == JobError.TRANSFER_ERROR
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+
+import pytest
+from forwarding_service.concurrency import (
+    AIMDController,
+    ByteBudget,
+    ConcurrencyLimit,
+)
+from forwarding_service.exceptions import ThrottleException, TransferException
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter, make_transactions
+
+
+class ConcurrencyWriter(MockWriter):
+    """Records the largest number of concurrent calls"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.005)
+        with self.lock:
+            self.running -= 1
+            self.count += 1
+
+
+def test_limit_can_change_while_in_use():
+    slots = ConcurrencyLimit(1)
+    slots.acquire()
+
+    acquired = threading.Event()
+
+    def acquire():
+        slots.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+
+    slots.set_limit(2)
+    assert acquired.wait(1)
+    thread.join()
+    assert slots.in_use == 2
+
+
+def test_additive_increase():
+    controller = AIMDController(1, 4, initial=2, interval=3600)
+    now = time.monotonic()
+    for i in range(1, 6):
+        controller.record(100)
+        controller._adjust(now + i)
+
+    assert [d["new_limit"] for d in controller.decisions] == [3, 4, 4, 4, 4]
+    assert controller.limit == 4
+
+
+def test_multiplicative_decrease_on_throttle():
+    controller = AIMDController(2, 64, initial=32, interval=0)
+    controller.record(0, ThrottleException("SlowDown", "PutObject"))
+    assert controller.limit == 16
+
+    for _ in range(5):
+        controller.record(0, ThrottleException("SlowDown", "PutObject"))
+    assert controller.limit == 2
+
+
+def test_decrease_on_errors():
+    controller = AIMDController(1, 64, initial=10, interval=3600)
+    for i in range(20):
+        error = TransferException("error", "PutObject") if i % 4 else None
+        controller.record(100, error)
+
+    controller._adjust(time.monotonic() + 1)
+    assert controller.limit == 5
+    assert controller.decisions[-1]["errors"] == 15
+
+
+def test_decrease_when_increase_lowers_throughput():
+    controller = AIMDController(1, 64, initial=10, interval=3600)
+    now = time.monotonic()
+
+    controller.record(1000)
+    controller._adjust(now + 1)
+    assert controller.limit == 11
+
+    controller.record(500)
+    controller._adjust(now + 2)
+    assert controller.limit == 5
+    assert controller.decisions[-1]["reason"] == "throughput fell"
+
+
+def test_decisions_are_logged(caplog):
+    controller = AIMDController(1, 4, initial=2, interval=0)
+    with caplog.at_level(logging.INFO, logger="forwarding_service.concurrency"):
+        controller.record(100)
+
+    assert "concurrency 2 -> 3" in caplog.text
+
+
+def test_agent_respects_limit():
+    writer = ConcurrencyWriter()
+    controller = AIMDController(1, 8, initial=2, interval=3600)
+    agent = TransferAgent(
+        reader=MockReader(), writer=writer, concurrency=controller
+    )
+
+    agent.run(make_transactions(40))
+    agent.close()
+
+    assert agent.n_threads == 8
+    assert writer.count == 40
+    assert writer.max_running <= 2
+
+
+def test_budget_admits_what_fits():
+    budget = ByteBudget(100)
+    budget.acquire(60)
+    budget.acquire(40)
+
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(10)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.05)
+
+    budget.release(40)
+    assert acquired.wait(1)
+    thread.join()
+
+    assert budget.in_use == 70
+    assert budget.peak == 100
+    assert budget.num_waits == 1
+    assert budget.wait_time > 0
+
+
+def test_budget_is_fifo():
+    budget = ByteBudget(100)
+    budget.acquire(50)
+    order = []
+
+    def acquire(nbytes):
+        budget.acquire(nbytes)
+        order.append(nbytes)
+
+    large = threading.Thread(target=acquire, args=(80,))
+    large.start()
+    time.sleep(0.05)
+    # fits, but waits for the large one ahead of it
+    small = threading.Thread(target=acquire, args=(10,))
+    small.start()
+    time.sleep(0.05)
+    assert order == []
+
+    budget.release(50)
+    large.join()
+    small.join()
+    assert order == [80, 10]
+
+
+def test_oversized_transfer_admitted_alone():
+    budget = ByteBudget(100)
+    with budget.reserve(500):
+        assert budget.in_use == 500
+    assert budget.in_use == 0
+
+
+def test_agent_respects_memory_budget():
+    writer = ConcurrencyWriter()
+    # MockReader reads 4 bytes per file
+    agent = TransferAgent(
+        reader=MockReader(), writer=writer, n_threads=8, memory_budget=8
+    )
+
+    agent.run(make_transactions(40))
+    agent.close()
+
+    metrics = agent.metrics()["memory_budget"]
+    assert writer.count == 40
+    assert writer.max_running <= 2
+    assert metrics["peak"] <= 8
+    assert metrics["in_use"] == 0
+    assert metrics["waits"] > 0
+
+
+def test_invalid_bounds():
+    with pytest.raises(AssertionError):
+        AIMDController(4, 2)
@@ -0,0 +1,69 @@
+import pytest
+from forwarding_service import make_session
+from forwarding_service.database import (
+    create_db_engine,
+    dispose_engines,
+    get_engine,
+)
+from forwarding_service.schema import migrate
+from sqlalchemy import event, inspect
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    yield f"sqlite:///{tmp_path / 'db.sqlite'}"
+
+    dispose_engines()
+
+
+def test_sqlite_pragmas(db_url):
+    engine = create_db_engine(
+        db_url, cache_size=1024, mmap_size=2**20, busy_timeout=5
+    )
+
+    with engine.connect() as connection:
+
+        def pragma(name):
+            return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1  # NORMAL
+        assert pragma("cache_size") == -1024
+        assert pragma("mmap_size") == 2**20
+        assert pragma("busy_timeout") == 5000
+
+
+def test_engine_created_once_per_process(db_url):
+    assert get_engine(db_url) is get_engine(db_url)
+    assert make_session(db_url).get_bind() is get_engine(db_url)
+
+    dispose_engines()
+    assert get_engine(db_url) is not None
+
+
+def test_migration_skipped_when_schema_matches(db_url):
+    migrate(create_db_engine(db_url))
+
+    engine = create_db_engine(db_url)
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    assert migrate(engine) == []
+    assert not any("table_info" in s and "item" in s for s in statements)
+
+
+def test_migration_runs_when_schema_changed(db_url):
+    engine = create_db_engine(db_url)
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_item_job_id_in_uri")
+        connection.exec_driver_sql("UPDATE schema_version SET version = 'old'")
+
+    migrate(engine)
+
+    indexes = [i["name"] for i in inspect(engine).get_indexes("item")]
+    assert "ix_item_job_id_in_uri" in indexes
@@ -0,0 +1,81 @@
+import types
+
+import pytest
+from forwarding_service.file import FileSystemReader
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for path in ["a.txt", "sub/b.txt", "sub/deeper/c.txt", "other/d.txt"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b"data")
+    (tmp_path / "empty").mkdir()
+
+    yield tmp_path
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_scan_is_recursive(tree, n_threads):
+    reader = FileSystemReader(n_threads=n_threads)
+    entries = reader.scan(f"file://{tree}/")
+
+    assert isinstance(entries, types.GeneratorType)
+    entries = {entry.path: entry.uri for entry in entries}
+    assert entries == {
+        "a.txt": f"file://{tree}/a.txt",
+        "sub/b.txt": f"file://{tree}/sub/b.txt",
+        "sub/deeper/c.txt": f"file://{tree}/sub/deeper/c.txt",
+        "other/d.txt": f"file://{tree}/other/d.txt",
+    }
+
+
+def test_scan_without_trailing_slash(tree):
+    paths = {entry.path for entry in FileSystemReader().scan(f"file://{tree}")}
+    assert "sub/b.txt" in paths
+
+
+def test_scan_directories(tree):
+    paths = {
+        entry.path
+        for entry in FileSystemReader().scan(
+            f"file://{tree}/", files_only=False
+        )
+    }
+    assert {"sub", "sub/deeper", "empty"} <= paths
+
+
+def test_scan_single_file(tree):
+    entries = list(FileSystemReader().scan(f"file://{tree}/sub/b.txt"))
+
+    assert len(entries) == 1
+    assert entries[0].path == "b.txt"
+    assert entries[0].uri == f"file://{tree}/sub/b.txt"
+
+
+def test_out_uri_mirrors_tree(tree, job_manager):
+    job_manager.transfer_agent.reader = FileSystemReader()
+    job = job_manager.init(f"file://{tree}/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+
+    out_uris = {item.out_uri for item in job.items}
+    assert "s3://bucket/project/sub/deeper/c.txt" in out_uris
+    assert len(out_uris) == 4
+
+
+def test_scan_records_size_and_mtime(tree):
+    entries = {e.path: e for e in FileSystemReader().scan(f"file://{tree}/")}
+
+    assert entries["sub/b.txt"].size == 4
+    assert entries["sub/b.txt"].mtime == (tree / "sub/b.txt").stat().st_mtime
+
+
+def test_items_record_size_and_mtime(tree, job_manager):
+    (tree / "a.txt").write_bytes(b"x" * 1000)
+    job_manager.transfer_agent.reader = FileSystemReader()
+    job = job_manager.init(f"file://{tree}/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+
+    sizes = {item.out_uri.split("/")[-1]: item.size for item in job.items}
+    assert sizes["a.txt"] == 1000
+    assert sizes["c.txt"] == 4
+    assert all(item.mtime is not None for item in job.items)
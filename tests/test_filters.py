@@ -0,0 +1,114 @@
+import os
+from datetime import datetime
+
+import pytest
+from forwarding_service.exceptions import InitException
+from forwarding_service.file import FileSystemReader
+from forwarding_service.filters import Filter, FilterSpec
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for path, size in [
+        ("a.txt", 4),
+        ("b.tif", 100),
+        ("sub/c.tif", 10),
+        ("tmp/d.tif", 10),
+        ("sub/tmp/e.tif", 10),
+    ]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b"x" * size)
+
+    yield tmp_path
+
+
+def scan(tree, spec=None, regexp=None):
+    reader = FileSystemReader(n_threads=2)
+    return {
+        entry.path
+        for entry in reader.scan(
+            f"file://{tree}/", filter=Filter(spec, regexp=regexp)
+        )
+    }
+
+
+def test_glob_include_exclude():
+    f = Filter(FilterSpec(include=["*.tif"], exclude=["tmp/*"]))
+
+    assert f.match("file:///x/b.tif", "b.tif")
+    assert f.match("file:///x/sub/c.tif", "sub/c.tif")
+    assert not f.match("file:///x/a.txt", "a.txt")
+    assert not f.match("file:///x/tmp/d.tif", "tmp/d.tif")
+
+
+def test_job_regexp_matches_uri():
+    f = Filter(regexp=r".*\.tif$")
+
+    assert f.match("file:///x/b.tif", "b.tif")
+    assert not f.match("file:///x/a.txt", "a.txt")
+
+
+def test_scan_applies_filter(tree):
+    assert scan(tree, FilterSpec(include=["*.tif"])) == {
+        "b.tif",
+        "sub/c.tif",
+        "tmp/d.tif",
+        "sub/tmp/e.tif",
+    }
+    assert scan(tree, FilterSpec(exclude_regex=[r"(.*/)?tmp/"])) == {
+        "a.txt",
+        "b.tif",
+        "sub/c.tif",
+    }
+
+
+def test_excluded_directories_are_not_walked(tree, monkeypatch):
+    walked = []
+    scandir = os.scandir
+
+    def recording_scandir(path):
+        walked.append(os.path.relpath(path, tree))
+        return scandir(path)
+
+    monkeypatch.setattr("forwarding_service.file.os.scandir", recording_scandir)
+    paths = scan(tree, FilterSpec(exclude=["tmp/", "*/tmp/"]))
+
+    assert paths == {"a.txt", "b.tif", "sub/c.tif"}
+    assert "tmp" not in walked
+    assert os.path.join("sub", "tmp") not in walked
+
+
+def test_size_and_mtime(tree):
+    assert scan(tree, FilterSpec(min_size=10, max_size=50)) == {
+        "sub/c.tif",
+        "tmp/d.tif",
+        "sub/tmp/e.tif",
+    }
+
+    old = datetime(2000, 1, 1).timestamp()
+    os.utime(tree / "a.txt", (old, old))
+    cutoff = datetime(2001, 1, 1)
+    assert "a.txt" not in scan(tree, FilterSpec(newer_than=cutoff))
+    assert scan(tree, FilterSpec(older_than=cutoff)) == {"a.txt"}
+
+
+def test_init_stores_filter_spec(job_manager):
+    job = job_manager.init(
+        "file:///root/path/project/",
+        "s3://bucket/",
+        filter_spec=FilterSpec(include=["*.tif"]),
+    )
+
+    assert job.filter_spec == {"include": ["*.tif"]}
+    assert Filter.from_job(job).match(
+        "file:///root/path/project/a.tif", "a.tif"
+    )
+
+
+def test_init_rejects_invalid_regex(job_manager):
+    with pytest.raises(InitException):
+        job_manager.init(
+            "file:///root/path/project/",
+            "s3://bucket/",
+            filter_spec={"include_regex": ["("]},
+        )
@@ -1,4 +1,5 @@
 import pytest
+from sqlmodel import Session
 from forwarding_service.enum_types import ItemStatus, JobError, JobStatus
 from forwarding_service.exceptions import InitDuplicateJobException
 from forwarding_service.models import Item, Job
@@ -19,7 +20,7 @@ def test_multiple_files_job(job_manager, n_threads, in_, out_):
     job_manager.run(job)
     assert job.status == JobStatus.DONE
     assert job.error == JobError.NONE
-    assert job.num_done_items() == len(job.items)
+    assert job.num_done_items == len(job.items)
     assert all(item.transferred_at > item.created_at for item in job.items)
     assert len(job.items) == job_manager.transfer_agent.writer.count
 
@@ -65,7 +66,17 @@ def test_resume_failed_job(job_manager, failed_job):
     job = job_manager.resume(failed_job)
     assert job.status == JobStatus.DONE
     assert job.error == JobError.NONE
-    assert job.num_done_items() == len(job.items)
+    assert job.num_done_items == len(job.items)
+
+
+def test_resume_job_of_another_session(job_manager, failed_job, engine):
+    # as loaded by the command line
+    other = Query(Session(engine), Job).get(JobQueryArgs(id=failed_job.id))[0]
+    job = job_manager.resume(other)
+
+    assert job is failed_job
+    assert job.status == JobStatus.DONE
+    assert job.num_done_items == len(job.items)
 
 
 def test_resume_completed_job(job_manager, completed_job):
@@ -105,3 +116,13 @@ def test_delete_job(session, completed_job):
     items = Query(session, Item).get()
     assert len(jobs) == 0
     assert len(items) == 0
+
+
+def test_job_manager_delete(session, job_manager, completed_job):
+    # loaded items are deleted along with the others
+    assert len(completed_job.items) == 10
+
+    job_manager.delete(completed_job)
+
+    assert session.query(Job).count() == 0
+    assert session.query(Item).count() == 0
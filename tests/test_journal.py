@@ -0,0 +1,69 @@
+import pytest
+from forwarding_service.commands import Command, UpdateItemStatusCommand
+from forwarding_service.enum_types import ItemStatus
+from forwarding_service.journal import Journal
+from forwarding_service.models import Transaction
+from sqlmodel import Session
+
+
+class RecordGroupCommand(Command):
+    def __init__(self):
+        self.groups = []
+
+    def execute(self, payload):
+        self.groups.append(len(payload))
+
+
+class FailingCommand(Command):
+    def execute(self, payload):
+        raise ValueError("cannot write")
+
+
+def test_journal_groups_transactions():
+    command = RecordGroupCommand()
+    journal = Journal([command], interval=10)
+    journal.start()
+    for i in range(100):
+        journal.put(Transaction(item_id=str(i), success=True))
+    journal.close()
+
+    assert command.groups == [100]
+
+
+def test_journal_flush():
+    command = RecordGroupCommand()
+    journal = Journal([command], interval=10)
+    journal.start()
+    for i in range(5):
+        journal.put(Transaction(item_id=str(i), success=True))
+    journal.flush()
+
+    assert command.groups == [5]
+    journal.close()
+
+
+def test_journal_records_items(engine, session, job_manager):
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+    session.commit()
+
+    journal_session = Session(engine)
+    journal = Journal(
+        [UpdateItemStatusCommand(journal_session)], session=journal_session
+    )
+    journal.start()
+    for item in job.items:
+        journal.put(Transaction(item_id=item.id, success=True))
+    journal.close()
+
+    session.expire_all()
+    assert all(item.status == ItemStatus.TRANSFERRED for item in job.items)
+
+
+def test_journal_raises_on_close():
+    journal = Journal([FailingCommand()])
+    journal.start()
+    journal.put(Transaction(item_id="0"))
+
+    with pytest.raises(ValueError):
+        journal.close()
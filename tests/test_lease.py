@@ -0,0 +1,124 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session, SQLModel
+
+from forwarding_service.database import create_db_engine
+from forwarding_service.enum_types import ItemStatus, JobStatus, TransferOrder
+from forwarding_service.job_manager import JobManager
+from forwarding_service.lease import ItemLeases
+from forwarding_service.models import Item, Job
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter
+
+
+class RecordingWriter(MockWriter):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, stream, uri, *args, **kwargs):
+        time.sleep(0.005)
+        with self.lock:
+            self.sent.append(uri)
+
+
+def parsed_job(job_manager):
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    return job_manager.parse_and_commit_items(job)
+
+
+def test_claims_in_batches(job_manager, session):
+    job = parsed_job(job_manager)
+    leases = ItemLeases(owner="a", batch_size=4)
+
+    batches = list(leases.claims(session, job))
+
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    ids = [row.id for batch in batches for row in batch]
+    assert sorted(ids) == sorted(item.id for item in job.items)
+    session.expire_all()
+    assert all(item.lease_owner == "a" for item in job.items)
+
+
+def test_leased_items_are_skipped_until_expiry(job_manager, session):
+    job = parsed_job(job_manager)
+    a = ItemLeases(owner="a", ttl=60, batch_size=100)
+    b = ItemLeases(owner="b", ttl=60, batch_size=100)
+
+    assert len(a.claim(session, job)) == 10
+    assert b.claim(session, job) == []
+
+    # a stopped renewing its leases
+    session.execute(
+        update(Item).values(
+            lease_expires_at=datetime.utcnow() - timedelta(seconds=1)
+        )
+    )
+    session.commit()
+
+    assert len(b.claim(session, job)) == 10
+    session.expire_all()
+    assert all(item.lease_owner == "b" for item in job.items)
+
+
+def test_renew_and_release(job_manager, session):
+    job = parsed_job(job_manager)
+    a = ItemLeases(owner="a", batch_size=100)
+    a.claim(session, job)
+
+    assert a.renew(session) == 10
+    assert a.release(session) == 10
+    assert len(ItemLeases(owner="b").claim(session, job)) == 10
+
+
+def test_claim_skips_locked_rows():
+    job = Job(source="file:///root/", destination="s3://bucket/")
+    statements = ItemLeases()._claim_statements(
+        job, TransferOrder.LARGEST_FIRST, datetime.utcnow()
+    )
+
+    for statement, _ in statements:
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        assert sql.startswith("UPDATE item SET lease_owner")
+        assert "FOR UPDATE SKIP LOCKED" in sql
+
+
+def test_workers_share_a_job(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'shared.db'}")
+    SQLModel.metadata.create_all(engine)
+    reader, writer = MockReader(), RecordingWriter()
+
+    def make_job_manager(owner=None):
+        return JobManager(
+            session=Session(engine),
+            transfer_agent=TransferAgent(reader, writer, n_threads=2),
+            leases=ItemLeases(owner=owner, batch_size=2) if owner else None,
+        )
+
+    job_manager = make_job_manager()
+    job_id = parsed_job(job_manager).id
+
+    def work(owner):
+        job_manager = make_job_manager(owner)
+        job_manager.run(job_manager.session.get(Job, job_id))
+
+    workers = [
+        threading.Thread(target=work, args=(owner,)) for owner in ["a", "b"]
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    with Session(engine) as session:
+        items = session.query(Item).all()
+        assert sorted(writer.sent) == sorted(item.out_uri for item in items)
+        assert all(item.status == ItemStatus.TRANSFERRED for item in items)
+        assert all(item.lease_owner is None for item in items)
+        assert session.get(Job, job_id).status == JobStatus.DONE
@@ -0,0 +1,214 @@
+import io
+
+import pytest
+from forwarding_service.base import BaseReader
+from forwarding_service.enum_types import ItemStatus
+from forwarding_service.exceptions import CheckSumException, TransferException
+from forwarding_service.models import Item, Part, Transaction
+from forwarding_service.multipart import MultipartTransfer
+from forwarding_service.s3 import MiB, S3Writer
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockBotoSession
+
+DATA = bytes(range(256)) * (23 * MiB // 256)
+
+
+class BigFileReader(BaseReader):
+    def read(self, *args, **kwargs):
+        return io.BytesIO(DATA)
+
+    def exists(self, *args, **kwargs):
+        return True
+
+    def list(self, uri, *args, **kwargs):
+        return [uri]
+
+
+class FailingPartWriter(S3Writer):
+    def upload_part(self, body, uri, upload_id, part_number):
+        if part_number == 2:
+            raise TransferException(error="failed part", operation="UploadPart")
+        return super().upload_part(body, uri, upload_id, part_number)
+
+
+class CorruptUploadWriter(S3Writer):
+    """Parts reported corrupt on completion, and upload that cannot be
+    aborted"""
+
+    def complete_multipart_upload(self, uri, upload_id, parts):
+        raise CheckSumException(
+            error="BadDigest", operation="CompleteMultipartUpload"
+        )
+
+    def abort_multipart_upload(self, uri, upload_id):
+        raise TransferException(
+            error="connection reset", operation="AbortMultipartUpload"
+        )
+
+
+@pytest.fixture
+def agent():
+    writer = S3Writer(
+        MockBotoSession(), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    yield TransferAgent(reader=BigFileReader(), writer=writer)
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_parts_of_one_file(agent, n_threads):
+    agent.n_threads = n_threads
+    transaction = Transaction(
+        item_id="0", input="file:///big.bin", output="s3://bucket/big.bin"
+    )
+    agent.run([transaction])
+
+    client = agent.writer.client
+    assert transaction.success
+    assert client.calls.count("UploadPart") == 5
+    assert client.objects[("bucket", "big.bin")] == DATA
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_failed_part_keeps_upload(agent, n_threads):
+    agent.n_threads = n_threads
+    agent.writer = FailingPartWriter(
+        MockBotoSession(), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    transaction = Transaction(
+        item_id="0", input="file:///big.bin", output="s3://bucket/big.bin"
+    )
+    agent.run([transaction])
+
+    client = agent.writer.client
+    assert not transaction.success
+    assert isinstance(transaction.exception, TransferException)
+    assert transaction.upload_id in client.uploads
+    assert 2 not in [p["PartNumber"] for p in transaction.parts]
+    assert ("bucket", "big.bin") not in client.objects
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_resume_sends_missing_parts(agent, n_threads):
+    agent.n_threads = n_threads
+    session = MockBotoSession()
+    agent.writer = FailingPartWriter(
+        session, multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    transaction = Transaction(
+        item_id="0", input="file:///big.bin", output="s3://bucket/big.bin"
+    )
+    agent.run([transaction])
+    num_sent = len(transaction.parts)
+
+    agent.writer = S3Writer(
+        session, multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    client = agent.writer.client
+    client.calls = []
+    transaction = Transaction(
+        item_id="0",
+        input="file:///big.bin",
+        output="s3://bucket/big.bin",
+        upload_id=transaction.upload_id,
+        parts=transaction.parts,
+    )
+    agent.run([transaction])
+
+    assert transaction.success
+    assert client.calls.count("CreateMultipartUpload") == 0
+    assert client.calls.count("UploadPart") == 5 - num_sent
+    assert client.objects[("bucket", "big.bin")] == DATA
+
+
+def test_resume_expired_upload_restarts(agent):
+    transaction = Transaction(
+        item_id="0",
+        input="file:///big.bin",
+        output="s3://bucket/big.bin",
+        upload_id="expired",
+    )
+    agent.run([transaction])
+
+    client = agent.writer.client
+    assert transaction.success
+    assert client.calls.count("UploadPart") == 5
+    assert client.objects[("bucket", "big.bin")] == DATA
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_failed_abort_of_corrupt_upload(agent, n_threads):
+    agent.n_threads = n_threads
+    agent.writer = CorruptUploadWriter(
+        MockBotoSession(), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    transaction = Transaction(
+        item_id="0", input="file:///big.bin", output="s3://bucket/big.bin"
+    )
+    agent.run([transaction])
+
+    assert not transaction.success
+    assert isinstance(transaction.exception, CheckSumException)
+    # started again on the next attempt
+    assert transaction.upload_id is None and transaction.parts == []
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_failing_worker_ends_run(agent, n_threads, monkeypatch):
+    def part_done(self, part, exception):
+        raise RuntimeError("bug")
+
+    monkeypatch.setattr(MultipartTransfer, "part_done", part_done)
+    agent.n_threads = n_threads
+    transaction = Transaction(
+        item_id="0", input="file:///big.bin", output="s3://bucket/big.bin"
+    )
+    # the transaction never finishes, which must not hang the run
+    with pytest.raises(RuntimeError):
+        agent.run([transaction])
+
+
+def test_job_resume_and_delete(job_manager, session):
+    boto_session = MockBotoSession()
+    agent = job_manager.transfer_agent
+    agent.n_threads = 1
+    agent.reader = BigFileReader()
+    agent.writer = FailingPartWriter(
+        boto_session, multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    job = job_manager.init("file:///big.bin", "s3://bucket/big.bin")
+    job_manager.parse_and_commit_items(job)
+    with pytest.raises(TransferException):
+        job_manager.run(job)
+
+    item = job.items[0]
+    assert item.upload_id is not None
+    assert [p.part_number for p in item.parts] == [1]
+
+    agent.writer = S3Writer(
+        boto_session, multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    job_manager.resume(job)
+    assert item.status == ItemStatus.TRANSFERRED
+    assert item.upload_id is None
+    assert item.parts == []
+    assert session.query(Part).count() == 0
+
+
+def test_delete_job_aborts_upload(job_manager, session):
+    boto_session = MockBotoSession()
+    agent = job_manager.transfer_agent
+    agent.n_threads = 1
+    agent.reader = BigFileReader()
+    agent.writer = FailingPartWriter(
+        boto_session, multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+    job = job_manager.init("file:///big.bin", "s3://bucket/big.bin")
+    job_manager.parse_and_commit_items(job)
+    with pytest.raises(TransferException):
+        job_manager.run(job)
+
+    job_manager.delete(job)
+    assert agent.writer.client.uploads == {}
+    assert session.query(Item).count() == 0
+    assert session.query(Part).count() == 0
@@ -0,0 +1,77 @@
+import pytest
+from forwarding_service.enum_types import ItemStatus, JobStatus
+from forwarding_service.exceptions import JobNotParsedException
+from forwarding_service.models import Item
+
+from .conftest import MockReader
+
+
+class InterruptedReader(MockReader):
+    """Fails after listing 25 files"""
+
+    def list(self, uri, *args, **kwargs):
+        for i in range(30):
+            if i == 25:
+                raise OSError("lost connection to file system")
+            yield f"file:///root/path/project/file_{i}.ext"
+
+
+class FullReader(MockReader):
+    def list(self, uri, *args, **kwargs):
+        return [f"file:///root/path/project/file_{i}.ext" for i in range(30)]
+
+
+def test_parse_in_chunks(job_manager, session, monkeypatch):
+    job_manager.parse_chunk_size = 3
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+
+    def skip_committed_items(job, entries):
+        raise AssertionError("nothing to skip in a new parse")
+
+    monkeypatch.setattr(
+        job_manager, "_skip_committed_items", skip_committed_items
+    )
+    job_manager.parse_and_commit_items(job)
+
+    assert job.status == JobStatus.PARSED
+    assert job.num_items == len(job.items) == len(MockReader.files)
+
+
+def test_resume_interrupted_parse(job_manager, session):
+    job_manager.parse_chunk_size = 10
+    job_manager.lookup_chunk_size = 4
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+
+    job_manager.transfer_agent.reader = InterruptedReader()
+    with pytest.raises(OSError):
+        job_manager.parse_and_commit_items(job)
+    assert job.status == JobStatus.INIT
+    assert job.num_items == 20
+
+    job_manager.transfer_agent.reader = FullReader()
+    job_manager.parse_and_commit_items(job)
+
+    in_uris = [item.in_uri for item in session.query(Item)]
+    assert job.status == JobStatus.PARSED
+    assert job.num_items == 30
+    assert sorted(in_uris) == sorted(set(in_uris))
+    assert len(in_uris) == 30
+
+
+def test_resume_job_with_interrupted_parse(job_manager, session):
+    job_manager.parse_chunk_size = 10
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+
+    job_manager.transfer_agent.reader = InterruptedReader()
+    with pytest.raises(OSError):
+        job_manager.parse_and_commit_items(job)
+    with pytest.raises(JobNotParsedException):
+        job_manager.run(job)
+    assert job.num_items == 20
+
+    job_manager.transfer_agent.reader = FullReader()
+    job_manager.resume(job)
+
+    assert job.status == JobStatus.DONE
+    assert job.num_items == job.num_done_items == 30
+    assert all(item.status == ItemStatus.TRANSFERRED for item in job.items)
@@ -0,0 +1,128 @@
+import os
+from functools import partial
+from pathlib import Path
+
+from forwarding_service.base import BaseWriter
+from forwarding_service.enum_types import JobStatus
+from forwarding_service.exceptions import TransferException
+from forwarding_service.job_manager import JobManager
+from forwarding_service.process_agent import ProcessTransferAgent
+from forwarding_service.retry import RetryPolicy
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter, RecordCommand, make_transactions
+
+
+class PidWriter(BaseWriter):
+    """
+    Writes the pid of the worker to directory, under the name of the
+    object. With fail, the first attempt of each object fails, or, with
+    crash, the first attempt of object crash kills the worker: attempts
+    are marked on disk, as they are made by several processes.
+    """
+
+    def __init__(self, directory, fail=False, crash=None):
+        self.directory = Path(directory)
+        self.fail = fail
+        self.crash = crash
+
+    def __call__(self, stream, uri, *args, **kwargs):
+        name = uri.rsplit("/", 1)[-1]
+        marker = self.directory / f"{name}.attempted"
+        first_attempt = not marker.exists()
+        marker.touch()
+
+        if first_attempt and self.fail:
+            raise TransferException(error="first attempt", operation="")
+        if first_attempt and name == self.crash:
+            os._exit(1)
+
+        (self.directory / name).write_text(str(os.getpid()))
+
+
+def make_agent(directory, **kwargs):
+    writer = PidWriter(directory, **kwargs)
+    return TransferAgent(MockReader(), writer, n_threads=2)
+
+
+def written(directory, n):
+    return [
+        int((directory / f"file_{i}.ext").read_text()) for i in range(n)
+    ]
+
+
+def test_run(tmp_path):
+    transaction_command, batch_command = RecordCommand(), RecordCommand()
+    agent = ProcessTransferAgent(
+        MockReader(),
+        MockWriter(),
+        make_agent=partial(make_agent, tmp_path),
+        n_processes=3,
+        max_in_flight_per_process=4,
+        post_transaction_commands=[transaction_command],
+        post_batch_commands=[batch_command],
+        checkpoint_every=10,
+    )
+    transactions = make_transactions(30)
+
+    agent.run(transactions)
+
+    assert all(t.success and t.attempts == 1 for t in transactions)
+    assert len(transaction_command.payloads) == 30
+    assert sum(len(batch) for batch in batch_command.payloads) == 30
+    # sent by workers only
+    assert os.getpid() not in written(tmp_path, 30)
+
+
+def test_retries_in_parent(tmp_path):
+    command = RecordCommand()
+    agent = ProcessTransferAgent(
+        MockReader(),
+        MockWriter(),
+        make_agent=partial(make_agent, tmp_path, fail=True),
+        n_processes=2,
+        post_transaction_commands=[command],
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001),
+    )
+    transactions = make_transactions(5)
+
+    agent.run(transactions)
+
+    retried = [t for t in command.payloads if t.retry]
+    succeeded = [t for t in command.payloads if t.success]
+    assert len(retried) == 5
+    assert sorted(t.item_id for t in succeeded) == [str(i) for i in range(5)]
+    assert all(t.attempts == 2 for t in succeeded)
+
+
+def test_lost_worker(tmp_path):
+    command = RecordCommand()
+    agent = ProcessTransferAgent(
+        MockReader(),
+        MockWriter(),
+        make_agent=partial(make_agent, tmp_path, crash="file_3.ext"),
+        n_processes=2,
+        post_transaction_commands=[command],
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001),
+    )
+
+    agent.run(make_transactions(10))
+
+    lost = [t for t in command.payloads if t.item_id == "3"]
+    assert lost[0].retry and "exited with code 1" in lost[0].exception.error
+    assert lost[-1].success
+    assert len(written(tmp_path, 10)) == 10
+
+
+def test_job_manager_with_process_agent(session, tmp_path):
+    agent = ProcessTransferAgent(
+        MockReader(), MockWriter(), make_agent=partial(make_agent, tmp_path)
+    )
+    job_manager = JobManager(session=session, transfer_agent=agent)
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/")
+    job_manager.parse_and_commit_items(job)
+
+    job = job_manager.run(job)
+
+    assert job.status == JobStatus.DONE
+    assert job.num_done_items == 10
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from forwarding_service.enum_types import ItemStatus, TransferOrder
+from forwarding_service.commands import (
+    RefreshJobProgressCommand,
+    UpdateItemStatusCommand,
+)
+from forwarding_service.models import Item, Job, Transaction
+from forwarding_service.progress import format_eta
+from forwarding_service.query import JobQueryArgs, Query
+
+
+@pytest.fixture
+def sized_job(session, job_manager):
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+    # sizes 0..7, and two items of unknown size
+    for n, item in enumerate(sorted(job.items, key=lambda i: i.in_uri)):
+        item.size = n if n < 8 else None
+    session.commit()
+
+    yield job
+
+
+@pytest.mark.parametrize(
+    "order, expected",
+    [
+        (TransferOrder.LARGEST_FIRST, [7, 6, 5, 4, 3, 2, 1, 0, None, None]),
+        (TransferOrder.MIXED, [7, 0, 6, 1, 5, 2, 4, 3, None, None]),
+        (TransferOrder.SCAN, [0, 1, 2, 3, 4, 5, 6, 7, None, None]),
+    ],
+)
+def test_pending_items_order(job_manager, sized_job, order, expected):
+    job_manager.order = order
+    job_manager.page_size = 3
+
+    rows = list(job_manager._pending_items(sized_job))
+
+    assert [r.size for r in rows] == expected
+
+
+def test_pending_items_are_paged(job_manager, sized_job, engine):
+    from sqlalchemy import event
+
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    job_manager.page_size = 4
+    transactions = job_manager._pending_transactions(sized_job)
+
+    first = next(transactions)
+    assert first.output.endswith("file_7.ext")
+    # first page only
+    assert sum("FROM item" in s for s in statements) == 1
+
+    assert len([first] + list(transactions)) == 10
+
+
+def test_format_eta():
+    assert format_eta(3600 * 100, 100) == "1:00:00"
+    assert format_eta(0, 100) is None
+    assert format_eta(100, None) is None
+
+
+def test_job_reports_bytes(session, job_manager):
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+    session.execute(update(Item).values(size=1000))
+    session.commit()
+
+    job_manager.run(job)
+    result = job.to_detailed_dict()
+
+    assert result["total_num_items"] == 10
+    assert result["num_done_items"] == 10
+    assert result["num_bytes"] == 10000
+    assert result["num_done_bytes"] == 10000
+    assert result["run_done_bytes"] == 10000
+    assert result["progress"] == "100.0%"
+    assert result["eta"] is None
+
+
+def test_progress_and_eta():
+    now = datetime.now()
+    job = Job(
+        source="file:///root/path/project/",
+        destination="s3://bucket/project/",
+        regexp=".*",
+        num_items=10,
+        num_bytes=10000,
+        num_done_items=5,
+        num_done_bytes=4000,
+        run_started_at=now - timedelta(seconds=4),
+        run_done_bytes=4000,
+        last_transfer_at=now,
+    )
+    result = job.to_detailed_dict()
+
+    assert result["progress"] == "40.0%"
+    assert job.throughput() == pytest.approx(1000)
+    assert result["eta"] == "0:00:06"
+
+
+def test_counters_follow_item_status(session, completed_job, job_manager):
+    item = completed_job.items[0]
+    item.status = ItemStatus.PENDING
+    session.commit()
+
+    # recount from items, e.g. after a manual edit
+    RefreshJobProgressCommand(session).execute()
+    session.refresh(completed_job)
+    assert completed_job.num_done_items == 9
+
+    transaction = Transaction(item_id=item.id, success=True)
+    UpdateItemStatusCommand(session).execute([transaction])
+    # already transferred, not counted twice
+    UpdateItemStatusCommand(session).execute([transaction])
+    session.refresh(completed_job)
+    assert completed_job.num_done_items == 10
+    assert completed_job.last_transfer_at is not None
+
+
+def test_job_listing_does_not_load_items(session, completed_job, engine):
+    from sqlalchemy import event
+
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    session.expire_all()
+    jobs = Query(session, Job).get(JobQueryArgs())
+    [job.to_detailed_dict() for job in jobs]
+
+    assert len(statements) == 1
+    assert "FROM item" not in statements[0]
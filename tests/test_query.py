@@ -1,6 +1,9 @@
+import uuid
+
+import pytest
 from forwarding_service.enum_types import JobStatus
-from forwarding_service.models import Job
-from forwarding_service.query import JobQueryArgs, Query
+from forwarding_service.models import Item, Job
+from forwarding_service.query import ItemQueryArgs, JobQueryArgs, Query
 
 
 def test_get_items(session, completed_job):
@@ -14,3 +17,74 @@ def test_get_jobs(session, completed_job):
     query = Query(session, Job)
     result = query.get(JobQueryArgs(status=JobStatus.DONE))
     assert result[0].id == completed_job.id
+
+
+def test_exists(session, completed_job):
+    assert Query(session, Job).exists(completed_job.id)
+    assert not Query(session, Job).exists(uuid.uuid4())
+    assert not Query(session, Item).exists(completed_job.id)
+
+
+@pytest.mark.parametrize("sort_on", [None, "in_uri", "created_at"])
+def test_items_pages(session, completed_job, sort_on):
+    query = Query(session, Item)
+    args = ItemQueryArgs(job_id=completed_job.id, limit=3, sort_on=sort_on)
+
+    pages = []
+    while True:
+        items, after = query.page(args)
+        pages.append(items)
+        if after is None:
+            break
+        args = args.copy(update={"after": after})
+
+    assert [len(p) for p in pages] == [3, 3, 3, 1]
+    ids = [item.id for page in pages for item in page]
+    assert sorted(ids) == sorted(item.id for item in completed_job.items)
+    if sort_on is not None:
+        values = [getattr(item, sort_on) for page in pages for item in page]
+        assert values == sorted(values, reverse=True)
+
+
+def test_pages_sorted_on_nullable_column(session, completed_job):
+    for i, item in enumerate(completed_job.items):
+        # ties, and unknown sizes on page boundaries
+        item.size = None if i % 4 == 0 else i % 3
+    session.commit()
+    query = Query(session, Item)
+    args = ItemQueryArgs(job_id=completed_job.id, limit=2, sort_on="size")
+
+    items = []
+    while True:
+        page, after = query.page(args)
+        items += page
+        if after is None:
+            break
+        args = args.copy(update={"after": after})
+
+    assert sorted(item.id for item in items) == sorted(
+        item.id for item in completed_job.items
+    )
+    sizes = [item.size for item in items]
+    assert sizes == [2, 2, 1, 1, 0, 0, 0, None, None, None]
+
+
+def test_jobs_pages(session, job_manager):
+    for n in range(3):
+        job_manager.init("file:///root/path/project/", f"s3://bucket/{n}/")
+    query = Query(session, Job)
+
+    first, after = query.page(JobQueryArgs(limit=2))
+    second, last = query.page(JobQueryArgs(limit=2, after=after))
+
+    assert [j.destination for j in first + second] == [
+        "s3://bucket/2/",
+        "s3://bucket/1/",
+        "s3://bucket/0/",
+    ]
+    assert last is None
+
+
+def test_invalid_page_token(session):
+    with pytest.raises(ValueError):
+        Query(session, Job).page(JobQueryArgs(after="not a token"))
@@ -0,0 +1,102 @@
+import threading
+from collections import Counter
+
+import pytest
+from forwarding_service.base import BaseWriter
+from forwarding_service.enum_types import ItemStatus, JobError
+from forwarding_service.exceptions import (
+    AuthenticationError,
+    RemoteException,
+    ThrottleException,
+    TransferException,
+)
+from forwarding_service.models import Transaction
+from forwarding_service.retry import RetryPolicy
+
+
+class FlakyWriter(BaseWriter):
+    """Throttles the first num_failures attempts to each uri"""
+
+    def __init__(self, num_failures=2, failing=None):
+        self.num_failures = num_failures
+        self.failing = failing
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, stream, uri, *args, **kwargs):
+        with self.lock:
+            self.calls[uri] += 1
+            num_calls = self.calls[uri]
+        if uri == self.failing or num_calls <= self.num_failures:
+            raise ThrottleException(
+                error="Please reduce your request rate.", operation="PutObject"
+            )
+
+
+def transaction(exception, attempts=1):
+    t = Transaction(item_id="1", attempts=attempts)
+    t.exception = exception
+    return t
+
+
+def test_delay_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+
+    delays = [policy.delay(3) for _ in range(100)]
+    assert all(0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+    assert all(policy.delay(20) <= 10.0 for _ in range(100))
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.should_retry(transaction(ThrottleException("", "")))
+    assert policy.should_retry(transaction(TransferException("", "")))
+    assert not policy.should_retry(transaction(TransferException("", ""), 3))
+    assert not policy.should_retry(transaction(AuthenticationError("", "")))
+    assert not policy.should_retry(transaction(FileNotFoundError()))
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_throttled_items_are_retried(job_manager, n_threads):
+    writer = FlakyWriter(num_failures=2)
+    agent = job_manager.transfer_agent
+    agent.writer = writer
+    agent.n_threads = n_threads
+    agent.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+    job_manager.run(job)
+
+    assert job.error == JobError.NONE
+    assert all(item.status == ItemStatus.TRANSFERRED for item in job.items)
+    assert all(item.attempts == 3 for item in job.items)
+    assert "ThrottleException (PutObject)" in job.items[0].last_error
+    assert all(n == 3 for n in writer.calls.values())
+
+
+def test_item_failing_after_max_attempts(job_manager):
+    failing = "s3://bucket/project/file_3.ext"
+    writer = FlakyWriter(num_failures=0, failing=failing)
+    agent = job_manager.transfer_agent
+    agent.writer = writer
+    agent.n_threads = 4
+    agent.retry_policy = RetryPolicy(max_attempts=4, base_delay=0.001)
+
+    job = job_manager.init("file:///root/path/project/", "s3://bucket/project/")
+    job_manager.parse_and_commit_items(job)
+    with pytest.raises(RemoteException):
+        job_manager.run(job)
+
+    assert job.error == JobError.TRANSFER_ERROR
+    assert writer.calls[failing] == 4
+    item = next(item for item in job.items if item.out_uri == failing)
+    assert item.status == ItemStatus.PENDING
+    assert item.attempts == 4
+    assert item.last_error.startswith("ThrottleException")
+
+    others = [item for item in job.items if item.out_uri != failing]
+    assert all(item.status == ItemStatus.TRANSFERRED for item in others)
+    assert all(item.attempts == 1 for item in others)
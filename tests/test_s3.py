@@ -0,0 +1,149 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import pytest
+from forwarding_service.s3 import MiB, S3Writer, transfer_config
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockBotoSession, MockReader
+
+
+class TrackingStream(io.BytesIO):
+    """Remembers the largest read, i.e. what is held in memory at once"""
+
+    max_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.max_read = max(self.max_read, len(data))
+        return data
+
+
+@pytest.fixture
+def writer():
+    yield S3Writer(
+        MockBotoSession(), multipart_threshold=8 * MiB, part_size=5 * MiB
+    )
+
+
+def test_small_object_single_put(writer):
+    writer(io.BytesIO(b"test"), "s3://bucket/project/file.ext")
+
+    assert writer.client.calls == ["PutObject"]
+    assert writer.client.objects[("bucket", "project/file.ext")] == b"test"
+
+
+def test_large_object_multipart(writer):
+    data = bytes(range(256)) * (12 * MiB // 256 + 1)
+    stream = TrackingStream(data)
+    writer(stream, "s3://bucket/project/file.ext")
+
+    assert writer.client.calls.count("UploadPart") == 3
+    assert writer.client.calls[-1] == "CompleteMultipartUpload"
+    assert writer.client.objects[("bucket", "project/file.ext")] == data
+    assert stream.max_read <= writer.part_size
+
+
+def test_part_size_grows_with_object_size(writer):
+    size = 100 * 1024 * MiB
+    part_size = writer.get_part_size(size)
+
+    assert part_size % MiB == 0
+    assert -(-size // part_size) <= 10000
+    assert writer.get_part_size(20 * MiB) == writer.part_size
+
+
+class PutHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("ETag", '"0"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_s3(monkeypatch):
+    """boto3 session whose S3 clients talk to a local keep-alive server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PutHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(
+        "AWS_ENDPOINT_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+
+    yield boto3.Session(
+        aws_access_key_id="key",
+        aws_secret_access_key="secret",
+        region_name="us-east-1",
+    )
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_transfer_config():
+    config = transfer_config(32)
+
+    assert config.max_pool_connections == 32
+    assert config.tcp_keepalive
+
+
+def test_pool_only_grows(local_s3):
+    writer = S3Writer(local_s3, max_concurrency=4)
+    client = writer.client
+    assert client.meta.config.max_pool_connections == 4
+
+    writer.set_concurrency(2)
+    assert writer.client is client
+
+    writer.set_concurrency(16)
+    assert writer.client.meta.config.max_pool_connections == 16
+
+
+def test_agent_sizes_writer_pool():
+    writer = S3Writer(MockBotoSession())
+    agent = TransferAgent(reader=MockReader(), writer=writer, n_threads=24)
+    agent._get_pool()
+    agent.close()
+
+    assert writer.max_concurrency == 24
+
+
+def test_connections_are_reused(local_s3):
+    writer = S3Writer(local_s3, max_concurrency=1)
+    for i in range(5):
+        writer(io.BytesIO(b"test"), f"s3://bucket/file_{i}")
+
+    assert writer.metrics.requests == 5
+    assert writer.metrics.connections == 1
+    assert writer.metrics.reused == 4
+
+
+def test_undersized_pool_discards_connections(local_s3):
+    def send(writer, n_threads):
+        with ThreadPoolExecutor(n_threads) as pool:
+            list(
+                pool.map(
+                    lambda i: writer(io.BytesIO(b"test"), f"s3://bucket/f{i}"),
+                    range(200),
+                )
+            )
+        return writer.metrics
+
+    sized = send(S3Writer(local_s3, max_concurrency=8), 8)
+    assert sized.requests == 200
+    assert sized.connections <= 8
+    assert sized.discarded == 0
+
+    undersized = send(S3Writer(local_s3, max_concurrency=1), 8)
+    assert undersized.discarded > 0
+    assert undersized.connections > 1
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from forwarding_service.database import create_db_engine
+from forwarding_service.enum_types import JobError, JobStatus
+from forwarding_service.exceptions import TransferException
+from forwarding_service.job_manager import JobManager
+from forwarding_service.scheduler import JobScheduler
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter
+
+
+class RecordingWriter(MockWriter):
+    """Records the project of each file sent, and the most files of each
+    project sent at once. Files of failing projects fail"""
+
+    def __init__(self, delay=0.0, failing=()):
+        super().__init__()
+        self.delay = delay
+        self.failing = failing
+        self.sent = []
+        self.sending = Counter()
+        self.max_sending = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, stream, uri, *args, **kwargs):
+        project = uri.split("/")[-2]
+        with self.lock:
+            self.sending[project] += 1
+            self.max_sending[project] = max(
+                self.max_sending[project], self.sending[project]
+            )
+        time.sleep(self.delay)
+        with self.lock:
+            self.sending[project] -= 1
+            self.sent.append(project)
+        if project in self.failing:
+            raise TransferException(error="failed", operation="")
+
+
+@pytest.fixture
+def make_job_manager(tmp_path):
+    # sessions of the scheduler and of the journal are used at once
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'scheduler.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    def make(writer, n_threads=1):
+        return JobManager(
+            session=Session(engine),
+            transfer_agent=TransferAgent(
+                MockReader(), writer, n_threads=n_threads
+            ),
+        )
+
+    yield make
+
+
+def add_job(job_manager, project, **kwargs):
+    job = job_manager.init(
+        f"file:///root/path/{project}/", f"s3://bucket/{project}/", **kwargs
+    )
+    return job_manager.parse_and_commit_items(job)
+
+
+def test_priorities(make_job_manager):
+    writer = RecordingWriter()
+    job_manager = make_job_manager(writer)
+    ended = []
+    scheduler = JobScheduler(job_manager, on_finished=ended.append)
+    urgent = add_job(job_manager, "project", priority=3)
+    backfill = add_job(job_manager, "otherproject")
+    scheduler.add(urgent.id)
+    scheduler.add(backfill.id)
+
+    scheduler.run()
+
+    sent = Counter(writer.sent[:8])
+    assert sent == {"project": 6, "otherproject": 2}
+    assert ended == [urgent, backfill]
+    assert urgent.status == backfill.status == JobStatus.DONE
+    assert urgent.num_done_items == backfill.num_done_items == 10
+
+
+def test_max_transfers(make_job_manager):
+    writer = RecordingWriter(delay=0.01)
+    job_manager = make_job_manager(writer, n_threads=4)
+    scheduler = JobScheduler(job_manager)
+    capped = add_job(job_manager, "project", max_transfers=1)
+    other = add_job(job_manager, "otherproject")
+    scheduler.add(capped.id)
+    scheduler.add(other.id)
+
+    scheduler.run()
+
+    assert writer.max_sending["project"] == 1
+    assert writer.max_sending["otherproject"] >= 3
+    assert capped.status == other.status == JobStatus.DONE
+
+
+def test_job_added_while_running(make_job_manager):
+    writer = RecordingWriter(delay=0.02)
+    job_manager = make_job_manager(writer, n_threads=2)
+    scheduler = JobScheduler(job_manager)
+    running = add_job(job_manager, "project")
+    added = add_job(job_manager, "otherproject")
+    scheduler.add(running.id)
+    threading.Timer(0.02, scheduler.add, args=(added.id,)).start()
+
+    scheduler.run()
+
+    # sent before those of the running job are all sent
+    assert writer.sent.index("otherproject") < 10
+    assert running.status == added.status == JobStatus.DONE
+
+
+def test_failed_job_does_not_stop_others(make_job_manager):
+    writer = RecordingWriter(failing=("project",))
+    job_manager = make_job_manager(writer, n_threads=2)
+    scheduler = JobScheduler(job_manager)
+    failed = add_job(job_manager, "project")
+    other = add_job(job_manager, "otherproject")
+    scheduler.add(failed.id)
+    scheduler.add(other.id)
+
+    scheduler.run()
+
+    assert failed.status == JobStatus.PARSED
+    assert failed.error == JobError.TRANSFER_ERROR
+    assert other.status == JobStatus.DONE
+    assert other.error == JobError.NONE
+
+
+def test_metrics(make_job_manager):
+    metrics = []
+
+    class MetricsWriter(RecordingWriter):
+        def __call__(self, *args, **kwargs):
+            metrics.append(scheduler.metrics()[str(job.id)])
+            super().__call__(*args, **kwargs)
+
+    job_manager = make_job_manager(MetricsWriter())
+    scheduler = JobScheduler(job_manager)
+    job = add_job(job_manager, "project", priority=2, max_transfers=5)
+    scheduler.add(job.id)
+
+    scheduler.run()
+
+    assert [m["num_done_items"] for m in metrics] == list(range(10))
+    assert metrics[-1]["priority"] == 2
+    assert metrics[-1]["max_transfers"] == 5
+    assert metrics[-1]["in_flight"] == 1
+    assert scheduler.metrics() == {}
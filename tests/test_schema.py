@@ -0,0 +1,107 @@
+import re
+
+from forwarding_service.enum_types import ItemStatus
+from forwarding_service.models import Item
+from forwarding_service.query import ItemQueryArgs, Query
+from forwarding_service.schema import add_missing_columns, add_missing_indexes
+from sqlalchemy import event, inspect
+from sqlmodel import SQLModel, create_engine
+
+
+def test_add_missing_columns():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE item DROP COLUMN upload_id")
+
+    add_missing_columns(engine)
+
+    columns = [c["name"] for c in inspect(engine).get_columns("item")]
+    assert "upload_id" in columns
+
+
+def test_progress_counters_added_to_existing_database(tmp_path):
+    from forwarding_service import make_session
+    from forwarding_service.database import dispose_engines
+    from forwarding_service.enum_types import ItemStatus
+    from forwarding_service.models import Item, Job
+
+    db_url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    session = make_session(db_url)
+    job = Job(source="file:///data/", destination="s3://bucket/", regexp=".*")
+    session.add(job)
+    session.commit()
+    job_id = job.id
+    for status in [ItemStatus.TRANSFERRED, ItemStatus.PENDING]:
+        session.add(
+            Item(
+                in_uri="file:///data/file",
+                out_uri="s3://bucket/file",
+                size=10,
+                status=status,
+                job_id=job_id,
+            )
+        )
+    session.commit()
+    # as created by a version without counters, nor schema_version
+    with session.get_bind().begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE job DROP COLUMN num_done_items")
+        connection.exec_driver_sql("DROP TABLE schema_version")
+    session.close()
+    dispose_engines()
+
+    job = make_session(db_url).get(Job, job_id)
+    assert job.num_done_items == 1
+    assert job.num_done_bytes == 10
+    assert job.num_bytes == 20
+
+
+def test_add_missing_indexes():
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_item_job_id_status_size")
+
+    assert add_missing_indexes(engine) == ["ix_item_job_id_status_size"]
+
+    indexes = [i["name"] for i in inspect(engine).get_indexes("item")]
+    assert "ix_item_job_id_status_size" in indexes
+
+
+def test_hot_queries_use_indexes(engine, session, job_manager):
+    """No query of a job's lifecycle reads a whole table"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().startswith(
+            ("SELECT", "UPDATE", "DELETE")
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        job_manager.parse_chunk_size = 3
+        job = job_manager.init(
+            "file:///root/path/project/", "s3://bucket/project/"
+        )
+        job_manager.parse_and_commit_items(job)
+        job_manager.run(job)
+        Query(session, Item).get(
+            ItemQueryArgs(job_id=job.id, status=ItemStatus.TRANSFERRED)
+        )
+        job_manager.session.delete(job)
+        job_manager.session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    full_scans = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            for *_, detail in plan:
+                if re.match(r"SCAN (job|item|part)\b", detail):
+                    full_scans.append((detail, statement))
+
+    assert full_scans == []
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from forwarding_service.database import create_db_engine
+from forwarding_service.enum_types import JobStatus
+from forwarding_service.job_manager import JobManager
+from forwarding_service.models import Job
+from forwarding_service.server import JobServer, submit
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # sessions of the runner and of requests are used at once
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'server.db'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    yield str(tmp_path / "server.sock")
+
+
+@pytest.fixture
+def start_server(engine, socket_path):
+    servers = []
+
+    def start():
+        job_manager = JobManager(
+            session=Session(engine),
+            transfer_agent=TransferAgent(MockReader(), MockWriter()),
+        )
+        server = JobServer(job_manager, socket_path)
+        server.start()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def wait_for_status(engine, job_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    with Session(engine) as session:
+        while True:
+            job = session.get(Job, uuid.UUID(job_id))
+            if job.status == status and job.queued_at is None:
+                return job
+            assert time.monotonic() < deadline, f"job is {job.status.name}"
+            time.sleep(0.01)
+            session.expire_all()
+
+
+def test_submit_run(engine, socket_path, start_server):
+    start_server()
+
+    reply = submit(
+        {
+            "command": "run",
+            "source": "file:///root/path/project/",
+            "destination": "s3://bucket/project/",
+        },
+        socket_path,
+    )
+
+    job = wait_for_status(engine, reply["job_id"], JobStatus.DONE)
+    assert job.num_done_items == job.num_items == 10
+
+
+def test_jobs_run_at_once(engine, socket_path, start_server):
+    start_server()
+
+    job_ids = [
+        submit(
+            {
+                "command": "run",
+                "source": f"file:///root/path/{project}/",
+                "destination": f"s3://bucket/{project}/",
+                "priority": priority,
+                "max_transfers": 2,
+            },
+            socket_path,
+        )["job_id"]
+        for project, priority in [("project", 3), ("otherproject", 1)]
+    ]
+
+    jobs = [wait_for_status(engine, id, JobStatus.DONE) for id in job_ids]
+    assert [job.priority for job in jobs] == [3, 1]
+    assert all(job.max_transfers == 2 for job in jobs)
+
+
+def test_resume_with_priority(engine, socket_path, start_server):
+    start_server()
+    request = {
+        "command": "run",
+        "source": "file:///root/path/project/",
+        "destination": "s3://bucket/project/",
+    }
+    job_id = submit(request, socket_path)["job_id"]
+    wait_for_status(engine, job_id, JobStatus.DONE)
+
+    request = {"command": "resume", "id": job_id, "priority": 2}
+    assert submit(request, socket_path) == {"job_id": job_id}
+
+    job = wait_for_status(engine, job_id, JobStatus.DONE)
+    assert job.priority == 2
+    assert job.max_transfers is None
+    request["priority"] = 0
+    assert "priority" in submit(request, socket_path)["error"]
+
+
+def test_submit_errors(socket_path, start_server):
+    start_server()
+    request = {
+        "command": "run",
+        "source": "file:///root/path/project/",
+        "destination": "s3://bucket/project/",
+    }
+
+    assert "job_id" in submit(request, socket_path)
+    assert "duplicate" in submit(request, socket_path)["error"]
+    missing = str(uuid.uuid4())
+    reply = submit({"command": "resume", "id": missing}, socket_path)
+    assert reply == {"error": f"{missing} not found"}
+
+
+def test_submit_without_server(socket_path):
+    assert submit({"command": "resume", "id": "0"}, socket_path) is None
+
+
+def test_queued_jobs_run_on_restart(engine, start_server):
+    with Session(engine) as session:
+        job = Job(
+            source="file:///root/path/project/",
+            destination="s3://bucket/project/",
+            regexp=".*",
+            queued_at=datetime.now(),
+        )
+        session.add(job)
+        session.commit()
+        job_id = str(job.id)
+
+    start_server()
+
+    job = wait_for_status(engine, job_id, JobStatus.DONE)
+    assert job.num_done_items == 10
+
+
+def test_single_server_per_socket(socket_path, start_server):
+    start_server()
+
+    with pytest.raises(OSError):
+        start_server()
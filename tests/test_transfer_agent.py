@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+from forwarding_service.commands import Command
+from forwarding_service.transfer_agent import TransferAgent
+
+from .conftest import MockReader, MockWriter, RecordCommand, make_transactions
+
+
+class FailingCommand(Command):
+    def execute(self, payload):
+        if payload.item_id == "3":
+            raise ValueError("failed command")
+
+
+class SlowWriter(MockWriter):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def __call__(self, stream, *args, **kwargs):
+        time.sleep(0.01)
+        with self.lock:
+            self.count += 1
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_checkpoint_every(n_threads):
+    command = RecordCommand()
+    agent = TransferAgent(
+        MockReader(),
+        MockWriter(),
+        post_batch_commands=[command],
+        n_threads=n_threads,
+        checkpoint_every=10,
+    )
+    transactions = make_transactions(25)
+    agent.run(transactions)
+
+    batches = [len(batch) for batch in command.payloads]
+    assert all(t.success for t in transactions)
+    assert sum(batches) == 25
+    assert len(batches) >= 2
+    if n_threads == 1:
+        assert batches == [10, 10, 5]
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_failing_command_ends_run(n_threads):
+    command = RecordCommand()
+    agent = TransferAgent(
+        MockReader(),
+        MockWriter(),
+        post_transaction_commands=[FailingCommand()],
+        post_batch_commands=[command],
+        n_threads=n_threads,
+    )
+    with pytest.raises(ValueError):
+        agent.run(make_transactions(25))
+
+    # transfers in flight were checkpointed
+    assert sum(len(batch) for batch in command.payloads) >= 4
+
+
+def test_transactions_are_fed_lazily():
+    writer = SlowWriter()
+    agent = TransferAgent(MockReader(), writer, n_threads=2)
+    backlog = []
+
+    def transactions():
+        for t in make_transactions(30):
+            backlog.append(len(backlog) - writer.count)
+            yield t
+
+    agent.run(transactions())
+
+    assert writer.count == 30
+    assert max(backlog) <= agent.max_in_flight
+
+
+def test_pool_is_kept_across_runs():
+    agent = TransferAgent(MockReader(), MockWriter(), n_threads=2)
+    agent.run(make_transactions(5))
+    pool = agent._pool
+    agent.run(make_transactions(5))
+
+    assert agent._pool is pool
+    agent.close()